@@ -0,0 +1,378 @@
+"""
+Atomic, transactional file writes shared by generate_rules.py and extract_images.py:
+1. write_text() / write_bytes() write a temp file next to the target and
+   rename it over the target once it is fsynced, so a crash or Ctrl+C
+   leaves either the old file or the new one - never a truncated one
+2. Inside `with transaction(journal_file):` writes, renames and deletes
+   are only staged (reads of a staged path go through resolve()). On
+   success every staged file is fsynced, renamed into place and each
+   touched directory fsynced once; on any exception, Ctrl+C included,
+   the renames are undone and the staged files discarded
+3. Each step is journaled before it happens; the next transaction on the
+   same journal rolls an interrupted one forward (if it got as far as
+   committing) or back
+4. Temp files another process will write (image encodes) are reserve()d
+   up front; any that were never place()d are removed on rollback, on
+   recovery and by discard_reserved()
+
+Outside a transaction every call takes effect immediately (still atomic
+per file).
+"""
+import os
+import json
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Transactions currently open in this process, innermost last
+_active = []
+_active_lock = threading.Lock()
+
+_temp_counter = itertools.count()
+
+# Temps reserved outside a transaction and not yet placed
+_loose_reserved = set()
+
+def temp_path(path: str) -> str:
+    """A unique hidden temp file next to path (same directory, so rename is atomic)."""
+    directory, name = os.path.split(os.fspath(path))
+    return os.path.join(directory, f".{name}.{os.getpid()}-{next(_temp_counter)}.tmp")
+
+def _fsync_file(path: str) -> None:
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+def fsync_directories(directories) -> None:
+    """fsync each directory once so renames and deletes in it are durable."""
+    for directory in dict.fromkeys(directories):
+        try:
+            fd = os.open(directory or '.', os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
+            # Not supported for directories on every platform (e.g. Windows)
+            pass
+        finally:
+            os.close(fd)
+
+def _parent(path: str) -> str:
+    return os.path.dirname(os.path.abspath(path))
+
+class Transaction:
+    """
+    A batch of file changes that is applied completely or not at all.
+
+    Use through transaction(); the module-level helpers route to the
+    innermost open transaction. Safe to share between threads.
+    """
+
+    def __init__(self, journal_file: Optional[str] = None):
+        self.journal_file = journal_file
+        self._lock = threading.RLock()
+        # Absolute target path -> staged temp file
+        self._staged: Dict[str, str] = {}
+        # Renames already done on disk, in order
+        self._renames: List[Tuple[str, str]] = []
+        # Files to delete on commit
+        self._deletes: List[str] = []
+        # Temps other code will write; removed unless adopted by stage_file
+        self._reserved = set()
+        self._journal = None
+        if journal_file:
+            # A fresh output root (batch mode) may not exist yet
+            os.makedirs(os.path.dirname(os.path.abspath(journal_file)), exist_ok=True)
+            self._journal = open(journal_file, 'w', encoding='utf-8')
+
+    def _log(self, op: str, **fields) -> None:
+        """Append one journal record and flush it to the OS."""
+        if self._journal is not None:
+            self._journal.write(json.dumps({'op': op, **fields}) + '\n')
+            self._journal.flush()
+
+    def write_bytes(self, path: str, data: bytes) -> None:
+        """Stage new contents for path."""
+        temp = temp_path(path)
+        with self._lock:
+            self._log('stage', path=os.path.abspath(path), temp=temp)
+        with open(temp, 'wb') as f:
+            f.write(data)
+        self.stage_file(temp, path, logged=True)
+
+    def reserve(self, temps) -> None:
+        """Journal temp files that are about to be written, before they exist."""
+        temps = list(temps)
+        with self._lock:
+            self._log('reserve', temps=temps)
+            self._reserved.update(temps)
+
+    def stage_file(self, temp: str, path: str, logged: bool = False) -> None:
+        """Adopt an already written temp file as the new contents of path."""
+        key = os.path.abspath(path)
+        with self._lock:
+            if not logged:
+                self._log('stage', path=key, temp=temp)
+            self._reserved.discard(temp)
+            previous = self._staged.get(key)
+            self._staged[key] = temp
+            if key in self._deletes:
+                self._deletes.remove(key)
+        if previous is not None and previous != temp:
+            os.remove(previous)
+
+    def rename(self, src: str, dst: str) -> None:
+        """Rename now; undone if the transaction rolls back."""
+        src, dst = os.path.abspath(src), os.path.abspath(dst)
+        with self._lock:
+            self._log('rename', src=src, dst=dst)
+            os.rename(src, dst)
+            self._renames.append((src, dst))
+
+    def remove(self, path: str) -> None:
+        """Delete path when the transaction commits."""
+        with self._lock:
+            key = os.path.abspath(path)
+            self._log('delete', path=key)
+            self._deletes.append(key)
+
+    def resolve(self, path: str) -> str:
+        """The file currently holding path's contents (its staged temp, if any)."""
+        with self._lock:
+            return self._staged.get(os.path.abspath(path), path)
+
+    def exists(self, path: str) -> bool:
+        """Whether path will exist once the transaction commits."""
+        key = os.path.abspath(path)
+        with self._lock:
+            if key in self._staged:
+                return True
+            if key in self._deletes:
+                return False
+        return os.path.exists(path)
+
+    def commit(self) -> None:
+        """Make every staged change durable and visible."""
+        with self._lock:
+            for temp in self._staged.values():
+                _fsync_file(temp)
+            if self._journal is not None:
+                self._log('commit')
+                os.fsync(self._journal.fileno())
+            for path, temp in self._staged.items():
+                os.replace(temp, path)
+            for path in self._deletes:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            _remove_temps(self._reserved)
+            fsync_directories(
+                [_parent(path) for path in self._staged]
+                + [_parent(path) for path in self._deletes]
+                + [_parent(path) for rename in self._renames for path in rename]
+            )
+            self._finish()
+
+    def rollback(self) -> None:
+        """Discard staged files and undo renames, newest first."""
+        with self._lock:
+            _remove_temps(self._staged.values())
+            _remove_temps(self._reserved)
+            for src, dst in reversed(self._renames):
+                if os.path.exists(dst) and not os.path.exists(src):
+                    os.rename(dst, src)
+            fsync_directories([_parent(path) for rename in self._renames for path in rename])
+            self._finish()
+
+    def _finish(self) -> None:
+        self._staged, self._renames, self._deletes, self._reserved = {}, [], [], set()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+            os.remove(self.journal_file)
+
+def _remove_temps(temps) -> None:
+    for temp in list(temps):
+        try:
+            os.remove(temp)
+        except FileNotFoundError:
+            pass
+
+def recover(journal_file: str) -> Optional[str]:
+    """
+    Finish or undo a transaction that was interrupted by a crash.
+
+    Args:
+        journal_file: Journal the interrupted transaction wrote
+
+    Returns:
+        'committed' if it was rolled forward, 'rolled back' if it was
+        undone, None if there was nothing to recover
+    """
+    try:
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return None
+
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # Torn final line from a crash mid-write
+            break
+
+    committed = any(record['op'] == 'commit' for record in records)
+    staged = {}
+    for record in records:
+        if record['op'] == 'stage':
+            staged[record['path']] = record['temp']
+
+    if committed:
+        for path, temp in staged.items():
+            if os.path.exists(temp):
+                os.replace(temp, path)
+        for record in records:
+            if record['op'] == 'delete' and os.path.exists(record['path']):
+                os.remove(record['path'])
+    else:
+        for record in records:
+            if record['op'] == 'stage' and os.path.exists(record['temp']):
+                os.remove(record['temp'])
+        for record in reversed(records):
+            if record['op'] == 'rename' and os.path.exists(record['dst']) and not os.path.exists(record['src']):
+                os.rename(record['dst'], record['src'])
+    # Whatever reserved temp is still there was never renamed into place
+    _remove_temps(temp for record in records if record['op'] == 'reserve' for temp in record['temps'])
+    fsync_directories(_parent(path) for path in staged)
+    os.remove(journal_file)
+    return 'committed' if committed else 'rolled back'
+
+@contextmanager
+def transaction(journal_file: Optional[str] = None):
+    """
+    Group every write made through this module into one transaction.
+
+    A leftover journal from an interrupted run is recovered first. Inside
+    an already open transaction this simply joins it.
+
+    Args:
+        journal_file: Where to journal the transaction (None = not crash-recoverable)
+
+    Yields:
+        The Transaction
+    """
+    with _active_lock:
+        outer = _active[-1] if _active else None
+    if outer is not None:
+        yield outer
+        return
+
+    if journal_file:
+        outcome = recover(journal_file)
+        if outcome:
+            print(f"↩️  Recovered an interrupted write transaction ({outcome}) from {journal_file}")
+
+    txn = Transaction(journal_file)
+    with _active_lock:
+        _active.append(txn)
+    try:
+        yield txn
+    except BaseException:
+        txn.rollback()
+        raise
+    else:
+        txn.commit()
+    finally:
+        with _active_lock:
+            _active.remove(txn)
+
+def current() -> Optional[Transaction]:
+    """The innermost open transaction, if any."""
+    with _active_lock:
+        return _active[-1] if _active else None
+
+def write_bytes(path: str, data: bytes) -> None:
+    """Atomically replace path's contents (staged if a transaction is open)."""
+    txn = current()
+    if txn is not None:
+        txn.write_bytes(path, data)
+        return
+    temp = temp_path(path)
+    try:
+        with open(temp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    fsync_directories([_parent(path)])
+
+def write_text(path: str, content: str) -> None:
+    """write_bytes for UTF-8 text."""
+    write_bytes(path, content.encode('utf-8'))
+
+def reserve(temps) -> None:
+    """
+    Register temp files that another process is about to write.
+
+    Inside a transaction they are journaled and removed on rollback or
+    recovery unless placed; outside one, discard_reserved() removes them.
+    """
+    txn = current()
+    if txn is not None:
+        txn.reserve(temps)
+        return
+    with _active_lock:
+        _loose_reserved.update(temps)
+
+def discard_reserved() -> None:
+    """Remove temps reserved outside a transaction that were never placed."""
+    with _active_lock:
+        temps = list(_loose_reserved)
+        _loose_reserved.clear()
+    _remove_temps(temps)
+
+def place(temp: str, path: str) -> None:
+    """Move an already written temp file to path (staged if a transaction is open)."""
+    txn = current()
+    if txn is not None:
+        txn.stage_file(temp, path)
+        return
+    with _active_lock:
+        _loose_reserved.discard(temp)
+    _fsync_file(temp)
+    os.replace(temp, path)
+    fsync_directories([_parent(path)])
+
+def rename(src: str, dst: str) -> None:
+    """os.rename, undone if the open transaction rolls back."""
+    txn = current()
+    if txn is not None:
+        txn.rename(src, dst)
+    else:
+        os.rename(src, dst)
+
+def remove(path: str) -> None:
+    """os.remove, deferred to commit if a transaction is open."""
+    txn = current()
+    if txn is not None:
+        txn.remove(path)
+    else:
+        os.remove(path)
+
+def resolve(path):
+    """Where to read path's current contents (its staged temp inside a transaction)."""
+    txn = current()
+    return txn.resolve(path) if txn is not None else path
+
+def exists(path) -> bool:
+    """os.path.exists as seen after the open transaction commits."""
+    txn = current()
+    return txn.exists(path) if txn is not None else os.path.exists(path)
@@ -0,0 +1,436 @@
+"""
+Benchmarks for generate_rules.py and extract_images.py:
+
+    python benchmark.py run [--preset small|medium|large] [-o FILE]
+    python benchmark.py compare OLD.json NEW.json
+    python benchmark.py escape [--repeat N] [--scale N]
+
+run: builds synthetic inputs in a temporary directory - a business.yaml
+with N services, locations and blog topics, a template set with many
+placeholders, an image tree of JPEG/PNG/GIF files and a source tree full
+of image references - then times every stage (YAML load, template compile
+and render, each generate_* function, discovery, conversion, reference
+rewrite) and writes the results to .benchmarks/<commit>.json
+
+compare: prints the per-stage change between two result files
+
+escape: times the &apos; escaping of .mdc output on the rendered
+general-coding-rules template (the largest one), repeated --scale times
+to show how the cost grows, against the previous protect/restore approach
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+
+import generate_rules
+
+ESCAPE_TEMPLATE = os.path.join(generate_rules.templates_folder, "general-coding-rules.mdc.template")
+
+# Bump whenever the layout of the results file changes
+RESULTS_VERSION = 1
+
+RESULTS_DIR = '.benchmarks'
+
+PRESETS = {
+    'small': {'services': 10, 'locations': 20, 'topics': 20, 'templates': 10, 'placeholders': 100,
+              'images': 24, 'image_size': 640, 'sources': 200, 'refs': 5},
+    'medium': {'services': 40, 'locations': 100, 'topics': 80, 'templates': 40, 'placeholders': 400,
+               'images': 120, 'image_size': 1280, 'sources': 1000, 'refs': 10},
+    'large': {'services': 150, 'locations': 500, 'topics': 300, 'templates': 100, 'placeholders': 1000,
+              'images': 400, 'image_size': 2048, 'sources': 5000, 'refs': 20},
+}
+
+# Placeholders the synthetic templates draw from: plain keys, nested keys,
+# derived placeholders and arrays, so every resolver path is exercised
+TEMPLATE_PLACEHOLDERS = [
+    'BUSINESS_NAME', 'PRIMARY_KEYWORD', 'WEBSITE_URL', 'CTA_TEXT', 'TAGLINE',
+    'CONTACT.PHONE', 'CONTACT.EMAIL', 'CONTACT.CITY', 'META.title',
+    'LOCATIONS_MD', 'SERVICES_MD', 'SERVICES_URLS_MD', 'BLOG_LINKS_MD', 'CONTACT_MD',
+    'LOCATIONS_ARRAY', 'SERVICES_ARRAY', 'SOCIAL_PROFILES_ARRAY', 'AREA_SERVED',
+    'EXAMPLE_1', 'EXAMPLE_2',
+]
+
+# Template prose with apostrophes outside and inside protected spans
+TEMPLATE_PROSE = [
+    "It's our team's job to keep the site's rules consistent.",
+    "Use <Link href='/contact/'>the contact page</Link> for calls to action.",
+    "Schema values look like {\"@type\": 'LocalBusiness'} in JSON-LD.",
+    "Lists such as ['one', 'two'] stay untouched.",
+    "Don't repeat the primary keyword more than twice per section.",
+]
+
+# ------------------------------------------------------------------------
+# Synthetic inputs
+# ------------------------------------------------------------------------
+
+def make_business_data(services: int, locations: int, topics: int) -> dict:
+    """Business data shaped like business.yaml with the given list sizes"""
+    service_entries = [
+        {
+            'NAME': f"Service {i}",
+            'URL': f"/service-{i}/",
+            'SUB_SERVICES': [{'NAME': f"Service {i}.{j}", 'URL': f"/service-{i}/sub-{j}/"} for j in range(3)],
+        }
+        for i in range(services)
+    ]
+    location_entries = [{'CITY': f"City {i}", 'STATE': f"S{i % 50}"} for i in range(locations)]
+    return {
+        'BUSINESS_NAME': "Benchmark Services",
+        'WEBSITE_URL': "https://example.com",
+        'TONE': "Professional",
+        'LOGO_URL': "/logo.webp",
+        'TAGLINE': "Synthetic data for benchmarks",
+        'PRIMARY_KEYWORD': "Benchmarking",
+        'CTA_TEXT': "Call us today!",
+        'CATEGORIES': {'PRIMARY': "Service Business", 'SECONDARY': [f"Category {i}" for i in range(5)]},
+        'SERVICES': service_entries,
+        'CORE_SERVICES': [entry['NAME'] for entry in service_entries],
+        'CORE_SERVICES_URLS': [entry['URL'] for entry in service_entries],
+        'ALL_SERVICES': [sub['NAME'] for entry in service_entries for sub in entry['SUB_SERVICES']],
+        'LOCATIONS': location_entries,
+        'LOCATIONS_ARRAY': [f"{loc['CITY']}, {loc['STATE']}" for loc in location_entries],
+        'BLOG_TOPICS': [f"Topic {i}, tips & tricks" for i in range(topics)],
+        'EXAMPLES': ["Example one", "Example two"],
+        'CONTACT': {'PHONE': "555-123-4567", 'EMAIL': "info@example.com", 'CITY': "City 0", 'STATE': "S0"},
+        'HOURS': {day: "08:00 - 17:00" for day in ('MONDAY', 'TUESDAY', 'WEDNESDAY', 'THURSDAY', 'FRIDAY', 'SATURDAY')},
+        'GOOGLE_MAPS': {'LATITUDE': "42.0", 'LONGITUDE': "21.0"},
+        'SOCIAL_MEDIA': {platform: {'URL': f"https://{platform.lower()}.com/example"} for platform in ('FACEBOOK', 'TWITTER', 'INSTAGRAM')},
+        'META': {'title': "Benchmark", 'description': "Synthetic business", 'keywords': "bench, mark"},
+    }
+
+def write_business_yaml(path: str, data: dict) -> None:
+    import yaml
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(data, f, allow_unicode=True, sort_keys=False)
+
+def make_templates(directory: str, count: int, placeholders: int) -> list:
+    """Write `count` .mdc templates with `placeholders` placeholders each"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(count)
+    paths = []
+    for i in range(count):
+        lines = [f"# Rule {i}\n"]
+        for j in range(placeholders):
+            lines.append(f"{TEMPLATE_PROSE[j % len(TEMPLATE_PROSE)]} {{{{{rng.choice(TEMPLATE_PLACEHOLDERS)}}}}}\n")
+        path = os.path.join(directory, f"rule-{i}.mdc.template")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("".join(lines))
+        paths.append(path)
+    return paths
+
+def make_image_tree(directory: str, count: int, size: int) -> list:
+    """Write `count` noisy gradient images, cycling JPEG, PNG and GIF, with
+    names that need sanitizing (spaces, capitals, parentheses)"""
+    from PIL import Image
+
+    os.makedirs(directory, exist_ok=True)
+    width, height = size, size * 3 // 4
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 48)
+    base = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    names = []
+    for i in range(count):
+        img = base.rotate(i * 7 % 360)
+        subdir = os.path.join(directory, f"Gallery {i % 4}")
+        os.makedirs(subdir, exist_ok=True)
+        kind = i % 3
+        if kind == 0:
+            name = f"Photo {i} (Final).jpg"
+            img.save(os.path.join(subdir, name), 'JPEG', quality=90)
+        elif kind == 1:
+            name = f"Diagram {i}.PNG"
+            img.save(os.path.join(subdir, name), 'PNG')
+        else:
+            name = f"Icon {i}.gif"
+            img.convert('P', palette=Image.Palette.ADAPTIVE).save(os.path.join(subdir, name), 'GIF')
+        names.append(name)
+    return names
+
+def make_source_tree(directory: str, files: int, refs: int, image_names: list) -> None:
+    """Write `files` components with `refs` image references each"""
+    rng = random.Random(files)
+    for i in range(files):
+        subdir = os.path.join(directory, 'components', f"group-{i % 20}")
+        os.makedirs(subdir, exist_ok=True)
+        lines = [f"export function Component{i}() {{\n  return (\n    <div>\n"]
+        for _ in range(refs):
+            lines.append(f'      <img src="/assets/images/{rng.choice(image_names)}" alt="" />\n')
+        lines.append("    </div>\n  );\n}\n")
+        with open(os.path.join(subdir, f"component-{i}.tsx"), 'w', encoding='utf-8') as f:
+            f.write("".join(lines))
+
+# ------------------------------------------------------------------------
+# Timing
+# ------------------------------------------------------------------------
+
+def time_stage(results: dict, name: str, func, repeat: int, setup=None, items=None) -> None:
+    """Run func `repeat` times (after setup, which is not timed) and record the times
+
+    func receives whatever setup returns (None without a setup). Output
+    printed by the stage is discarded.
+    """
+    runs = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func(state)
+            runs.append((time.perf_counter() - start) * 1000)
+    results[name] = {
+        'min_ms': round(min(runs), 3),
+        'median_ms': round(statistics.median(runs), 3),
+        'mean_ms': round(statistics.mean(runs), 3),
+        'runs_ms': [round(run, 3) for run in runs],
+        'items': items,
+    }
+    print(f"  {name:<36} {results[name]['median_ms']:>10.2f} ms")
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=generate_rules.script_dir,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _fresh_copy(source: str, target: str) -> str:
+    """Replace target with a copy of source and return target"""
+    shutil.rmtree(target, ignore_errors=True)
+    shutil.copytree(source, target)
+    return target
+
+def run_benchmarks(params: dict, repeat: int = 3, workers: int = 1, images: bool = True) -> dict:
+    """Build the synthetic inputs described by params and time every stage"""
+    import yaml_cache
+    import extract_images
+
+    stages = {}
+    workspace = tempfile.mkdtemp(prefix='benchmark-')
+    previous_dir = os.getcwd()
+    try:
+        # Generator inputs
+        business_path = os.path.join(workspace, 'business.yaml')
+        write_business_yaml(business_path, make_business_data(params['services'], params['locations'], params['topics']))
+        template_paths = make_templates(os.path.join(workspace, 'templates'), params['templates'], params['placeholders'])
+        output_root = os.path.join(workspace, 'site')
+
+        print("\n📄 Generator")
+        time_stage(stages, 'yaml_load', lambda _: yaml_cache.load_yaml(business_path, use_cache=False), repeat)
+        yaml_cache.load_yaml(business_path)
+        time_stage(stages, 'yaml_load_cached', lambda _: yaml_cache.load_yaml(business_path), repeat)
+
+        data = yaml_cache.load_yaml(business_path)
+        time_stage(stages, 'derived_placeholders',
+                   lambda _: generate_rules.new_placeholder_table(generate_rules.BusinessModel(data)), repeat)
+
+        def compile_all(_):
+            generate_rules._compiled_templates.clear()
+            for path in template_paths:
+                generate_rules.compile_template(path)
+        time_stage(stages, 'template_compile', compile_all, repeat, items=len(template_paths))
+
+        def render_all(_):
+            table = generate_rules.new_placeholder_table(generate_rules.BusinessModel(data))
+            for path in template_paths:
+                generate_rules.escape_apostrophes(generate_rules.render_template(generate_rules.compile_template(path), table))
+        time_stage(stages, 'template_render', render_all, repeat, items=len(template_paths))
+
+        # Each generator writes into a fresh output root, so every run writes
+        for generate in (generate_rules.generate_faqs, generate_rules.generate_portfolio,
+                         generate_rules.generate_services_json, generate_rules.generate_blog_posts,
+                         generate_rules.generate_business_config, generate_rules.generate_seo_config,
+                         generate_rules.generate_manifest_json):
+            time_stage(stages, generate.__name__,
+                       lambda _, generate=generate: generate(generate_rules.BusinessModel(data), output_root),
+                       repeat, setup=lambda: shutil.rmtree(output_root, ignore_errors=True))
+
+        # Image pipeline inputs: pristine trees, copied before every run
+        # that renames or rewrites files
+        if images and not extract_images.PIL_AVAILABLE:
+            print("\n⚠️  Pillow is not installed; skipping image stages")
+            images = False
+        if images:
+            pristine = os.path.join(workspace, 'pristine')
+            image_names = make_image_tree(os.path.join(pristine, 'public', 'assets', 'images'), params['images'], params['image_size'])
+            make_source_tree(pristine, params['sources'], params['refs'], image_names)
+            tree = os.path.join(workspace, 'tree')
+            _fresh_copy(pristine, tree)
+            os.chdir(tree)
+
+            print("\n🖼️  Images")
+            time_stage(stages, 'image_discovery', lambda _: extract_images.find_image_files(['public']), repeat, items=params['images'])
+            time_stage(stages, 'source_discovery', lambda _: extract_images.find_source_files('.'), repeat, items=params['sources'])
+
+            def reset_tree():
+                os.chdir(workspace)
+                _fresh_copy(pristine, tree)
+                os.chdir(tree)
+                return extract_images.find_image_files(['public'])
+            time_stage(stages, 'image_conversion',
+                       lambda files: extract_images.rename_and_convert_images(files, workers=workers),
+                       repeat, setup=reset_tree, items=params['images'])
+
+            os.chdir(workspace)
+            _fresh_copy(pristine, tree)
+            os.chdir(tree)
+            with contextlib.redirect_stdout(io.StringIO()):
+                mapping, _ = extract_images.rename_and_convert_images(extract_images.find_image_files(['public']), convert_to_webp=False)
+            renamed = os.path.join(workspace, 'renamed')
+            os.chdir(workspace)
+            shutil.copytree(tree, renamed)
+
+            def reset_sources():
+                os.chdir(workspace)
+                _fresh_copy(renamed, tree)
+                os.chdir(tree)
+                return extract_images.find_source_files('.')
+            time_stage(stages, 'reference_rewrite',
+                       lambda sources: extract_images.update_source_references(sources, mapping),
+                       repeat, setup=reset_sources, items=params['sources'] * params['refs'])
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    return {
+        'version': RESULTS_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeat': repeat,
+        'workers': workers,
+        'params': params,
+        'stages': stages,
+    }
+
+def compare_results(old: dict, new: dict, threshold: float = 0.10) -> int:
+    """Print per-stage median changes; returns the number of regressions beyond threshold"""
+    if old.get('params') != new.get('params'):
+        print("⚠️  The runs used different inputs; ratios are not like for like")
+    print(f"{'stage':<36} {'old':>10} {'new':>10} {'change':>8}")
+    regressions = 0
+    for name in sorted(set(old['stages']) | set(new['stages'])):
+        if name not in old['stages'] or name not in new['stages']:
+            print(f"{name:<36} {'only in ' + ('new' if name in new['stages'] else 'old'):>30}")
+            continue
+        before = old['stages'][name]['median_ms']
+        after = new['stages'][name]['median_ms']
+        change = (after - before) / before if before else 0.0
+        marker = ""
+        if change > threshold:
+            marker = " 🔺"
+            regressions += 1
+        elif change < -threshold:
+            marker = " ✅"
+        print(f"{name:<36} {before:>8.2f}ms {after:>8.2f}ms {change:>+7.0%}{marker}")
+    return regressions
+
+# ------------------------------------------------------------------------
+# &apos; escaping
+# ------------------------------------------------------------------------
+
+def _escape_with_markers(text):
+    """The previous implementation: protect spans with __PROTECTED_i__ markers,
+    escape, then restore each marker with its own replace() over the text"""
+    protected_content = []
+    def protect_and_replace(match):
+        protected_content.append(match.group(0))
+        return f'__PROTECTED_{len(protected_content)-1}__'
+    text = re.sub(r'<[^>]*>|{[^}]*}|\[[^\]]*\]', protect_and_replace, text)
+    text = text.replace("'", "&apos;")
+    for i, content in enumerate(protected_content):
+        text = text.replace(f'__PROTECTED_{i}__', content)
+    return text
+
+def best_of(func, arg, repeat):
+    """Best wall time of `repeat` calls, in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def bench_escape(repeat=20, scale=8):
+    """Compare both escapers on the rendered template at 1x and scale x its size"""
+    business = generate_rules.load_business_model()
+    tokens = generate_rules.compile_template(ESCAPE_TEMPLATE)
+    rendered = generate_rules.render_template(tokens, generate_rules.new_placeholder_table(business))
+
+    print(f"📄 {os.path.basename(ESCAPE_TEMPLATE)}: {len(rendered):,} chars, "
+          f"{len(generate_rules.PROTECTED_SPAN.findall(rendered))} protected spans\n")
+    print(f"{'size':>6}  {'protect/restore':>16}  {'single scan':>12}  {'speedup':>8}")
+    for factor in (1, scale):
+        text = rendered * factor
+        if generate_rules.escape_apostrophes(text) != _escape_with_markers(text):
+            print(f"❌ Outputs differ at {factor}x")
+            return 1
+        old_ms = best_of(_escape_with_markers, text, repeat)
+        new_ms = best_of(generate_rules.escape_apostrophes, text, repeat)
+        print(f"{factor:>5}x  {old_ms:>13.2f} ms  {new_ms:>9.2f} ms  {old_ms / new_ms:>7.1f}x")
+    return 0
+
+# ------------------------------------------------------------------------
+# Command line
+# ------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the generator and image pipelines.")
+    subcommands = parser.add_subparsers(dest="command", metavar="command", required=True)
+
+    run = subcommands.add_parser("run", help="Time every stage on synthetic inputs and save the results")
+    run.add_argument("--preset", choices=sorted(PRESETS), default="small", help="Input sizes (default: small)")
+    for key in PRESETS['small']:
+        run.add_argument(f"--{key.replace('_', '-')}", type=int, dest=key, help=f"Override the preset's {key.replace('_', ' ')}")
+    run.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (default: 3)")
+    run.add_argument("--workers", type=int, default=1, help="Conversion processes (default: 1)")
+    run.add_argument("--no-images", action="store_true", help="Only benchmark the generator")
+    run.add_argument("-o", "--output", help=f"Results file (default: {RESULTS_DIR}/<commit>.json)")
+
+    compare = subcommands.add_parser("compare", help="Compare two results files")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.10, help="Relative change reported as a regression (default: 0.10)")
+
+    escape = subcommands.add_parser("escape", help="&apos; escaping of rendered .mdc templates")
+    escape.add_argument("--repeat", type=int, default=20, help="Timed runs per measurement (best is reported)")
+    escape.add_argument("--scale", type=int, default=8, help="Also time the text repeated this many times")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        params = dict(PRESETS[args.preset])
+        params.update({key: getattr(args, key) for key in params if getattr(args, key) is not None})
+        print(f"⏱️  Benchmark ({args.preset}): {', '.join(f'{key}={value}' for key, value in params.items())}")
+        results = run_benchmarks(params, args.repeat, args.workers, not args.no_images)
+        output = args.output or os.path.join(generate_rules.script_dir, RESULTS_DIR, f"{(results['commit'] or 'results')[:12]}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {output}")
+
+    elif args.command == "compare":
+        with open(args.old, encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.new, encoding='utf-8') as f:
+            new = json.load(f)
+        if compare_results(old, new, args.threshold):
+            return 1
+
+    elif args.command == "escape":
+        return bench_escape(args.repeat, args.scale)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
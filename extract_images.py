@@ -4,13 +4,58 @@ Image Processing Script:
 2. Sanitize filenames (remove spaces, special characters)
 3. Search and replace references in source code
 4. Rename image files
-5. Convert to WebP format for better compression
+5. Convert to WebP (or AVIF) for better compression
 """
+import io
 import os
 import re
+import sys
+import argparse
+import math
+import json
+import hashlib
+import queue
+import shutil
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from PIL import Image
-from typing import List, Dict, Tuple
+from importlib.util import find_spec
+from typing import List, Dict, Tuple, Optional, Iterator, Iterable, Callable, Set
+
+import atomic_io
+import instrumentation
+from instrumentation import stage, add_bytes, hot_path
+
+# Pillow is only imported once an image is actually decoded (see _require_pil),
+# so importing this module for discovery or reference rewriting stays cheap
+PIL_AVAILABLE = find_spec('PIL') is not None
+Image = ImageChops = ImageStat = None
+
+def _require_pil() -> None:
+    """Import Pillow into the module namespace on first use."""
+    global Image, ImageChops, ImageStat
+    if Image is None:
+        from PIL import Image, ImageChops, ImageStat
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+SOURCE_EXTENSIONS = ('.tsx', '.ts', '.jsx', '.js', '.json', '.css', '.scss', '.md')
+
+# Bump whenever the on-disk layout of the cache or the reference index changes
+CACHE_VERSION = 1
+REFERENCE_INDEX_VERSION = 2
+
+# Characters that end an image filename reference as it appears in source
+# code (quotes, path separators, tags, line breaks). Spaces, brackets and
+# the like stay in: real filenames such as "Job_1 (final).jpg" contain them
+_REFERENCE_DELIMITERS = r'\r\n"\'`/\\<>'
+_REFERENCE_DELIMITER = re.compile(f'[{_REFERENCE_DELIMITERS}]')
+# A run of non-delimiter bytes; the part up to its last image extension is
+# indexed. (Matching "run ending in an extension" directly would backtrack
+# quadratically on long extension-free runs such as minified code)
+_REFERENCE_RUN = re.compile(f'[^{_REFERENCE_DELIMITERS}]+'.encode())
+_IMAGE_EXTENSION = re.compile(rb'\.(?:jpe?g|png|gif)', re.IGNORECASE)
 
 def sanitize_filename(filename: str) -> str:
     """
@@ -44,40 +89,93 @@ def sanitize_filename(filename: str) -> str:
     # Return sanitized filename with lowercase extension
     return f"{name}{ext.lower()}"
 
-def find_image_files(directories: List[str]) -> List[Path]:
+@hot_path('discovery')
+def _scan_tree(root: str, skip_dir: Optional[Callable[[os.DirEntry], bool]] = None) -> Iterator[os.DirEntry]:
     """
-    Find all image files (jpg, jpeg, png, gif) in specified directories.
+    Yield every file below root, visiting each directory exactly once.
     
     Args:
-        directories: List of directory paths to search
+        root: Directory to walk
+        skip_dir: Optional predicate; directories for which it returns True
+            are not descended into
         
-    Returns:
-        List of Path objects for found images
+    Yields:
+        os.DirEntry objects for regular files
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            # Read the whole listing up front: callers may rename files in
+            # this directory while the generator is suspended
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError as e:
+            print(f"⚠️  Cannot read directory {directory}: {str(e)}")
+            continue
+        
+        for entry in entries:
+            if entry.is_dir():
+                if skip_dir is None or not skip_dir(entry):
+                    stack.append(entry.path)
+            elif entry.is_file():
+                yield entry
+
+def iter_image_files(directories: List[str]) -> Iterator[Path]:
     """
-    image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.JPG', '*.JPEG', '*.PNG', '*.GIF']
-    all_images = []
+    Lazily yield image files (jpg, jpeg, png, gif) in specified directories.
     
+    Directories nested inside another configured directory are already
+    covered by the outer walk and are not walked again.
+    
+    Args:
+        directories: List of directory paths to search
+        
+    Yields:
+        Path objects for found images, in walk order
+    """
+    roots = []
     for directory in directories:
-        dir_path = Path(directory)
-        if not dir_path.exists():
+        if not os.path.exists(directory):
             print(f"⚠️  Directory not found: {directory}")
             continue
-            
-        for ext in image_extensions:
-            all_images.extend(dir_path.glob(ext))
-            # Also search recursively
-            all_images.extend(dir_path.rglob(ext))
+        abs_path = os.path.abspath(directory)
+        if abs_path not in (root_abs for root_abs, _ in roots):
+            roots.append((abs_path, directory))
+    
+    # Prune roots that live inside another root
+    roots = [
+        (abs_path, directory) for abs_path, directory in roots
+        if not any(abs_path.startswith(other + os.sep) for other, _ in roots)
+    ]
     
-    # Remove duplicates
-    return list(set(all_images))
+    for _, directory in roots:
+        for entry in _scan_tree(directory):
+            if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                yield Path(entry.path)
+
+def find_image_files(directories: List[str]) -> List[Path]:
+    """
+    Find all image files (jpg, jpeg, png, gif) in specified directories.
+    
+    Args:
+        directories: List of directory paths to search
+        
+    Returns:
+        List of Path objects for found images
+    """
+    return sorted(iter_image_files(directories))
 
 def find_source_files(base_dir: str = '.', exclude_dirs: List[str] = None) -> List[Path]:
     """
     Find all source code files that might contain image references.
     
+    Excluded directories are pruned during the walk, so node_modules and
+    build output are never descended into.
+    
     Args:
         base_dir: Base directory to search
-        exclude_dirs: Directories to exclude from search
+        exclude_dirs: Directory names (or paths relative to base_dir) to exclude from search
         
     Returns:
         List of Path objects for source files
@@ -85,27 +183,88 @@ def find_source_files(base_dir: str = '.', exclude_dirs: List[str] = None) -> Li
     if exclude_dirs is None:
         exclude_dirs = ['node_modules', '.next', '.git', 'dist', 'build', 'out', 'public/assets/config']
     
-    source_extensions = ['*.tsx', '*.ts', '*.jsx', '*.js', '*.json', '*.css', '*.scss', '*.md']
-    source_files = []
+    excluded_names = {excluded for excluded in exclude_dirs if '/' not in excluded}
+    excluded_paths = {os.path.normpath(os.path.join(base_dir, excluded)) for excluded in exclude_dirs if '/' in excluded}
     
-    base_path = Path(base_dir)
+    def skip_dir(entry: os.DirEntry) -> bool:
+        return entry.name in excluded_names or os.path.normpath(entry.path) in excluded_paths
     
-    for ext in source_extensions:
-        for file_path in base_path.rglob(ext):
-            # Check if file is in excluded directory
-            if any(excluded in file_path.parts for excluded in exclude_dirs):
-                continue
-            source_files.append(file_path)
+    return [
+        Path(entry.path) for entry in _scan_tree(base_dir, skip_dir)
+        if os.path.splitext(entry.name)[1].lower() in SOURCE_EXTENSIONS
+    ]
+
+def _trie_pattern(node: dict) -> str:
+    """
+    Render a character trie as a regex fragment.
+    
+    Shared prefixes are matched once and a terminal node makes its children
+    optional (greedy), so the regex engine walks the trie at each position
+    and always takes the longest filename that matches there.
+    """
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch != '']
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    return f'(?:{body})?' if '' in node else body
+
+def _literal_matcher(literals) -> re.Pattern:
+    """Compile a set of literal strings into a single trie-shaped regex."""
+    trie = {}
+    for literal in literals:
+        node = trie
+        for ch in literal:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+    return re.compile(_trie_pattern(trie))
+
+@hot_path('references')
+def _final_name(filename_mapping: Dict[str, str], name: str) -> str:
+    """Follow a chain of renames from name to its last name (stops at a cycle)."""
+    seen = {name}
+    while name in filename_mapping and filename_mapping[name] not in seen:
+        name = filename_mapping[name]
+        seen.add(name)
+    return name
+
+def build_reference_matcher(filename_mapping: Dict[str, str]) -> Tuple[Optional[re.Pattern], Dict[str, str]]:
+    """
+    Compile every old filename (and its %20-encoded variant) into one matcher.
+    
+    The matcher is built once per run so each source file is scanned a single
+    time, however many images were renamed. Chained renames (a -> b, b -> c)
+    are composed first, so a reference to a ends up as c just as applying
+    the renames one after another would leave it.
+    
+    Args:
+        filename_mapping: Dictionary mapping old filenames to new filenames
+        
+    Returns:
+        Tuple of (compiled pattern or None if there is nothing to match,
+        dict mapping each matched text to its replacement)
+    """
+    replacements = {}
+    for old_name in filename_mapping:
+        new_name = _final_name(filename_mapping, old_name)
+        # Exact match and URL encoded spaces
+        for old_pattern in (old_name, old_name.replace(' ', '%20')):
+            if old_pattern:
+                replacements.setdefault(old_pattern, new_name)
     
-    return source_files
+    if not replacements:
+        return None, replacements
+    
+    return _literal_matcher(replacements), replacements
 
-def update_source_references(source_files: List[Path], filename_mapping: Dict[str, str]) -> Dict[str, int]:
+@hot_path('references')
+def update_source_references(source_files: List[Path], filename_mapping: Dict[str, str], modified_files: Optional[Set[Path]] = None) -> Dict[str, int]:
     """
     Update image references in source files.
     
     Args:
         source_files: List of source files to search
         filename_mapping: Dictionary mapping old filenames to new filenames
+        modified_files: Optional set that collects every file written
         
     Returns:
         Dictionary with statistics about replacements
@@ -115,35 +274,32 @@ def update_source_references(source_files: List[Path], filename_mapping: Dict[st
         'total_replacements': 0
     }
     
+    matcher, replacements = build_reference_matcher(filename_mapping)
+    if matcher is None:
+        return stats
+    
+    def substitute(match):
+        return replacements[match.group(0)]
+    
     for source_file in source_files:
         try:
-            with open(source_file, 'r', encoding='utf-8') as f:
+            with open(atomic_io.resolve(source_file), 'r', encoding='utf-8') as f:
+                add_bytes(read=os.fstat(f.fileno()).st_size)
                 content = f.read()
             
-            original_content = content
-            replacements_in_file = 0
+            # Replace every old filename in a single scan
+            new_content, replacements_in_file = matcher.subn(substitute, content)
             
-            # Replace each old filename with new filename
-            for old_name, new_name in filename_mapping.items():
-                # Create different patterns to match various ways images are referenced
-                patterns = [
-                    (old_name, new_name),  # Exact match
-                    (old_name.replace(' ', '%20'), new_name),  # URL encoded spaces
-                ]
-                
-                for old_pattern, new_pattern in patterns:
-                    if old_pattern in content:
-                        count = content.count(old_pattern)
-                        content = content.replace(old_pattern, new_pattern)
-                        replacements_in_file += count
-            
-            # Only write if content changed
-            if content != original_content:
-                with open(source_file, 'w', encoding='utf-8') as f:
-                    f.write(content)
+            # Only write if content changed (atomically: never a truncated source file)
+            if new_content != content:
+                encoded = new_content.encode('utf-8')
+                atomic_io.write_bytes(source_file, encoded)
+                add_bytes(written=len(encoded))
                 
                 stats['files_modified'] += 1
                 stats['total_replacements'] += replacements_in_file
+                if modified_files is not None:
+                    modified_files.add(source_file)
                 print(f"  ✓ Updated {replacements_in_file} reference(s) in: {source_file.relative_to('.')}")
                 
         except Exception as e:
@@ -151,103 +307,1331 @@ def update_source_references(source_files: List[Path], filename_mapping: Dict[st
     
     return stats
 
-def rename_and_convert_images(image_files: List[Path], quality: int = 85, convert_to_webp: bool = True, delete_original: bool = False) -> Tuple[Dict[str, str], Dict[str, int]]:
+def load_reference_index(index_file: str) -> Dict[str, dict]:
     """
-    Rename image files and optionally convert to WebP.
+    Load the image reference index (source path -> index entry).
+    
+    Each entry holds the file's size and mtime plus every image-like token
+    found in it, mapped to the byte offsets where the token starts.
     
     Args:
-        image_files: List of image files to process
+        index_file: Path to the JSON index
+        
+    Returns:
+        Dictionary of index entries (empty if the index is missing or unreadable)
+    """
+    try:
+        with open(index_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️  Ignoring unreadable reference index {index_file}: {str(e)}")
+        return {}
+    
+    if data.get('version') != REFERENCE_INDEX_VERSION:
+        return {}
+    return data.get('files', {})
+
+def save_reference_index(index: Dict[str, dict], index_file: str) -> None:
+    """
+    Write the image reference index.
+    
+    Args:
+        index: Dictionary of index entries
+        index_file: Path to the JSON index
+    """
+    atomic_io.write_text(index_file, json.dumps({'version': REFERENCE_INDEX_VERSION, 'files': index}, sort_keys=True))
+
+@hot_path('references')
+def refresh_reference_index(index: Dict[str, dict], source_files: List[Path], prune: bool = True) -> int:
+    """
+    Bring the index up to date with the given source files.
+    
+    Only files whose size or mtime changed since they were last indexed are
+    read again.
+    
+    Args:
+        index: Dictionary of index entries (updated in place)
+        source_files: Source files that should be indexed
+        prune: Whether to drop entries for files not in source_files
+        
+    Returns:
+        Number of files that were (re)indexed
+    """
+    seen = set()
+    reindexed = 0
+    
+    for source_file in source_files:
+        key = _cache_key(source_file)
+        seen.add(key)
+        try:
+            # A staged rewrite keeps its size and mtime when renamed into place
+            current = atomic_io.resolve(source_file)
+            size, mtime_ns = _stat_signature(current)
+            entry = index.get(key)
+            if entry and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+                continue
+            
+            with open(current, 'rb') as f:
+                data = f.read()
+        except OSError:
+            index.pop(key, None)
+            continue
+        
+        refs = {}
+        for match in _REFERENCE_RUN.finditer(data):
+            run = match.group(0)
+            end = None
+            for extension in _IMAGE_EXTENSION.finditer(run):
+                end = extension.end()
+            if end is not None:
+                refs.setdefault(run[:end].decode('utf-8', 'replace'), []).append(match.start())
+        index[key] = {'size': size, 'mtime_ns': mtime_ns, 'refs': refs}
+        reindexed += 1
+    
+    if prune:
+        for key in [key for key in index if key not in seen]:
+            del index[key]
+    
+    return reindexed
+
+def invert_reference_index(index: Dict[str, dict]) -> Dict[str, Dict[str, List[int]]]:
+    """
+    Build the inverted view of the index: image token -> {source path: byte offsets}.
+    
+    Args:
+        index: Dictionary of index entries
+        
+    Returns:
+        Dictionary mapping each referenced image token to the files and
+        offsets where it appears
+    """
+    inverted = {}
+    for key, entry in index.items():
+        for token, offsets in entry['refs'].items():
+            inverted.setdefault(token, {})[key] = offsets
+    return inverted
+
+@hot_path('references')
+def find_referencing_files(index: Dict[str, dict], filename_mapping: Dict[str, str]) -> List[Path]:
+    """
+    Find the indexed source files that may reference any old filename.
+    
+    Indexed tokens run from the last delimiter before an image extension,
+    so each old filename is matched by its literal run after its own last
+    delimiter - the whole name for anything that can sit in a path, spaces
+    and brackets included. The result is a superset of the files
+    update_source_references would modify.
+    
+    Args:
+        index: Up-to-date dictionary of index entries
+        filename_mapping: Dictionary mapping old filenames to new filenames
+        
+    Returns:
+        Sorted list of source files to rewrite
+    """
+    literals = set()
+    for old_name in filename_mapping:
+        for old_pattern in (old_name, old_name.replace(' ', '%20')):
+            literal = _REFERENCE_DELIMITER.split(old_pattern)[-1]
+            if literal:
+                literals.add(literal)
+    if not literals:
+        return []
+    
+    matcher = _literal_matcher(literals)
+    files = set()
+    for token, locations in invert_reference_index(index).items():
+        if matcher.search(token):
+            files.update(locations)
+    
+    return [Path(key) for key in sorted(files)]
+
+def convert_image_to_webp(source_path: Path, webp_path: Path, quality: int = 85) -> Tuple[int, int]:
+    """
+    Encode a single image as WebP.
+    
+    Args:
+        source_path: Image to convert
+        webp_path: Destination WebP file
         quality: WebP quality (1-100)
-        convert_to_webp: Whether to convert to WebP format
-        delete_original: Whether to delete original files after conversion
         
     Returns:
-        Tuple of (filename_mapping dict, stats dict)
+        Tuple of (original size in bytes, WebP size in bytes)
     """
-    filename_mapping = {}
-    stats = {
-        'renamed': 0,
-        'converted': 0,
-        'skipped': 0,
-        'failed': 0
+    result = _encode_image(source_path, webp_path, _encode_params(quality))
+    for temp, path in result['staged']:
+        atomic_io.place(temp, path)
+    return result['original_size'], result['output_size']
+
+def _encode_params(quality: int, variant_widths: Optional[List[int]] = None, formats: Optional[List[str]] = None, min_psnr: float = 40.0, target_ssim: Optional[float] = None, max_dimension: Optional[int] = None) -> dict:
+    """
+    Build the encode parameters for a run.
+    
+    The same dict is sent to the workers and stored in the conversion cache,
+    so any setting that changes the output bytes must live here.
+    """
+    formats = list(dict.fromkeys(formats or ['webp']))
+    unknown = [name for name in formats if name not in ENCODERS]
+    if unknown:
+        raise ValueError(f"Unknown image format(s): {', '.join(unknown)} (choose from {', '.join(ENCODERS)})")
+    
+    params = {'format': formats[0], 'quality': quality, 'method': 6}
+    if len(formats) > 1:
+        # Smallest wins: every format is tried, lossy ones must reach min_psnr
+        params['format'] = 'smallest'
+        params['formats'] = formats
+        params['min_psnr'] = min_psnr
+    if 'avif' in formats:
+        params['avif_speed'] = 6
+    if target_ssim:
+        # Per-image quality search between min_quality and quality
+        params['target_ssim'] = target_ssim
+        params['min_quality'] = min(30, quality)
+    if max_dimension:
+        params['max_dimension'] = max_dimension
+    if variant_widths:
+        # Largest first: each variant is scaled down from the previous one
+        params['widths'] = sorted(set(variant_widths), reverse=True)
+    return params
+
+def _encoder_names(params: dict) -> List[str]:
+    """Formats a run may produce, in preference order."""
+    return params.get('formats', [params['format']])
+
+def _output_candidates(output_path: Path, params: dict) -> List[Path]:
+    """Every path the encoder might write for output_path (one per file suffix)."""
+    suffixes = dict.fromkeys(ENCODERS[name][0] for name in _encoder_names(params))
+    return [output_path.with_suffix(suffix) for suffix in suffixes]
+
+def _variant_path(output_path: Path, width: int) -> Path:
+    """Return the path of a width variant, e.g. photo.webp -> photo-640w.webp."""
+    return output_path.with_name(f"{output_path.stem}-{width}w{output_path.suffix}")
+
+def _save_webp(img, target, params: dict) -> None:
+    """Write a decoded image as lossy WebP with the run's settings."""
+    if img.mode == 'RGBA':
+        img.save(target, 'WEBP', quality=params['quality'], method=params['method'], lossless=False)
+    else:
+        img.save(target, 'WEBP', quality=params['quality'], method=params['method'])
+
+def _save_webp_lossless(img, target, params: dict) -> None:
+    """Write a decoded image as lossless WebP (best for flat graphics and logos)."""
+    img.save(target, 'WEBP', lossless=True, quality=100, method=params['method'])
+
+def _save_avif(img, target, params: dict) -> None:
+    """Write a decoded image as AVIF."""
+    img.save(target, 'AVIF', quality=params['quality'], speed=params.get('avif_speed', 6))
+
+# Encoder backends: name -> (file suffix, save function, lossless)
+ENCODERS: Dict[str, Tuple[str, Callable, bool]] = {
+    'webp': ('.webp', _save_webp, False),
+    'webp-lossless': ('.webp', _save_webp_lossless, True),
+    'avif': ('.avif', _save_avif, False),
+}
+
+@hot_path('quality')
+def image_psnr(reference, candidate) -> float:
+    """
+    Peak signal-to-noise ratio (dB) between two same-sized images.
+    
+    Returns:
+        PSNR in dB (inf for identical images)
+    """
+    _require_pil()
+    if candidate.mode != reference.mode:
+        candidate = candidate.convert(reference.mode)
+    diff = ImageStat.Stat(ImageChops.difference(reference, candidate))
+    mse = sum(rms ** 2 for rms in diff.rms) / len(diff.rms)
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255 ** 2 / mse)
+
+_SQUARES = [value * value for value in range(256)]
+
+@hot_path('quality')
+def image_ssim(reference, candidate, block: int = 8) -> float:
+    """
+    Mean structural similarity (SSIM) of the luma channel, computed over
+    non-overlapping block x block windows.
+    
+    Pure Python, so it is meant for small proxies (see _quality_proxy).
+    
+    Returns:
+        SSIM in [-1, 1] (1.0 for identical images)
+    """
+    luma_a = reference.convert('L').tobytes()
+    luma_b = candidate.convert('L').tobytes()
+    width, height = reference.size
+    block = min(block, width, height)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    n = block * block
+    
+    total, windows = 0.0, 0
+    for top in range(0, height - block + 1, block):
+        for left in range(0, width - block + 1, block):
+            sum_a = sum_b = sum_aa = sum_bb = sum_ab = 0
+            for row in range(top * width + left, (top + block) * width + left, width):
+                a = luma_a[row:row + block]
+                b = luma_b[row:row + block]
+                sum_a += sum(a)
+                sum_b += sum(b)
+                sum_aa += sum(map(_SQUARES.__getitem__, a))
+                sum_bb += sum(map(_SQUARES.__getitem__, b))
+                sum_ab += sum(map(int.__mul__, a, b))
+            mean_a, mean_b = sum_a / n, sum_b / n
+            var_a = sum_aa / n - mean_a * mean_a
+            var_b = sum_bb / n - mean_b * mean_b
+            cov = sum_ab / n - mean_a * mean_b
+            total += ((2 * mean_a * mean_b + c1) * (2 * cov + c2)) / ((mean_a ** 2 + mean_b ** 2 + c1) * (var_a + var_b + c2))
+            windows += 1
+    
+    return total / windows if windows else 1.0
+
+# Longest side of the proxy used to search for a per-image quality
+_QUALITY_PROXY_SIZE = 256
+
+def _quality_proxy(img):
+    """Downscaled copy of img that trial encodes are scored on."""
+    proxy = img.copy()
+    proxy.thumbnail((_QUALITY_PROXY_SIZE, _QUALITY_PROXY_SIZE), Image.BOX)
+    return proxy
+
+@hot_path('encode')
+def _encode_bytes(img, name: str, params: dict) -> bytes:
+    """Encode img in memory with one backend."""
+    buffer = io.BytesIO()
+    ENCODERS[name][1](img, buffer, params)
+    return buffer.getvalue()
+
+@hot_path('encode')
+def _search_quality(img, name: str, params: dict) -> int:
+    """
+    Find the lowest quality at which a lossy encoder still reaches
+    params['target_ssim'], by binary search on a downscaled proxy.
+    
+    Args:
+        img: Decoded source image
+        name: Lossy encoder from ENCODERS
+        params: Encode parameters; quality is the upper bound of the search
+        
+    Returns:
+        Chosen quality (params['quality'] if even that misses the target)
+    """
+    proxy = _quality_proxy(img)
+    low, high = params['min_quality'], params['quality']
+    best = high
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode_bytes(proxy, name, dict(params, quality=quality))
+        with Image.open(io.BytesIO(data)) as decoded:
+            score = image_ssim(proxy, decoded)
+        if score >= params['target_ssim']:
+            best, high = quality, quality - 1
+        else:
+            low = quality + 1
+    return best
+
+def _tuned_params(img, name: str, params: dict) -> dict:
+    """Encode parameters for one image and format, with quality searched if enabled."""
+    if 'target_ssim' in params and not ENCODERS[name][2]:
+        return dict(params, quality=_search_quality(img, name, params))
+    return params
+
+@hot_path('encode')
+def _encode_candidate(img, name: str, params: dict) -> Tuple[str, bytes, float, dict]:
+    """Encode img in memory with one backend and score it against img."""
+    params = _tuned_params(img, name, params)
+    data = _encode_bytes(img, name, params)
+    if ENCODERS[name][2] or 'target_ssim' in params:
+        # Lossless, or already tuned to the perceptual target
+        return name, data, math.inf, params
+    with Image.open(io.BytesIO(data)) as decoded:
+        return name, data, image_psnr(img, decoded), params
+
+@hot_path('encode')
+def _pick_format(img, params: dict) -> Tuple[str, bytes, dict]:
+    """
+    Encode img in every enabled format (in parallel) and keep the smallest
+    output that reaches params['min_psnr']. If nothing does, the most
+    faithful candidate wins.
+    
+    Returns:
+        Tuple of (format name, encoded bytes, encode parameters used)
+    """
+    names = _encoder_names(params)
+    img.load()  # decode once up front; lazy loading is not thread-safe
+    # The codecs release the GIL while encoding, so threads overlap the work.
+    # Each thread gets its own copy: Image.save keeps per-call state on the image.
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        candidates = list(executor.map(lambda name: _encode_candidate(img.copy(), name, params), names))
+    
+    passing = [c for c in candidates if c[2] >= params['min_psnr']]
+    if passing:
+        name, data, _score, used = min(passing, key=lambda c: len(c[1]))
+    else:
+        name, data, _score, used = max(candidates, key=lambda c: c[2])
+    return name, data, used
+
+@hot_path('decode')
+def _open_scaled(source_path: Path, max_dimension: Optional[int] = None):
+    """
+    Open an image, shrinking it so neither side exceeds max_dimension.
+    
+    JPEGs are decoded in draft mode, letting libjpeg scale by 1/2, 1/4 or
+    1/8 while decoding, so a 24MP photo never exists at full size in
+    memory. Whatever is still more than twice too big is then shrunk by an
+    integer factor with reduce(), and a LANCZOS resize sets the final size.
+    
+    Args:
+        source_path: Image to open
+        max_dimension: Longest allowed side in pixels (None = full size)
+        
+    Returns:
+        PIL image (not yet loaded when no downscale is needed)
+    """
+    _require_pil()
+    img = Image.open(source_path)
+    if not max_dimension or max(img.size) <= max_dimension:
+        return img
+    
+    scale = max_dimension / max(img.size)
+    target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    if img.format == 'JPEG':
+        # Picks the largest DCT scale that still yields at least target
+        img.draft(None, target)
+    
+    factor = min(img.width // target[0], img.height // target[1]) // 2
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.size != target:
+        img = img.resize(target, Image.LANCZOS)
+    return img
+
+@hot_path('encode')
+def _encode_image(source_path: Path, output_path: Path, params: dict, temps: Optional[Dict[str, str]] = None) -> dict:
+    """
+    Decode, encode and write one image (plus any width variants).
+    
+    Kept at module level so it can be shipped to worker processes. Decoding,
+    encoding and writing stay in the same process so pixel buffers never
+    cross a process boundary. Variants reuse the single decode: each one is
+    resized from the previous, smaller-than-source rendition.
+    
+    When several formats are enabled, output_path only fixes the stem: the
+    suffix follows the format that wins (see _pick_format). With a target
+    SSIM, lossy formats use the quality found by _search_quality.
+    
+    Args:
+        source_path: Image to convert
+        output_path: Destination file
+        params: Encode parameters from _encode_params
+        temps: Temp file to write for each possible output path, as
+            reserved by the caller (see _reserve_temps); fresh temp names
+            are used when omitted
+        
+    Returns:
+        Dictionary with path, format, quality (None if lossless),
+        original_size, output_size, width, height, a list of written
+        variants ({'width', 'height', 'path', 'size'}) and the
+        (temp file, final path) pairs still to be placed
+    """
+    _require_pil()
+    original_size = os.path.getsize(source_path)
+    with stage('decode', 'image'):
+        img = _open_scaled(source_path, params.get('max_dimension'))
+        img.load()
+        add_bytes(read=original_size)
+        
+        # Handle different image modes while preserving transparency
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        elif img.mode == 'LA':
+            img = img.convert('RGBA')
+        elif img.mode not in ('RGB', 'RGBA', 'L'):
+            img = img.convert('RGB')
+    
+    # Everything is written to temp files next to its final path; the caller
+    # moves them into place (see atomic_io.place), so an interrupted encode
+    # never leaves a truncated output behind
+    staged = []
+    
+    def temp_for(path: Path) -> str:
+        temp = temps[str(path)] if temps else atomic_io.temp_path(path)
+        staged.append((temp, str(path)))
+        return temp
+    
+    try:
+        with stage('encode', 'image'):
+            # Encode in the configured format, or pick the smallest acceptable one
+            if 'formats' in params:
+                name, data, params = _pick_format(img, params)
+                output_path = Path(output_path).with_suffix(ENCODERS[name][0])
+                with open(temp_for(output_path), 'wb') as f:
+                    f.write(data)
+            else:
+                name = params['format']
+                params = _tuned_params(img, name, params)
+                output_path = Path(output_path).with_suffix(ENCODERS[name][0])
+                with open(temp_for(output_path), 'wb') as f:
+                    ENCODERS[name][1](img, f, params)
+            save = ENCODERS[name][1]
+            output_size = os.path.getsize(staged[0][0])
+            add_bytes(written=output_size)
+            
+            # Responsive width ladder, never upscaling
+            variants = []
+            current = img
+            for width in params.get('widths', []):
+                if width >= current.width:
+                    continue
+                height = max(1, round(current.height * width / current.width))
+                current = current.resize((width, height), Image.LANCZOS)
+                variant_path = _variant_path(output_path, width)
+                with open(temp_for(variant_path), 'wb') as f:
+                    save(current, f, params)
+                variants.append({'width': width, 'height': height, 'path': variant_path, 'size': os.path.getsize(staged[-1][0])})
+                add_bytes(written=variants[-1]['size'])
+    except BaseException:
+        for temp, _path in staged:
+            if os.path.exists(temp):
+                os.remove(temp)
+        raise
+    
+    return {
+        'path': output_path,
+        'format': name,
+        'quality': None if ENCODERS[name][2] else params['quality'],
+        'original_size': original_size,
+        'output_size': output_size,
+        'width': img.width,
+        'height': img.height,
+        'variants': variants,
+        'staged': staged,
     }
+
+def _encode_image_measured(source_path: Path, output_path: Path, params: dict, temps: Dict[str, str], memory: bool) -> dict:
+    """
+    _encode_image for a worker process when metrics are on: the worker's
+    stage records travel back under the result's 'stages' key.
+    """
+    instrumentation.enable(memory)
+    result = _encode_image(source_path, output_path, params, temps)
+    result['stages'] = instrumentation.drain()
+    return result
+
+def _reserve_temps(output_path: Path, params: dict, journal=None) -> Dict[str, str]:
+    """
+    Pick and register the temp file for every path an encode may write.
     
-    for idx, image_file in enumerate(image_files, 1):
-        old_filename = image_file.name
-        new_filename = sanitize_filename(old_filename)
+    The encoder may write any output suffix and any width variant, so all
+    of them are reserved before the job starts; rollback, recovery and
+    atomic_io.discard_reserved() remove those that were never placed.
+    
+    Args:
+        output_path: The job's destination file
+        params: Encode parameters from _encode_params
+        journal: Open run journal, if any (streaming runs clean up from it)
         
-        # Skip if filename doesn't need sanitization
-        if old_filename == new_filename and not convert_to_webp:
-            print(f"[{idx}/{len(image_files)}] Skipped (already clean): {old_filename}")
-            stats['skipped'] += 1
-            continue
+    Returns:
+        Dictionary mapping each possible output path to its temp file
+    """
+    temps = {}
+    for candidate in _output_candidates(output_path, params):
+        for path in [candidate] + [_variant_path(candidate, width) for width in params.get('widths', [])]:
+            temps[str(path)] = atomic_io.temp_path(path)
+    atomic_io.reserve(temps.values())
+    _journal_append(journal, 'reserve', temps=list(temps.values()))
+    return temps
+
+def _run_conversions(jobs: Iterable[Tuple], params: dict, workers: Optional[int], journal=None) -> Iterator[Tuple[Tuple, Optional[dict], Optional[Exception]]]:
+    """
+    Run conversions, in-process or across a process pool.
+    
+    Jobs are pulled lazily and at most two per worker are in flight, so
+    memory stays flat however many images there are. Closing the
+    generator cancels queued jobs and waits for running ones, so their
+    temp files can be discarded safely afterwards (see _conversions).
+    
+    Args:
+        jobs: Iterable of (label, old_filename, source_path, output_path, source_hash) tuples
+        params: Encode parameters from _encode_params
+        workers: Number of worker processes (1 = in-process, None = one per CPU core)
+        journal: Open run journal that records each job's reserved temps
         
+    Yields:
+        (job, result, None) on success or (job, None, error) on failure,
+        in the same order as jobs
+    """
+    if workers == 1 or (isinstance(jobs, list) and len(jobs) <= 1):
+        for job in jobs:
+            try:
+                result = _encode_image(job[2], job[3], params, _reserve_temps(job[3], params, journal))
+            except Exception as e:
+                yield job, None, e
+            else:
+                yield job, result, None
+        return
+    
+    def collect(job, future):
         try:
-            new_filepath = image_file.parent / new_filename
+            result = future.result()
+        except Exception as e:
+            return job, None, e
+        instrumentation.merge(result.pop('stages', []))
+        return job, result, None
+    
+    def submit(executor, job):
+        temps = _reserve_temps(job[3], params, journal)
+        if instrumentation.is_enabled():
+            return executor.submit(_encode_image_measured, job[2], job[3], params, temps, instrumentation.memory_enabled())
+        return executor.submit(_encode_image, job[2], job[3], params, temps)
+    
+    max_in_flight = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        try:
+            for job in jobs:
+                in_flight.append((job, submit(executor, job)))
+                if len(in_flight) >= max_in_flight:
+                    yield collect(*in_flight.popleft())
+            while in_flight:
+                yield collect(*in_flight.popleft())
+        except BaseException:
+            # Closed or interrupted: drop queued jobs; running ones finish
+            # when the pool shuts down
+            for _job, future in in_flight:
+                future.cancel()
+            raise
+
+@contextmanager
+def _conversions(jobs: Iterable[Tuple], params: dict, workers: Optional[int], journal=None):
+    """
+    _run_conversions for a with-block: if the block is left by an
+    exception or Ctrl+C, in-flight encodes are wound down and every temp
+    file they reserved but nobody placed is removed.
+    """
+    conversions = _run_conversions(jobs, params, workers, journal)
+    try:
+        yield conversions
+    except BaseException:
+        conversions.close()
+        atomic_io.discard_reserved()
+        raise
+
+@hot_path('hash')
+def file_digest(path: Path) -> str:
+    """
+    Compute the SHA-256 hex digest of a file's contents.
+    
+    Args:
+        path: File to hash
+        
+    Returns:
+        Hex digest string
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@hot_path('hash')
+def find_duplicate_images(image_files: List[Path], hashes: Optional[Dict[Path, str]] = None) -> Dict[Path, List[Path]]:
+    """
+    Group byte-identical images.
+    
+    Files are bucketed by size first, so only files that share a size with
+    another file are hashed at all.
+    
+    Args:
+        image_files: Images to compare
+        hashes: Known SHA-256 digests by path (e.g. from the conversion
+            manifest); digests computed here are added to it
+        
+    Returns:
+        Dictionary mapping the first file of each group (in input order)
+        to its duplicates; files without duplicates are left out
+    """
+    hashes = {} if hashes is None else hashes
+    by_size = {}
+    for path in image_files:
+        by_size.setdefault(os.stat(path).st_size, []).append(path)
+    
+    groups = {}
+    for paths in by_size.values():
+        if len(paths) < 2:
+            continue
+        by_hash = {}
+        for path in paths:
+            if path not in hashes:
+                hashes[path] = file_digest(path)
+            by_hash.setdefault(hashes[path], []).append(path)
+        for same in by_hash.values():
+            if len(same) > 1:
+                groups[same[0]] = same[1:]
+    return groups
+
+def load_conversion_cache(cache_file: str) -> Dict[str, dict]:
+    """
+    Load the conversion manifest (source path -> cache entry).
+    
+    Each entry records the source content hash, the encode parameters and
+    the output hash, plus the stat() signatures used to avoid re-hashing
+    files that have not been touched.
+    
+    Args:
+        cache_file: Path to the JSON manifest
+        
+    Returns:
+        Dictionary of cache entries (empty if the manifest is missing or unreadable)
+    """
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️  Ignoring unreadable image cache {cache_file}: {str(e)}")
+        return {}
+    
+    if data.get('version') != CACHE_VERSION:
+        return {}
+    return data.get('entries', {})
+
+def save_conversion_cache(cache: Dict[str, dict], cache_file: str) -> None:
+    """
+    Write the conversion manifest, dropping entries whose output is gone.
+    
+    Args:
+        cache: Dictionary of cache entries
+        cache_file: Path to the JSON manifest
+    """
+    entries = {key: entry for key, entry in cache.items() if atomic_io.exists(entry['output'])}
+    atomic_io.write_text(cache_file, json.dumps({'version': CACHE_VERSION, 'entries': entries}, indent=2, sort_keys=True))
+
+def _stat_signature(path: Path) -> Tuple[int, int]:
+    """Return (size, mtime_ns) for a file."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def _cached_digest(path: Path, known: Optional[dict], prefix: str) -> str:
+    """
+    Hash a file, reusing the digest stored in a cache entry when the
+    file's size and mtime still match what was recorded.
+    """
+    size, mtime_ns = _stat_signature(path)
+    if known and known.get(f'{prefix}_size') == size and known.get(f'{prefix}_mtime_ns') == mtime_ns:
+        return known[f'{prefix}_hash']
+    return file_digest(path)
+
+def _cache_key(path: Path) -> str:
+    """Cache keys are POSIX-style paths so the manifest is portable."""
+    return Path(path).as_posix()
+
+def _is_cache_hit(cache: Dict[str, dict], source_path: Path, webp_path: Path, source_hash: str, params: dict) -> bool:
+    """
+    Check whether webp_path (or, when several formats are enabled, the
+    same stem with the chosen suffix) was produced from this exact source
+    content with these exact encode parameters and has not been modified since.
+    """
+    entry = cache.get(_cache_key(source_path))
+    if not entry or entry['source_hash'] != source_hash or entry['params'] != params:
+        return False
+    output_path = Path(entry['output'])
+    if output_path not in [Path(_cache_key(path)) for path in _output_candidates(webp_path, params)] or not output_path.exists():
+        return False
+    if not all(os.path.exists(variant) for variant in entry.get('variants', [])):
+        return False
+    return _cached_digest(output_path, entry, 'output') == entry['output_hash']
+
+def _record_conversion(cache: Dict[str, dict], source_path: Path, webp_path: Path, source_hash: str, params: dict, variants: Optional[List[dict]] = None, output_format: Optional[str] = None, quality: Optional[int] = None) -> None:
+    """Store a cache entry for a freshly written output file and its variants."""
+    source_size, source_mtime_ns = _stat_signature(source_path)
+    output_size, output_mtime_ns = _stat_signature(atomic_io.resolve(webp_path))
+    cache[_cache_key(source_path)] = {
+        'source_hash': source_hash,
+        'source_size': source_size,
+        'source_mtime_ns': source_mtime_ns,
+        'params': params,
+        'format': output_format or params['format'],
+        'quality': quality,
+        'output': _cache_key(webp_path),
+        'output_hash': file_digest(atomic_io.resolve(webp_path)),
+        'output_size': output_size,
+        'output_mtime_ns': output_mtime_ns,
+        'variants': [_cache_key(variant['path']) for variant in variants or []],
+    }
+
+def _empty_image_stats() -> Dict[str, int]:
+    """Counters reported by the rename/convert stage."""
+    return {'renamed': 0, 'converted': 0, 'deduplicated': 0, 'skipped': 0, 'failed': 0}
+
+def _new_image_run(params: dict, convert_to_webp: bool = True, delete_original: bool = False, cache: Optional[Dict[str, dict]] = None, variant_manifest: Optional[Dict[str, dict]] = None, journal=None) -> dict:
+    """
+    Bundle the settings and mutable state shared by every image in a run.
+    
+    Args:
+        params: Encode parameters from _encode_params
+        convert_to_webp: Whether to convert to WebP format
+        delete_original: Whether to delete the source after conversion
+        cache: Conversion manifest, or None to fall back to "WebP exists" checks
+        variant_manifest: Responsive variant manifest to update, or None
+        journal: Open run journal, if any
+        
+    Returns:
+        Run dict; 'stats' and 'filename_mapping' are filled in as images finish
+    """
+    return {
+        'params': params,
+        'convert_to_webp': convert_to_webp,
+        'delete_original': delete_original,
+        'cache': cache,
+        'variant_manifest': variant_manifest,
+        'journal': journal,
+        'stats': _empty_image_stats(),
+        'filename_mapping': {},
+    }
+
+def _prepare_image(label: str, image_file: Path, run: dict) -> Optional[Tuple]:
+    """
+    Rename one image if needed and decide whether it must be encoded.
+    
+    Args:
+        label: Progress prefix for log lines (e.g. "[3/40]")
+        image_file: Image to process
+        run: Run dict from _new_image_run (updated in place)
+        
+    Returns:
+        A conversion job tuple, or None if nothing needs encoding
+    """
+    stats = run['stats']
+    cache = run['cache']
+    old_filename = image_file.name
+    new_filename = sanitize_filename(old_filename)
+    
+    # Skip if filename doesn't need sanitization
+    if old_filename == new_filename and not run['convert_to_webp']:
+        print(f"{label} Skipped (already clean): {old_filename}")
+        stats['skipped'] += 1
+        return None
+    
+    try:
+        new_filepath = image_file.parent / new_filename
+        
+        # Step 1: Rename the file if needed
+        if old_filename != new_filename:
+            if new_filepath.exists() and new_filepath != image_file:
+                print(f"{label} ⚠️  Target exists, skipping rename: {old_filename} -> {new_filename}")
+                stats['skipped'] += 1
+                return None
             
-            # Step 1: Rename the file if needed
-            if old_filename != new_filename:
-                if new_filepath.exists() and new_filepath != image_file:
-                    print(f"[{idx}/{len(image_files)}] ⚠️  Target exists, skipping rename: {old_filename} -> {new_filename}")
-                    stats['skipped'] += 1
-                    continue
-                
-                os.rename(image_file, new_filepath)
-                filename_mapping[old_filename] = new_filename
-                print(f"[{idx}/{len(image_files)}] Renamed: {old_filename} -> {new_filename}")
-                stats['renamed'] += 1
-                image_file = new_filepath  # Update reference
+            atomic_io.rename(image_file, new_filepath)
+            _journal_append(run['journal'], 'rename', old=old_filename, new=new_filename, path=_cache_key(new_filepath))
+            run['filename_mapping'][old_filename] = new_filename
+            print(f"{label} Renamed: {old_filename} -> {new_filename}")
+            stats['renamed'] += 1
+            image_file = new_filepath  # Update reference
+        
+        # Step 2: Queue WebP conversion if requested
+        if run['convert_to_webp']:
+            webp_filename = f"{Path(new_filename).stem}.webp"
+            webp_filepath = image_file.parent / webp_filename
             
-            # Step 2: Convert to WebP if requested
-            if convert_to_webp:
-                webp_filename = f"{Path(new_filename).stem}.webp"
-                webp_filepath = image_file.parent / webp_filename
-                
-                # Skip if WebP already exists
-                if webp_filepath.exists():
-                    print(f"  → WebP already exists: {webp_filename}")
+            if cache is not None:
+                # Skip only if the cached WebP matches this source and these settings
+                source_hash = _cached_digest(image_file, cache.get(_cache_key(image_file)), 'source')
+                if _is_cache_hit(cache, image_file, webp_filepath, source_hash, run['params']):
+                    print(f"{label} → Output up to date: {Path(cache[_cache_key(image_file)]['output']).name}")
                 else:
-                    # Open and convert image
-                    img = Image.open(image_file)
-                    
-                    # Handle different image modes while preserving transparency
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    elif img.mode == 'LA':
-                        img = img.convert('RGBA')
-                    elif img.mode not in ('RGB', 'RGBA', 'L'):
-                        img.convert('RGB')
-                    
-                    # Save as WebP
-                    if img.mode == 'RGBA':
-                        img.save(webp_filepath, 'WEBP', quality=quality, method=6, lossless=False)
-                    else:
-                        img.save(webp_filepath, 'WEBP', quality=quality, method=6)
-                    
-                    # Get file sizes
-                    original_size = os.path.getsize(image_file) / 1024
-                    webp_size = os.path.getsize(webp_filepath) / 1024
-                    savings = ((original_size - webp_size) / original_size) * 100
-                    
-                    print(f"  → Converted to WebP: {webp_filename} ({original_size:.1f}KB -> {webp_size:.1f}KB, saved {savings:.1f}%)")
-                    stats['converted'] += 1
-                    
-                    # Update mapping to point to WebP
-                    if old_filename in filename_mapping:
-                        filename_mapping[old_filename] = webp_filename
-                    else:
-                        filename_mapping[old_filename] = webp_filename
-                    
-                    # Delete original if requested
-                    if delete_original:
-                        os.remove(image_file)
-                        print(f"  → Deleted original: {new_filename}")
+                    return (label, old_filename, image_file, webp_filepath, source_hash)
+            else:
+                # Skip if an output already exists
+                existing = [path for path in _output_candidates(webp_filepath, run['params']) if path.exists()]
+                if existing:
+                    print(f"{label} → Output already exists: {existing[0].name}")
+                else:
+                    return (label, old_filename, image_file, webp_filepath, None)
+    
+    except Exception as e:
+        stats['failed'] += 1
+        print(f"{label} ✗ Failed to process {old_filename}: {str(e)}")
+    
+    return None
+
+def _finish_conversion(job: Tuple, result: Optional[dict], error: Optional[Exception], run: dict) -> bool:
+    """
+    Record the outcome of one conversion: stats, mapping, cache and cleanup.
+    
+    Args:
+        job: Conversion job tuple from _prepare_image
+        result: Result dict from _encode_image, or None on failure
+        error: Exception raised by the encoder, if any
+        run: Run dict from _new_image_run (updated in place)
+        
+    Returns:
+        True if the output was placed and recorded
+    """
+    stats = run['stats']
+    label, old_filename, image_file, _target, source_hash = job
+    if error is not None:
+        stats['failed'] += 1
+        print(f"{label} ✗ Failed to process {old_filename}: {str(error)}")
+        return False
+    
+    try:
+        for temp, path in result['staged']:
+            atomic_io.place(temp, path)
+        original_size, webp_size = result['original_size'] / 1024, result['output_size'] / 1024
+        savings = ((original_size - webp_size) / original_size) * 100
+        
+        output_path = result['path']
+        chosen = f" q{result['quality']}" if 'target_ssim' in run['params'] and result['quality'] is not None else ""
+        print(f"{label} → Converted to {result['format']}{chosen}: {output_path.name} ({original_size:.1f}KB -> {webp_size:.1f}KB, saved {savings:.1f}%)")
+        if result['variants']:
+            print(f"  → Variants: {', '.join(str(variant['width']) + 'w' for variant in result['variants'])}")
+        stats['converted'] += 1
+        _journal_append(run['journal'], 'convert', source=_cache_key(image_file), output=_cache_key(output_path))
+        
+        # Update mapping to point to the output (its suffix carries the chosen format)
+        run['filename_mapping'][old_filename] = output_path.name
+        
+        if run['cache'] is not None:
+            _record_conversion(run['cache'], image_file, output_path, source_hash, run['params'], result['variants'], result['format'], result['quality'])
+        if run['variant_manifest'] is not None:
+            _record_variants(run['variant_manifest'], output_path, result)
+        
+        # Delete original if requested
+        if run['delete_original']:
+            atomic_io.remove(image_file)
+            _journal_append(run['journal'], 'delete', path=_cache_key(image_file))
+            print(f"  → Deleted original: {image_file.name}")
+    except Exception as e:
+        stats['failed'] += 1
+        print(f"{label} ✗ Failed to process {old_filename}: {str(e)}")
+        return False
+    return True
+
+def _link_output(source: Path, target: Path) -> None:
+    """Give target the bytes of source: a hard link where possible, else a copy."""
+    temp = atomic_io.temp_path(target)
+    try:
+        os.link(atomic_io.resolve(source), temp)
+    except OSError:
+        shutil.copyfile(atomic_io.resolve(source), temp)
+    atomic_io.place(temp, target)
+
+def _shared_names(image_files: Iterable[Path]) -> Set[str]:
+    """Basenames carried by more than one image; filename_mapping cannot tell them apart."""
+    seen, shared = set(), set()
+    for image_file in image_files:
+        (shared if image_file.name in seen else seen).add(image_file.name)
+    return shared
+
+def _can_merge(duplicate_source: Path, canonical_source: Path, old_filename: str, shared_names: Set[str]) -> bool:
+    """
+    Whether a duplicate's references can be pointed at the canonical output.
+    
+    filename_mapping only swaps file names, so that is only safe when both
+    files share a directory and no other image carries the duplicate's name.
+    """
+    return duplicate_source.parent == canonical_source.parent and old_filename not in shared_names
+
+def _finish_duplicates(result: Optional[dict], duplicates: List[Tuple[str, Path, Path, Optional[str], bool]], run: dict) -> None:
+    """
+    Point the duplicates of a freshly encoded image at its output.
+    
+    A duplicate that can be merged (see _can_merge) has its references
+    rewritten to the canonical output; any other gets hard links of the
+    output and its variants under its own name. If the canonical image
+    failed, every copy is counted as failed too (the same bytes would fail
+    the same way) and left untouched.
+    
+    Args:
+        result: Result dict of the canonical image's conversion, or None
+            if it failed
+        duplicates: (old_filename, source_path, output_path, source_hash,
+            merge) for each byte-identical copy
+        run: Run dict from _new_image_run (updated in place)
+    """
+    if result is None:
+        for old_filename, *_rest in duplicates:
+            run['stats']['failed'] += 1
+            print(f"  ✗ Failed to process duplicate {old_filename}: the identical image it reuses failed")
+        return
+    
+    output_path = result['path']
+    for old_filename, source_path, target, source_hash, merge in duplicates:
+        try:
+            if merge:
+                run['filename_mapping'][old_filename] = output_path.name
+                print(f"  → Duplicate merged: {old_filename} -> {output_path.name}")
+            else:
+                linked = target.with_suffix(output_path.suffix)
+                _link_output(output_path, linked)
+                variants = []
+                for variant in result['variants']:
+                    variant_path = _variant_path(linked, variant['width'])
+                    _link_output(variant['path'], variant_path)
+                    variants.append(dict(variant, path=variant_path))
+                run['filename_mapping'][old_filename] = linked.name
+                if run['cache'] is not None:
+                    _record_conversion(run['cache'], source_path, linked, source_hash, run['params'], variants, result['format'], result['quality'])
+                if run['variant_manifest'] is not None:
+                    _record_variants(run['variant_manifest'], linked, dict(result, variants=variants))
+                print(f"  → Duplicate linked: {old_filename} -> {linked}")
+            run['stats']['deduplicated'] += 1
             
+            if run['delete_original']:
+                atomic_io.remove(source_path)
+                _journal_append(run['journal'], 'delete', path=_cache_key(source_path))
         except Exception as e:
-            stats['failed'] += 1
-            print(f"[{idx}/{len(image_files)}] ✗ Failed to process {old_filename}: {str(e)}")
+            run['stats']['failed'] += 1
+            print(f"  ✗ Failed to reuse output for duplicate {old_filename}: {str(e)}")
+
+def rename_and_convert_images(image_files: List[Path], quality: int = 85, convert_to_webp: bool = True, delete_original: bool = False, workers: Optional[int] = 1, cache: Optional[Dict[str, dict]] = None, variant_widths: Optional[List[int]] = None, variant_manifest: Optional[Dict[str, dict]] = None, formats: Optional[List[str]] = None, min_psnr: float = 40.0, target_ssim: Optional[float] = None, max_dimension: Optional[int] = None, dedupe: bool = True) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    Rename image files and optionally convert to WebP.
+    
+    Renames run serially first; the WebP encodes are then handed to a
+    process pool when workers != 1.
+    
+    Without a cache, an existing WebP file is never re-encoded. With a cache,
+    a WebP file is reused only if it was made from the same source content
+    with the same encode parameters; anything else is converted again.
+    
+    Args:
+        image_files: List of image files to process
+        quality: WebP quality (1-100)
+        convert_to_webp: Whether to convert to WebP format
+        delete_original: Whether to delete original files after conversion
+        workers: Number of conversion processes (1 = in-process, None = one per CPU core)
+        cache: Conversion manifest from load_conversion_cache (updated in place)
+        variant_widths: Widths of extra downscaled WebP variants (e.g. [320, 640, 1024, 1920])
+        variant_manifest: Variant manifest from load_variant_manifest (updated in place)
+        formats: Output formats from ENCODERS (default ['webp']); with more
+            than one, each image keeps the smallest output that reaches min_psnr
+        min_psnr: Quality threshold (dB) a lossy candidate must reach to win
+        target_ssim: If set, search each image for the lowest quality (up to
+            quality) whose SSIM reaches this value, e.g. 0.97
+        max_dimension: Downscale sources whose longest side exceeds this
+            (JPEGs are decoded straight to a near-target scale)
+        dedupe: Encode byte-identical images once (see _finish_duplicates)
+        
+    Returns:
+        Tuple of (filename_mapping dict, stats dict); mapped names carry the
+        suffix of the format chosen for each image
+    """
+    if not PIL_AVAILABLE:
+        print("❌ PIL (Pillow) is not installed. Cannot convert images.")
+        print("   Install with: pip install Pillow")
+        return {}, _empty_image_stats()
+    
+    run = _new_image_run(_encode_params(quality, variant_widths, formats, min_psnr, target_ssim, max_dimension), convert_to_webp, delete_original, cache, variant_manifest)
+    total = len(image_files)
+    
+    conversion_jobs = []
+    for idx, image_file in enumerate(image_files, 1):
+        job = _prepare_image(f"[{idx}/{total}]", image_file, run)
+        if job is not None:
+            conversion_jobs.append(job)
+    
+    # Encode each distinct image once
+    duplicates = {}
+    if dedupe and len(conversion_jobs) > 1:
+        hashes = {job[2]: job[4] for job in conversion_jobs if job[4]}
+        jobs_by_source = {job[2]: job for job in conversion_jobs}
+        shared_names = _shared_names(image_files)
+        for canonical, copies in find_duplicate_images(list(jobs_by_source), hashes).items():
+            duplicates[canonical] = [
+                (jobs_by_source[path][1], path, jobs_by_source[path][3], hashes[path], _can_merge(path, canonical, jobs_by_source[path][1], shared_names))
+                for path in copies
+            ]
+        merged = {copy[1] for copies in duplicates.values() for copy in copies}
+        conversion_jobs = [job for job in conversion_jobs if job[2] not in merged]
+    
+    # Encode queued images (possibly in parallel)
+    with _conversions(conversion_jobs, run['params'], workers) as conversions:
+        for job, result, error in conversions:
+            placed = _finish_conversion(job, result, error, run)
+            if job[2] in duplicates:
+                _finish_duplicates(result if placed else None, duplicates[job[2]], run)
+    
+    return run['filename_mapping'], run['stats']
+
+# ------------------------------------------------------------------------
+# Responsive variant manifest
+# ------------------------------------------------------------------------
+# Maps the public URL of every full-size WebP to its pre-built width
+# variants so lib/image-loader.ts can serve them without runtime resizing.
+
+def _public_url(path: Path, public_dir: str = 'public') -> Optional[str]:
+    """Return the site URL for a file under public_dir, or None if it is outside it."""
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(public_dir))
+    if relative.startswith('..'):
+        return None
+    return '/' + Path(relative).as_posix()
+
+def load_variant_manifest(manifest_file: str) -> Dict[str, dict]:
+    """
+    Load the responsive variant manifest (public URL -> variant entry).
     
-    return filename_mapping, stats
+    Args:
+        manifest_file: Path to the JSON manifest
+        
+    Returns:
+        Dictionary of manifest entries (empty if the manifest is missing)
+    """
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_variant_manifest(manifest: Dict[str, dict], manifest_file: str, public_dir: str = 'public') -> None:
+    """
+    Write the responsive variant manifest, dropping entries whose image is gone.
+    
+    Args:
+        manifest: Dictionary of manifest entries
+        manifest_file: Path to the JSON manifest
+        public_dir: Directory served at the site root
+    """
+    entries = {
+        url: entry for url, entry in sorted(manifest.items())
+        if atomic_io.exists(os.path.join(public_dir, url.lstrip('/')))
+    }
+    os.makedirs(os.path.dirname(manifest_file) or '.', exist_ok=True)
+    atomic_io.write_text(manifest_file, json.dumps(entries, indent=2) + '\n')
+
+def _record_variants(manifest: Dict[str, dict], webp_path: Path, result: dict) -> None:
+    """Store (or clear) the manifest entry for a freshly encoded image."""
+    url = _public_url(webp_path)
+    if url is None:
+        return
+    if not result['variants']:
+        manifest.pop(url, None)
+        return
+    manifest[url] = {
+        'width': result['width'],
+        'height': result['height'],
+        'variants': [
+            {'width': variant['width'], 'height': variant['height'], 'src': _public_url(variant['path'])}
+            for variant in sorted(result['variants'], key=lambda variant: variant['width'])
+        ],
+    }
+
+# ------------------------------------------------------------------------
+# Run journal
+# ------------------------------------------------------------------------
+# A streaming run appends one JSON record per committed step (rename,
+# convert, delete, final mapping, rewritten references). If the run dies,
+# the next run replays the journal and finishes the reference updates the
+# previous one committed to but never applied.
+
+_JOURNAL_LOCK = threading.Lock()
+
+def _journal_append(journal, op: str, **fields) -> None:
+    """Append one record to the run journal and flush it to the OS."""
+    if journal is None:
+        return
+    with _JOURNAL_LOCK:
+        journal.write(json.dumps({'op': op, **fields}) + '\n')
+        journal.flush()
+
+def recover_journal(journal_file: str) -> Dict[str, str]:
+    """
+    Read the journal of an interrupted run.
+    
+    Args:
+        journal_file: Path to the JSONL journal
+    
+    Temp files the interrupted run reserved for its encodes and never
+    placed are removed along the way.
+    
+    Returns:
+        Old -> new filename pairs that were committed on disk but whose
+        source references were never rewritten, in commit order
+    """
+    pending = {}
+    try:
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return pending
+    
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # Torn final line from a crash mid-write
+            break
+        op = record.get('op')
+        if op == 'rename':
+            pending.setdefault(record['old'], record['new'])
+        elif op == 'map':
+            pending[record['old']] = record['new']
+        elif op == 'rewritten':
+            for old_name in record['old']:
+                pending.pop(old_name, None)
+        elif op == 'complete':
+            pending.clear()
+        elif op == 'reserve':
+            for temp in record['temps']:
+                # Placed temps were renamed away; anything left is an orphan
+                if os.path.exists(temp):
+                    os.remove(temp)
+    
+    return pending
+
+def _reference_update_stage(batches: queue.Queue, source_files: List[Path], index_file: Optional[str], journal, update_stats: Dict[str, int], modified_files: Set[Path], errors: List[Exception]) -> None:
+    """
+    Consumer thread: rewrite source references for each mapping batch.
+    
+    The reference index is refreshed while the first images are still
+    being encoded; each batch then only opens the files that mention it.
+    """
+    try:
+        index = None
+        if index_file:
+            with stage('reference_index', 'references'):
+                index = load_reference_index(index_file)
+                reindexed = refresh_reference_index(index, source_files)
+            print(f"   Reference index ready: {len(source_files)} source files ({reindexed} re-indexed)")
+        
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            
+            candidates = find_referencing_files(index, batch) if index is not None else source_files
+            with stage('reference_rewrite', 'references'):
+                batch_stats = update_source_references(candidates, batch, modified_files)
+            update_stats['total_replacements'] += batch_stats['total_replacements']
+            _journal_append(journal, 'rewritten', old=list(batch))
+            if index is not None:
+                refresh_reference_index(index, candidates, prune=False)
+        
+        if index is not None:
+            save_reference_index(index, index_file)
+    except Exception as e:
+        errors.append(e)
+        # Keep draining so the producer never blocks on a full queue
+        while batches.get() is not None:
+            pass
+
+def _process_images_streaming(image_directories: List[str], source_base_dir: str, quality: int, convert_to_webp: bool, delete_original: bool, update_references: bool, workers: Optional[int], cache_file: Optional[str], index_file: Optional[str], journal_file: str, batch_size: int, variant_widths: Optional[List[int]] = None, variant_file: Optional[str] = None, formats: Optional[List[str]] = None, min_psnr: float = 40.0, target_ssim: Optional[float] = None, max_dimension: Optional[int] = None) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Run discovery, rename, encode and reference update as overlapping stages.
+    
+    Discovery and renames are pulled lazily by the encoder window, finished
+    conversions are committed as soon as they come back, and committed
+    mappings are handed in batches to a reference-update thread through a
+    bounded queue.
+    
+    Returns:
+        Tuple of (rename/convert stats, reference update stats)
+    """
+    stats = _empty_image_stats()
+    update_stats = {'files_modified': 0, 'total_replacements': 0}
+    if not PIL_AVAILABLE and convert_to_webp:
+        print("❌ PIL (Pillow) is not installed. Cannot convert images.")
+        print("   Install with: pip install Pillow")
+        return stats, update_stats
+    
+    cache = load_conversion_cache(cache_file) if cache_file else None
+    variant_manifest = load_variant_manifest(variant_file) if variant_file else None
+    
+    # Mappings an interrupted run committed but never applied go first
+    recovered = recover_journal(journal_file)
+    if recovered and not update_references:
+        # Finishing this run would mark the journal complete and drop them
+        print(f"❌ {journal_file} holds {len(recovered)} pending reference update(s) from an interrupted run")
+        print("   Run again with reference updates enabled to apply them first")
+        return stats, update_stats
+    if recovered:
+        print(f"↩️  Resuming {len(recovered)} pending reference update(s) from an interrupted run")
+    
+    batches = queue.Queue(maxsize=4)
+    modified_files = set()
+    errors = []
+    source_files = []
+    if update_references:
+        with stage('source_discovery', 'discovery'):
+            source_files = find_source_files(source_base_dir)
+        # Never rewrite the pipeline's own state files
+        state_files = {os.path.abspath(f) for f in (cache_file, index_file, journal_file, variant_file) if f}
+        source_files = [f for f in source_files if os.path.abspath(f) not in state_files]
+    
+    with open(journal_file, 'a', encoding='utf-8') as journal:
+        run = _new_image_run(_encode_params(quality, variant_widths, formats, min_psnr, target_ssim, max_dimension), convert_to_webp, delete_original, cache, variant_manifest, journal)
+        filename_mapping = run['filename_mapping']
+        writer = None
+        if update_references:
+            writer = threading.Thread(
+                target=_reference_update_stage,
+                args=(batches, source_files, index_file, journal, update_stats, modified_files, errors),
+                daemon=True
+            )
+            writer.start()
+        
+        pending = dict(recovered)
+
+        def commit(old_filename: str) -> None:
+            """Hand a final old -> new mapping to the reference stage."""
+            if old_filename not in filename_mapping:
+                return
+            new_filename = filename_mapping[old_filename]
+            # A pending (e.g. recovered) mapping onto this name now ends at
+            # its final name: one replacement pass cannot chain them
+            for earlier, target in list(pending.items()):
+                if target == old_filename:
+                    _journal_append(journal, 'map', old=earlier, new=new_filename)
+                    pending[earlier] = new_filename
+            _journal_append(journal, 'map', old=old_filename, new=new_filename)
+            pending[old_filename] = new_filename
+            if writer is not None and len(pending) >= batch_size:
+                batches.put(dict(pending))
+                pending.clear()
+
+        def produce_jobs() -> Iterator[Tuple]:
+            for idx, image_file in enumerate(iter_image_files(image_directories), 1):
+                job = _prepare_image(f"[{idx}]", image_file, run)
+                if job is None:
+                    # Renamed only (or nothing to do): the mapping is already final
+                    commit(image_file.name)
+                else:
+                    yield job
+        
+        with stage('rename_and_convert', 'images'), _conversions(produce_jobs(), run['params'], workers, journal) as conversions:
+            for job, result, error in conversions:
+                _finish_conversion(job, result, error, run)
+                commit(job[1])
+        
+        if cache is not None:
+            save_conversion_cache(cache, cache_file)
+        if variant_manifest is not None:
+            save_variant_manifest(variant_manifest, variant_file)
+        
+        if writer is not None:
+            if pending:
+                batches.put(dict(pending))
+            batches.put(None)
+            writer.join()
+        
+        stats.update(run['stats'])
+        if not errors:
+            _journal_append(journal, 'complete')
+    
+    if errors:
+        print(f"  ✗ Reference update failed: {str(errors[0])}")
+        print(f"    Pending updates are kept in {journal_file} and will be retried on the next run")
+    else:
+        os.remove(journal_file)
+    
+    update_stats['files_modified'] = len(modified_files)
+    return stats, update_stats
 
 def process_images(
     image_directories: List[str],
@@ -255,7 +1639,22 @@ def process_images(
     quality: int = 85,
     convert_to_webp: bool = True,
     delete_original: bool = False,
-    update_references: bool = True
+    update_references: bool = True,
+    workers: Optional[int] = 1,
+    cache_file: Optional[str] = '.image-cache.json',
+    index_file: Optional[str] = '.image-refs.json',
+    streaming: bool = False,
+    journal_file: str = '.image-journal.jsonl',
+    batch_size: int = 32,
+    variant_widths: Optional[List[int]] = None,
+    variant_file: Optional[str] = 'data/image-variants.json',
+    formats: Optional[List[str]] = None,
+    min_psnr: float = 40.0,
+    target_ssim: Optional[float] = None,
+    max_dimension: Optional[int] = None,
+    dry_run: bool = False,
+    transaction_file: str = '.image-transaction.jsonl',
+    dedupe: bool = True
 ):
     """
     Main function to process images: find, rename, update references, and convert.
@@ -267,105 +1666,615 @@ def process_images(
         convert_to_webp: Whether to convert to WebP
         delete_original: Whether to delete originals after conversion
         update_references: Whether to update source code references
+        workers: Number of WebP conversion processes (1 = in-process, None = one per CPU core)
+        cache_file: Conversion manifest used to skip unchanged images (None to disable)
+        index_file: Reference index used to open only files that mention
+            renamed images (None to scan every source file)
+        streaming: Run the stages concurrently with bounded queues and a
+            crash-safe journal instead of one phase after another
+        journal_file: Journal of committed steps used by streaming runs
+        batch_size: Number of committed mappings per reference update batch
+            in streaming runs
+        variant_widths: Widths of extra downscaled WebP variants for srcset
+            (e.g. [320, 640, 1024, 1920]); None for full-size output only
+        variant_file: Manifest read by lib/image-loader.ts to pick a
+            variant per requested width (None to leave it untouched)
+        formats: Output formats from ENCODERS (default ['webp']); with more
+            than one, each image keeps the smallest acceptable output
+        min_psnr: Quality threshold (dB) for lossy candidates in that mode
+        target_ssim: Per-image quality search target (None = fixed quality);
+            the chosen quality is stored in the conversion manifest
+        max_dimension: Longest side of the converted images (None = keep size)
+        dry_run: Only print the plan: renames, collisions, conversions,
+            expected savings, files to rewrite and an estimated run time
+        transaction_file: Journal of the batch run's write transaction;
+            renames, outputs, deletions, source rewrites and manifests are
+            committed together or rolled back (streaming runs write each
+            file atomically and resume through journal_file instead)
+        dedupe: Encode byte-identical images once; copies in the same
+            directory have their references merged onto one output, copies
+            elsewhere get hard links (batch runs only; streaming runs
+            warn and encode every copy)
+    
+    Returns:
+        The rename/convert stats ('renamed', 'converted', 'deduplicated',
+        'skipped', 'failed'); all zero for a dry run or an empty tree
     """
     print("="*80)
     print("IMAGE PROCESSING SCRIPT")
     print("="*80)
     print()
     
-    # Step 1: Find all image files
-    print("📁 Step 1: Finding image files...")
-    image_files = find_image_files(image_directories)
-    print(f"   Found {len(image_files)} image files\n")
+    # Keep the loader manifest in step even when variants are switched off
+    if variant_file and not (variant_widths or os.path.exists(variant_file)):
+        variant_file = None
+    
+    if streaming and not dry_run:
+        print("🔀 Streaming: discovery → rename → encode → reference update")
+        if dedupe:
+            # Duplicates are only known once every image is discovered and hashed
+            print("⚠️  Deduplication needs the whole image set up front and is off in streaming runs; use --no-dedupe to silence this")
+        rename_stats, update_stats = _process_images_streaming(
+            image_directories, source_base_dir, quality, convert_to_webp, delete_original,
+            update_references, workers, cache_file, index_file, journal_file, batch_size,
+            variant_widths, variant_file, formats, min_psnr, target_ssim, max_dimension
+        )
+        _print_image_summary(rename_stats, update_stats)
+        return rename_stats
+    
+    # Finish or undo an interrupted batch run before planning against the tree
+    if not dry_run:
+        outcome = atomic_io.recover(transaction_file)
+        if outcome:
+            print(f"↩️  Recovered an interrupted run ({outcome}) from {transaction_file}\n")
+    
+    # Step 1: Plan every rename, conversion and rewrite from stat() calls
+    print("📁 Step 1: Planning...")
+    cache = load_conversion_cache(cache_file) if cache_file else None
+    with stage('plan', 'images'):
+        plan = plan_images(
+            image_directories, source_base_dir,
+            _encode_params(quality, variant_widths, formats, min_psnr, target_ssim, max_dimension),
+            convert_to_webp, delete_original, update_references, cache, index_file,
+            exclude_files=(cache_file, index_file, variant_file, transaction_file), workers=workers, dedupe=dedupe
+        )
+    print_image_plan(plan, details=dry_run)
+    print()
+    
+    if dry_run:
+        print("🔎 Dry run: nothing was changed")
+        return _empty_image_stats()
     
-    if not image_files:
+    if not plan['image_files']:
         print("No image files found. Exiting.")
-        return
+        return _empty_image_stats()
+    
+    if plan['conversions'] and not PIL_AVAILABLE:
+        print("❌ PIL (Pillow) is not installed. Cannot convert images.")
+        print("   Install with: pip install Pillow")
+        return dict(_empty_image_stats(), failed=len(plan['conversions']))
     
-    # Step 2: Rename and convert images
-    print("🔄 Step 2: Renaming and converting images...")
-    filename_mapping, rename_stats = rename_and_convert_images(
-        image_files,
-        quality=quality,
-        convert_to_webp=convert_to_webp,
-        delete_original=delete_original
-    )
+    # Step 2: Execute exactly that plan, as one transaction
+    print("🔄 Step 2: Renaming, converting and updating references...")
+    variant_manifest = load_variant_manifest(variant_file) if variant_file else None
+    try:
+        with atomic_io.transaction(transaction_file):
+            rename_stats, update_stats = execute_image_plan(plan, workers, cache, variant_manifest, index_file)
+            if cache is not None:
+                save_conversion_cache(cache, cache_file)
+            if variant_manifest is not None:
+                save_variant_manifest(variant_manifest, variant_file)
+    except KeyboardInterrupt:
+        print("\n⏹️  Interrupted: every rename, output and rewrite of this run was rolled back")
+        raise
     print()
     
-    # Step 3: Update source code references
-    if update_references and filename_mapping:
-        print("📝 Step 3: Updating source code references...")
-        source_files = find_source_files(source_base_dir)
-        print(f"   Found {len(source_files)} source files to check")
-        update_stats = update_source_references(source_files, filename_mapping)
+    _print_image_summary(rename_stats, update_stats)
+    return rename_stats
+
+# ------------------------------------------------------------------------
+# Plan / execute
+# ------------------------------------------------------------------------
+# plan_images works out everything a batch run will do (renames, collisions,
+# conversions, expected savings, files to rewrite) from stat() calls and the
+# reference index alone. A dry run prints that plan; a real run hands the
+# same plan to execute_image_plan.
+
+# Output/source size ratios assumed while the conversion manifest has no history
+_DEFAULT_SIZE_RATIOS = {'.jpg': 0.7, '.jpeg': 0.7, '.png': 0.35, '.gif': 0.5}
+# Rough single-core encode throughput, in source megabytes per second
+_ENCODE_MB_PER_SECOND = {'webp': 4.0, 'webp-lossless': 1.5, 'avif': 1.0}
+# Extra seconds per image and lossy format spent on the SSIM quality search
+_QUALITY_SEARCH_SECONDS = 0.3
+# Reference rewrite throughput, in source megabytes per second
+_REWRITE_MB_PER_SECOND = 50.0
+
+def _size_ratios(cache: Optional[Dict[str, dict]]) -> Dict[str, float]:
+    """Output/source size ratio per source extension, learned from the conversion manifest."""
+    ratios = dict(_DEFAULT_SIZE_RATIOS)
+    totals = {}
+    for key, entry in (cache or {}).items():
+        if entry.get('source_size') and entry.get('output_size'):
+            ext = os.path.splitext(key)[1].lower()
+            source_total, output_total = totals.get(ext, (0, 0))
+            totals[ext] = (source_total + entry['source_size'], output_total + entry['output_size'])
+    for ext, (source_total, output_total) in totals.items():
+        ratios[ext] = output_total / source_total
+    return ratios
+
+def _planned_source_hash(entry: Optional[dict], source_path: Path) -> Optional[str]:
+    """The manifest's source hash if the file's stat() still matches it, else None."""
+    size, mtime_ns = _stat_signature(source_path)
+    if entry and entry.get('source_size') == size and entry.get('source_mtime_ns') == mtime_ns:
+        return entry['source_hash']
+    return None
+
+def _is_planned_hit(entry: Optional[dict], webp_path: Path, params: dict) -> bool:
+    """
+    _is_cache_hit using stat() only: the source and the recorded output must
+    both still carry the size and mtime stored in the manifest.
+    """
+    if not entry or entry['params'] != params:
+        return False
+    output_path = Path(entry['output'])
+    if output_path not in [Path(_cache_key(path)) for path in _output_candidates(webp_path, params)]:
+        return False
+    if not all(os.path.exists(variant) for variant in entry.get('variants', [])):
+        return False
+    try:
+        return _stat_signature(output_path) == (entry['output_size'], entry['output_mtime_ns'])
+    except OSError:
+        return False
+
+def _estimate_seconds(plan: dict, workers: Optional[int]) -> float:
+    """Rough wall time for executing a plan."""
+    params = plan['params']
+    names = _encoder_names(params)
+    lossy = sum(1 for name in names if not ENCODERS[name][2])
+    encode = 0.0
+    for conversion in plan['conversions']:
+        megabytes = conversion['size'] / (1024 * 1024)
+        seconds = sum(megabytes / _ENCODE_MB_PER_SECOND[name] for name in names)
+        if params.get('widths'):
+            seconds *= 1.25
+        if 'target_ssim' in params:
+            seconds += lossy * _QUALITY_SEARCH_SECONDS
+        encode += seconds
+    
+    parallel = max(1, min(workers or os.cpu_count() or 1, len(plan['conversions'])))
+    return encode / parallel + plan['rewrite_bytes'] / (1024 * 1024) / _REWRITE_MB_PER_SECOND
+
+@hot_path('discovery')
+def plan_images(image_directories: List[str], source_base_dir: str = '.', params: Optional[dict] = None, convert_to_webp: bool = True, delete_original: bool = False, update_references: bool = True, cache: Optional[Dict[str, dict]] = None, index_file: Optional[str] = None, exclude_files: Iterable[str] = (), workers: Optional[int] = 1, dedupe: bool = True) -> dict:
+    """
+    Work out every action a batch run would take without touching disk.
+    
+    Apart from duplicate detection (below) only stat() calls and the
+    reference index are used: a manifest entry counts as up to date when the source and output still have the size
+    and mtime it recorded, so touched-but-identical sources are planned
+    for conversion. Renames are simulated in order, so two names that
+    sanitize to the same file are reported as a collision just as the
+    real rename would skip them. With dedupe, images to convert that share
+    a size with another are read and hashed (unless the manifest already
+    knows their hash) - the one part of planning that reads image bytes -
+    and byte-identical copies ride along with the first one instead of
+    being encoded again.
+    
+    Args:
+        image_directories: List of directories containing images
+        source_base_dir: Base directory for source code
+        params: Encode parameters from _encode_params (default: WebP at quality 85)
+        convert_to_webp: Whether images will be converted
+        delete_original: Whether originals will be deleted after conversion
+        update_references: Whether source references will be rewritten
+        cache: Conversion manifest, or None to fall back to "output exists" checks
+        index_file: Reference index narrowing the files to rewrite (read, never written)
+        exclude_files: Files never rewritten (the pipeline's own state files)
+        workers: Conversion processes the estimate assumes (None = one per CPU core)
+        dedupe: Encode byte-identical images once
+        
+    Returns:
+        Plan dict: renames, collisions, skipped, up_to_date, conversions
+        ({'old_filename', 'original', 'source', 'output', 'size',
+        'estimated_size', 'source_hash', 'duplicates'}, where duplicates
+        holds conversions of the same bytes), hashed (sources read to find
+        duplicates), filename_mapping, source_files, rewrite_files, estimated_saving (bytes) and
+        estimated_seconds
+    """
+    params = params or _encode_params(85)
+    image_files = find_image_files(image_directories)
+    plan = {
+        'params': params,
+        'convert_to_webp': convert_to_webp,
+        'delete_original': delete_original,
+        'image_files': image_files,
+        'renames': [],
+        'collisions': [],
+        'skipped': [],
+        'up_to_date': [],
+        'conversions': [],
+        'hashed': 0,
+        'filename_mapping': {},
+        'source_files': [],
+        'rewrite_files': [],
+        'rewrite_bytes': 0,
+        'index': None,
+        'reindexed': 0,
+    }
+    
+    ratios = _size_ratios(cache)
+    suffix = ENCODERS[_encoder_names(params)[0]][0]
+    vacated, claimed, outputs = set(), set(), set()
+    for image_file in image_files:
+        old_filename = image_file.name
+        new_filename = sanitize_filename(old_filename)
+        if old_filename == new_filename and not convert_to_webp:
+            plan['skipped'].append(image_file)
+            continue
+        
+        source = image_file.parent / new_filename
+        if old_filename != new_filename:
+            # Mirror _prepare_image: an existing target blocks the rename
+            if (source in claimed or (source.exists() and source not in vacated)) and source != image_file:
+                plan['collisions'].append((image_file, source, 'rename target exists'))
+                continue
+            plan['renames'].append((image_file, source))
+            plan['filename_mapping'][old_filename] = new_filename
+            vacated.add(image_file)
+            claimed.add(source)
+        
+        if not convert_to_webp:
+            continue
+        
+        webp_path = source.parent / f"{source.stem}.webp"
+        # Stat the file that exists today; the rename keeps size and mtime
+        entry = cache.get(_cache_key(source)) if cache is not None else None
+        source_hash = _planned_source_hash(entry, image_file) if cache is not None else None
+        if source_hash is not None and _is_planned_hit(entry, webp_path, params):
+            plan['up_to_date'].append((source, Path(entry['output'])))
+            continue
+        if cache is None:
+            existing = [path for path in _output_candidates(webp_path, params) if path.exists()]
+            if existing:
+                plan['up_to_date'].append((source, existing[0]))
+                continue
+        if webp_path in outputs:
+            plan['collisions'].append((image_file, webp_path, 'output already planned'))
+            continue
+        outputs.add(webp_path)
+        
+        size = os.stat(image_file).st_size
+        plan['conversions'].append({
+            'old_filename': old_filename,
+            'original': image_file,
+            'source': source,
+            'output': webp_path,
+            'size': size,
+            'estimated_size': round(size * ratios.get(source.suffix.lower(), 1.0)),
+            'source_hash': source_hash,
+            'duplicates': [],
+        })
+        plan['filename_mapping'][old_filename] = f"{source.stem}{suffix}"
+    
+    if dedupe and len(plan['conversions']) > 1:
+        hashes = {c['original']: c['source_hash'] for c in plan['conversions'] if c['source_hash']}
+        by_original = {c['original']: c for c in plan['conversions']}
+        shared_names = _shared_names(image_files)
+        merged = set()
+        known = len(hashes)
+        duplicate_groups = find_duplicate_images(list(by_original), hashes)
+        plan['hashed'] = len(hashes) - known
+        for canonical, copies in duplicate_groups.items():
+            conversion = by_original[canonical]
+            for path in copies:
+                duplicate = by_original[path]
+                duplicate['source_hash'] = hashes[path]
+                duplicate['merge'] = _can_merge(duplicate['source'], conversion['source'], duplicate['old_filename'], shared_names)
+                conversion['duplicates'].append(duplicate)
+                if duplicate['merge']:
+                    plan['filename_mapping'][duplicate['old_filename']] = plan['filename_mapping'][conversion['old_filename']]
+                merged.add(path)
+        plan['conversions'] = [c for c in plan['conversions'] if c['original'] not in merged]
+    
+    if update_references and plan['filename_mapping']:
+        excluded = {os.path.abspath(f) for f in exclude_files if f}
+        source_files = [f for f in find_source_files(source_base_dir) if os.path.abspath(f) not in excluded]
+        plan['source_files'] = source_files
+        if index_file:
+            # Refreshed in memory only; execute_image_plan saves it after rewriting
+            plan['index'] = load_reference_index(index_file)
+            plan['reindexed'] = refresh_reference_index(plan['index'], source_files)
+            plan['rewrite_files'] = find_referencing_files(plan['index'], plan['filename_mapping'])
+            plan['rewrite_bytes'] = sum(plan['index'][_cache_key(f)]['size'] for f in plan['rewrite_files'])
+        else:
+            plan['rewrite_files'] = source_files
+            plan['rewrite_bytes'] = sum(os.stat(f).st_size for f in source_files)
+    
+    # A duplicate costs no new bytes: it reuses (or hard-links) the first copy's output
+    plan['estimated_saving'] = sum(c['size'] - c['estimated_size'] + sum(d['size'] for d in c['duplicates']) for c in plan['conversions'])
+    plan['estimated_seconds'] = _estimate_seconds(plan, workers)
+    return plan
+
+def _format_bytes(size: float) -> str:
+    """Human-readable byte count (KB/MB)."""
+    if abs(size) >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f}MB"
+    return f"{size / 1024:.1f}KB"
+
+def print_image_plan(plan: dict, details: bool = True) -> None:
+    """
+    Print a plan from plan_images.
+    
+    Args:
+        plan: Plan dict from plan_images
+        details: List every action, not just the totals
+    """
+    print(f"📁 Found {len(plan['image_files'])} image files\n")
+    if details:
+        for old_path, new_path in plan['renames']:
+            print(f"   rename   {old_path} -> {new_path.name}")
+        for image_file, target, reason in plan['collisions']:
+            print(f"   ⚠️  skip   {image_file} ({reason}: {target.name})")
+        for source, output in plan['up_to_date']:
+            print(f"   current  {source} -> {output.name}")
+        suffixes = '|'.join(dict.fromkeys(ENCODERS[name][0].lstrip('.') for name in _encoder_names(plan['params'])))
+        for conversion in plan['conversions']:
+            print(f"   convert  {conversion['source']} -> {conversion['output'].stem}.{suffixes} "
+                  f"(~{_format_bytes(conversion['size'])} -> {_format_bytes(conversion['estimated_size'])})")
+            for duplicate in conversion['duplicates']:
+                how = 'merged' if duplicate['merge'] else 'linked'
+                print(f"   dedupe   {duplicate['original']} = {conversion['original'].name} ({how})")
+        for source_file in plan['rewrite_files'] if plan['index'] is not None else []:
+            print(f"   rewrite  {source_file}")
         print()
-    else:
-        update_stats = {'files_modified': 0, 'total_replacements': 0}
     
-    # Print final summary
+    total_size = sum(c['size'] for c in plan['conversions'])
+    print("📋 PLAN:")
+    print(f"   Renames:         {len(plan['renames'])}")
+    print(f"   Collisions:      {len(plan['collisions'])}")
+    print(f"   Up to date:      {len(plan['up_to_date'])}")
+    print(f"   Conversions:     {len(plan['conversions'])} ({_format_bytes(total_size)} of sources)")
+    duplicates = sum(len(c['duplicates']) for c in plan['conversions'])
+    if plan['hashed']:
+        print(f"   Hashed:          {plan['hashed']} same-size sources (read to find duplicates)")
+    if duplicates:
+        print(f"   Duplicates:      {duplicates} (reuse an identical image's output)")
+    if plan['delete_original'] and plan['conversions']:
+        # Duplicates' originals go too, once their output is reused
+        print(f"   Deletions:       {len(plan['conversions']) + duplicates} originals")
+    print(f"   Expected saving: ~{_format_bytes(plan['estimated_saving'])}")
+    if plan['source_files']:
+        print(f"   Source files:    {len(plan['rewrite_files'])} of {len(plan['source_files'])} to check for references")
+    print(f"   Estimated time:  ~{plan['estimated_seconds']:.1f}s")
+
+def execute_image_plan(plan: dict, workers: Optional[int] = 1, cache: Optional[Dict[str, dict]] = None, variant_manifest: Optional[Dict[str, dict]] = None, index_file: Optional[str] = None) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Carry out a plan from plan_images.
+    
+    Renames run serially in plan order, the planned conversions are then
+    encoded across a process pool (duplicates reuse their first copy's
+    output), and only the planned source files are rewritten. A rename whose target appeared after planning is skipped
+    along with its conversion.
+    
+    Args:
+        plan: Plan dict from plan_images
+        workers: Number of conversion processes (1 = in-process, None = one per CPU core)
+        cache: Conversion manifest the plan was made with (updated in place)
+        variant_manifest: Variant manifest from load_variant_manifest (updated in place)
+        index_file: Where to save the plan's refreshed reference index
+        
+    Returns:
+        Tuple of (rename/convert stats, reference update stats)
+    """
+    run = _new_image_run(plan['params'], plan['convert_to_webp'], plan['delete_original'], cache, variant_manifest)
+    stats = run['stats']
+    filename_mapping = run['filename_mapping']
+    
+    for image_file in plan['skipped']:
+        print(f"Skipped (already clean): {image_file.name}")
+        stats['skipped'] += 1
+    for image_file, target, reason in plan['collisions']:
+        print(f"⚠️  Skipped {image_file.name}: {reason} ({target.name})")
+        stats['skipped'] += 1
+    for source, output in plan['up_to_date']:
+        print(f"→ Output up to date: {output.name}")
+    
+    with stage('rename_and_convert', 'images'):
+        failed = set()
+        for old_path, new_path in plan['renames']:
+            try:
+                if new_path.exists() and new_path != old_path:
+                    raise FileExistsError(f"target appeared since planning: {new_path.name}")
+                atomic_io.rename(old_path, new_path)
+            except Exception as e:
+                failed.add(new_path)
+                stats['failed'] += 1
+                print(f"✗ Failed to rename {old_path.name}: {str(e)}")
+                continue
+            filename_mapping[old_path.name] = new_path.name
+            print(f"Renamed: {old_path.name} -> {new_path.name}")
+            stats['renamed'] += 1
+        
+        conversions = [c for c in plan['conversions'] if c['source'] not in failed]
+        duplicates = {
+            c['source']: [(d['old_filename'], d['source'], d['output'], d['source_hash'], d['merge']) for d in c['duplicates'] if d['source'] not in failed]
+            for c in conversions if c['duplicates']
+        }
+        
+        def jobs() -> Iterator[Tuple]:
+            # Hashes the plan could not take from the manifest are computed
+            # here, overlapping with the encodes already in flight
+            for idx, conversion in enumerate(conversions, 1):
+                source_hash = conversion['source_hash']
+                if cache is not None and source_hash is None:
+                    source_hash = file_digest(conversion['source'])
+                yield (f"[{idx}/{len(conversions)}]", conversion['old_filename'], conversion['source'], conversion['output'], source_hash)
+        
+        with _conversions(jobs(), plan['params'], workers) as results:
+            for job, result, error in results:
+                placed = _finish_conversion(job, result, error, run)
+                if job[2] in duplicates:
+                    _finish_duplicates(result if placed else None, duplicates[job[2]], run)
+    
+    update_stats = {'files_modified': 0, 'total_replacements': 0}
+    if plan['rewrite_files'] and filename_mapping:
+        print("\n📝 Updating source code references...")
+        with stage('reference_rewrite', 'references'):
+            update_stats = update_source_references(plan['rewrite_files'], filename_mapping)
+    if plan['index'] is not None and index_file:
+        with stage('reference_index', 'references'):
+            refresh_reference_index(plan['index'], plan['rewrite_files'], prune=False)
+            save_reference_index(plan['index'], index_file)
+    
+    return stats, update_stats
+
+def _print_image_summary(rename_stats: Dict[str, int], update_stats: Dict[str, int]) -> None:
+    """Print the final summary block."""
     print("\n" + "="*80)
     print("PROCESSING COMPLETE")
     print("="*80)
     print(f"Images renamed:          {rename_stats['renamed']}")
     print(f"Images converted:        {rename_stats['converted']}")
+    print(f"Images deduplicated:     {rename_stats['deduplicated']}")
     print(f"Images skipped:          {rename_stats['skipped']}")
     print(f"Images failed:           {rename_stats['failed']}")
     print(f"Source files modified:   {update_stats['files_modified']}")
     print(f"Total replacements:      {update_stats['total_replacements']}")
     print("="*80)
 
-if __name__ == "__main__":
-    """
-    Main execution block - configure your settings here
-    """
-    
-    # ==================== CONFIGURATION ====================
-    
+# ------------------------------------------------------------------------
+# Command line
+# ------------------------------------------------------------------------
+# The single source of the default image settings, shared by this script's
+# command line and the `images` / `all` commands and menu in generate_rules.py.
+
+DEFAULT_IMAGE_SETTINGS = {
     # Directories containing images to process
-    IMAGE_DIRECTORIES = [
+    'image_directories': [
         './public/assets/images',
         './public/assets/images/brands',
         './public/assets/images/portfolio',
         './public/assets/images/services',
-        # Add more directories as needed
-    ]
-    
+    ],
     # Base directory for source code (where to search for references)
-    SOURCE_BASE_DIR = '.'
-    
+    'source_base_dir': '.',
     # WebP conversion quality (1-100, recommended: 85)
-    QUALITY = 85
-    
+    'quality': 85,
     # Convert images to WebP format
-    CONVERT_TO_WEBP = True
-    
+    'convert_to_webp': True,
     # Delete original files after successful conversion
-    DELETE_ORIGINAL = True
-    
+    'delete_original': True,
     # Update references in source code files
-    UPDATE_REFERENCES = True
-    
-    # =======================================================
+    'update_references': True,
+    # Parallel conversion processes (1 = serial, None = one per CPU core)
+    'workers': None,
+    # Overlap discovery, encoding and reference updates (with a crash-safe journal)
+    'streaming': False,
+    # Extra srcset widths written next to each WebP, e.g. [320, 640, 1024, 1920]
+    # (None = full size only; opt in with --widths)
+    'variant_widths': None,
+    # Output formats: ['webp'], or several (e.g. ['webp', 'webp-lossless', 'avif'])
+    # to keep the smallest file that stays above min_psnr
+    'formats': ['webp'],
+    'min_psnr': 40.0,
+    # Pick the lowest quality per image (up to quality) that reaches this SSIM
+    # (None = always use quality; 0.97 suits most photos and graphics)
+    'target_ssim': None,
+    # Downscale anything larger than this on its longest side, e.g. 2560
+    # (None = keep size; opt in with --max-dimension, as originals are deleted)
+    'max_dimension': None,
+    # Encode byte-identical images once (same folder: references merged onto one file)
+    'dedupe': True,
+    # Only report what would happen
+    'dry_run': False,
+}
+
+def add_image_arguments(parser) -> None:
+    """Add the image processing flags (defaults from DEFAULT_IMAGE_SETTINGS) to an argparse parser."""
+    defaults = DEFAULT_IMAGE_SETTINGS
+    group = parser.add_argument_group('image processing')
+    group.add_argument('--dir', dest='image_directories', action='append', metavar='DIR',
+                       help='Image directory to process (repeatable; default: the public/assets/images folders)')
+    group.add_argument('--source-dir', dest='source_base_dir', default=defaults['source_base_dir'], metavar='DIR',
+                       help='Base directory searched for image references (default: %(default)s)')
+    group.add_argument('-q', '--quality', type=int, default=defaults['quality'],
+                       help='Encode quality 1-100 (default: %(default)s)')
+    group.add_argument('-j', '--workers', type=int, default=defaults['workers'],
+                       help='Conversion processes (default: one per CPU core)')
+    group.add_argument('--webp', dest='convert_to_webp', action=argparse.BooleanOptionalAction, default=defaults['convert_to_webp'],
+                       help='Convert images (default: %(default)s)')
+    group.add_argument('--delete-original', action=argparse.BooleanOptionalAction, default=defaults['delete_original'],
+                       help='Delete originals after conversion (default: %(default)s)')
+    group.add_argument('--update-references', action=argparse.BooleanOptionalAction, default=defaults['update_references'],
+                       help='Rewrite references in source files (default: %(default)s)')
+    group.add_argument('--streaming', action=argparse.BooleanOptionalAction, default=defaults['streaming'],
+                       help='Run the stages concurrently with a crash-safe journal (default: %(default)s)')
+    group.add_argument('--widths', dest='variant_widths', type=int, nargs='*', default=defaults['variant_widths'], metavar='PX',
+                       help='Responsive variant widths, e.g. --widths 320 640 1024 1920 (default: off)')
+    group.add_argument('--formats', nargs='+', choices=list(ENCODERS), default=defaults['formats'],
+                       help='Output formats; several = smallest acceptable wins (default: %(default)s)')
+    group.add_argument('--min-psnr', type=float, default=defaults['min_psnr'],
+                       help='Quality threshold in dB for lossy candidates (default: %(default)s)')
+    group.add_argument('--target-ssim', type=float, default=defaults['target_ssim'],
+                       help='Search per-image quality for this SSIM, e.g. 0.97 (default: off)')
+    group.add_argument('--max-dimension', type=int, default=defaults['max_dimension'], metavar='PX',
+                       help='Downscale sources larger than this, e.g. 2560; 0 keeps the full size (default: off)')
+    group.add_argument('--dedupe', action=argparse.BooleanOptionalAction, default=defaults['dedupe'],
+                       help='Encode byte-identical images once (default: %(default)s)')
+    group.add_argument('-n', '--dry-run', action='store_true', default=defaults['dry_run'],
+                       help='Print the full rename/convert/rewrite plan and time estimate without changing anything')
+
+def image_settings_from_args(args) -> dict:
+    """Turn parsed image flags into keyword arguments for process_images."""
+    settings = {key: getattr(args, key) for key in DEFAULT_IMAGE_SETTINGS}
+    settings['image_directories'] = settings['image_directories'] or list(DEFAULT_IMAGE_SETTINGS['image_directories'])
+    settings['variant_widths'] = settings['variant_widths'] or None
+    settings['max_dimension'] = settings['max_dimension'] or None
+    if settings['workers'] == 0:
+        settings['workers'] = None
+    if getattr(args, 'profile', None):
+        # The profiler only sees this process: encode in-process
+        settings['workers'] = 1
+    return settings
+
+def print_image_settings(settings: dict) -> None:
+    """Print the configuration block shown before a run."""
+    print("📋 CONFIGURATION:")
+    print(f"   Image directories: {settings['image_directories']}")
+    print(f"   Source base: {settings['source_base_dir']}")
+    print(f"   WebP quality: {settings['quality']}")
+    print(f"   Convert to WebP: {settings['convert_to_webp']}")
+    print(f"   Delete originals: {settings['delete_original']}")
+    print(f"   Update references: {settings['update_references']}")
+    print(f"   Workers: {settings['workers'] or os.cpu_count()}")
+    print(f"   Streaming: {settings['streaming']}")
+    print(f"   Variant widths: {settings['variant_widths'] or 'off'}")
+    formats = settings['formats']
+    print(f"   Formats: {formats}" + (f" (smallest wins, min PSNR {settings['min_psnr']} dB)" if len(formats) > 1 else ""))
+    print(f"   Target SSIM: {settings['target_ssim'] or 'off'}")
+    print(f"   Max dimension: {settings['max_dimension'] or 'off'}")
+    print(f"   Deduplicate: {settings['dedupe']}")
+    if settings['dry_run']:
+        print("   Dry run: nothing will be changed")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rename images, convert them to WebP/AVIF and update source references.")
+    add_image_arguments(parser)
+    instrumentation.add_metrics_arguments(parser)
+    args = parser.parse_args()
+    settings = image_settings_from_args(args)
     
-    print("\n📋 CONFIGURATION:")
-    print(f"   Image directories: {IMAGE_DIRECTORIES}")
-    print(f"   Source base: {SOURCE_BASE_DIR}")
-    print(f"   WebP quality: {QUALITY}")
-    print(f"   Convert to WebP: {CONVERT_TO_WEBP}")
-    print(f"   Delete originals: {DELETE_ORIGINAL}")
-    print(f"   Update references: {UPDATE_REFERENCES}")
+    print()
+    print_image_settings(settings)
     print("\n" + "="*80)
     
-    input("\n⚠️  Press ENTER to start processing (or Ctrl+C to cancel)...")
+    # Without flags this is the interactive script it always was; any flag means headless
+    if len(sys.argv) == 1:
+        input("\n⚠️  Press ENTER to start processing (or Ctrl+C to cancel)...")
     print()
     
-    # Run the main processing function
-    process_images(
-        image_directories=IMAGE_DIRECTORIES,
-        source_base_dir=SOURCE_BASE_DIR,
-        quality=QUALITY,
-        convert_to_webp=CONVERT_TO_WEBP,
-        delete_original=DELETE_ORIGINAL,
-        update_references=UPDATE_REFERENCES
-    )
-
+    instrumentation.start_from_args(args)
+    with instrumentation.profile_from_args(args, 'images'):
+        stats = process_images(**settings)
+    instrumentation.finish_from_args(args)
+    sys.exit(1 if stats['failed'] else 0)
@@ -1,16 +1,17 @@
-import yaml
 import os
 import json
 import re
+import sys
+import argparse
+import time
 import shutil
-from pathlib import Path
-from typing import List, Dict, Tuple
-try:
-    from PIL import Image
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
-    print("⚠️  Warning: PIL (Pillow) not installed. Image conversion features will be disabled.")
+import hashlib
+from collections.abc import Mapping
+from contextlib import nullcontext
+from types import MappingProxyType
+
+import atomic_io
+from instrumentation import stage, add_bytes, hot_path
 
 # -----------------------------
 # Paths
@@ -23,64 +24,101 @@ templates_folder = os.path.join(script_dir, ".cursor/templates/")
 # -----------------------------
 # Load business YAML
 # -----------------------------
-try:
-    with open(business_file, "r", encoding="utf-8") as f:
-        business = yaml.safe_load(f)
-    print(f"✅ Loaded business data from {business_file}")
-except FileNotFoundError:
-    print(f"❌ Error: {business_file} not found!")
-    exit(1)
-except Exception as e:
-    print(f"❌ Error loading {business_file}: {e}")
-    exit(1)
+# Nothing is read at import time: callers ask for the data explicitly, and
+# repeated loads of an unchanged file come from memory.
+
+# path -> ((mtime_ns, size), data)
+_loaded_business = {}
+
+def load_business(path=None):
+    """Parse business.yaml (or another business file), cached until the file changes
+
+    Unchanged files come from memory within a process and from the shared
+    parsed-data cache (yaml_cache.py) across runs.
+
+    Raises:
+        FileNotFoundError if the file is missing, yaml.YAMLError if it is invalid
+    """
+    from yaml_cache import load_yaml
+
+    path = path or business_file
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _loaded_business.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    with stage("yaml_load", "yaml"):
+        data = load_yaml(path)
+    _loaded_business[path] = (signature, data)
+    return data
+
+# path -> BusinessModel of the currently loaded data
+_business_models = {}
+
+def load_business_model(path=None):
+    """The BusinessModel for a business file, rebuilt only when the file is reloaded"""
+    path = path or business_file
+    data = load_business(path)
+    model = _business_models.get(path)
+    if model is None or model.source is not data:
+        model = BusinessModel(data)
+        _business_models[path] = model
+    return model
+
+# Image helpers re-exported from extract_images.py for existing callers;
+# resolved on first use so importing this module never pulls in Pillow
+_IMAGE_EXPORTS = (
+    "PIL_AVAILABLE",
+    "sanitize_filename",
+    "find_image_files",
+    "find_source_files",
+    "update_source_references",
+    "convert_image_to_webp",
+    "rename_and_convert_images",
+    "process_images",
+    "DEFAULT_IMAGE_SETTINGS",
+    "add_image_arguments",
+    "image_settings_from_args",
+    "print_image_settings",
+)
+
+def __getattr__(name):
+    """Lazy module attributes: `business` and the re-exported image helpers"""
+    if name == "business":
+        return load_business()
+    if name in _IMAGE_EXPORTS:
+        import extract_images
+        return getattr(extract_images, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # -----------------------------
 # Helper functions
 # -----------------------------
+def location_label(location):
+    """CITY-STATE label for a location dict; other values as strings"""
+    if isinstance(location, dict):
+        city = location.get('CITY', '')
+        state = location.get('STATE', '')
+        if city and state:
+            return f"{city}-{state}"
+        if city or state:
+            return city or state
+    return str(location)
+
+@hot_path("template")
 def render_value(value, placeholder=None):
     """Converts YAML values to string for template replacement"""
-    if isinstance(value, list):
+    if isinstance(value, (list, tuple)):
         # JSON array for *_ARRAY or when used in JSON context
         if placeholder and (placeholder.endswith("_ARRAY") or placeholder in ["BLOG_TOPICS", "SERVICES", "LOCATIONS"]):
             return json.dumps(value, indent=2)
-        # Markdown list for *_MD
+        # Markdown list for *_MD (location dictionaries as CITY-STATE)
         elif placeholder and placeholder.endswith("_MD"):
-            # Handle both string and dict items safely
-            items = []
-            for item in value:
-                if isinstance(item, dict):
-                    # For location dictionaries, format as CITY-STATE
-                    if 'CITY' in item or 'STATE' in item:
-                        city = item.get('CITY', '')
-                        state = item.get('STATE', '')
-                        if city and state:
-                            items.append(f"{city}-{state}")
-                        elif city:
-                            items.append(city)
-                        elif state:
-                            items.append(state)
-                        else:
-                            items.append(str(item))
-                    else:
-                        items.append(str(item))
-                else:
-                    items.append(str(item))
-            return "\n- " + "\n- ".join(items)
+            return "\n- " + "\n- ".join(location_label(item) for item in value)
         # Simple comma list otherwise
         elif all(isinstance(i, dict) for i in value):
-            items = []
-            for i in value:
-                city = i.get('CITY', '')
-                state = i.get('STATE', '')
-                if city and state:
-                    items.append(f"{city}-{state}")
-                elif city:
-                    items.append(city)
-                elif state:
-                    items.append(state)
-                else:
-                    items.append(str(i))
-            return ", ".join(items)
+            return ", ".join(location_label(i) for i in value)
         else:
             # Handle mixed types safely
             return ", ".join(str(i) for i in value)
@@ -104,14 +142,165 @@ def get_nested_value(data, key_path):
     keys = key_path.split('.')
     value = data
     for key in keys:
-        if isinstance(value, dict) and key in value:
+        if isinstance(value, Mapping) and key in value:
             value = value[key]
         else:
             return None
     return value
 
+# -----------------------------
+# Business model
+# -----------------------------
+# One read-only model per loaded business file. Values derived from several
+# keys are computed on first use and shared by the templates and every
+# data generator, instead of each of them working them out again.
+
+def derived(compute):
+    """Declare a memoized BusinessModel value computed from the model"""
+    name = compute.__name__
+    return property(lambda self: self._derive(name, compute), doc=compute.__doc__)
+
+class BusinessModel(Mapping):
+    """Read-only business data plus lazily derived, memoized values
+
+    A tracked() view shares the memoized values but records every
+    business.yaml key it reads - including the keys behind derived values -
+    so incremental builds know what each output depends on.
+    """
+    __slots__ = ('source', '_memo', 'keys_read')
+
+    def __init__(self, data, memo=None, keys_read=None):
+        self.source = data
+        self._memo = {} if memo is None else memo
+        self.keys_read = keys_read
+
+    def tracked(self):
+        """View of the same model that records which keys are read"""
+        return BusinessModel(self.source, self._memo, set())
+
+    def _note(self, keys):
+        if self.keys_read is not None:
+            self.keys_read.update(keys)
+
+    def _derive(self, name, compute):
+        if name not in self._memo:
+            view = self.tracked()
+            self._memo[name] = (compute(view), frozenset(view.keys_read))
+        value, keys = self._memo[name]
+        self._note(keys)
+        return value
+
+    def __getitem__(self, key):
+        self._note((key,))
+        return self.source[key]
+
+    def __contains__(self, key):
+        self._note((key,))
+        return key in self.source
+
+    def get(self, key, default=None):
+        self._note((key,))
+        return self.source.get(key, default)
+
+    # Whole-document access depends on every key
+    def __iter__(self):
+        self._note(('*',))
+        return iter(self.source)
+
+    def __len__(self):
+        self._note(('*',))
+        return len(self.source)
+
+    @derived
+    def location_labels(data):
+        """LOCATIONS as CITY-STATE labels"""
+        return tuple(location_label(loc) for loc in data.get('LOCATIONS', []))
+
+    @derived
+    def location_names(data):
+        """LOCATIONS as "City, State" strings"""
+        names = []
+        for loc in data.get('LOCATIONS', []):
+            if isinstance(loc, dict):
+                name = ', '.join(part for part in (loc.get('CITY', ''), loc.get('STATE', '')) if part)
+                if name:
+                    names.append(name)
+            else:
+                names.append(str(loc))
+        return tuple(names)
+
+    @derived
+    def area_served(data):
+        """AREA_SERVED, or every location name"""
+        return data.get('AREA_SERVED', ', '.join(data.location_names))
+
+    @derived
+    def service_names(data):
+        """SERVICES as names (hierarchical entries use their NAME)"""
+        return tuple(s.get('NAME', '') if isinstance(s, dict) else s for s in data.get('SERVICES', []))
+
+    @derived
+    def service_urls(data):
+        """Service page URLs, from the flattened lists if available or built from SERVICES"""
+        if 'CORE_SERVICES_URLS' in data:
+            return data['CORE_SERVICES_URLS']
+        if 'SERVICES_URLS' in data:
+            return data['SERVICES_URLS']
+        services = data.get('SERVICES', [])
+        if services and isinstance(services[0], dict):
+            return tuple(s.get('URL', '') for s in services)
+        return tuple(f"/{service.lower().replace(' ', '-').replace('(', '').replace(')', '').replace('&', 'and')}/" for service in services)
+
+    @derived
+    def blog_links(data):
+        """Blog post URLs for BLOG_TOPICS"""
+        return tuple(f"/our-blog/{topic.lower().replace(' ', '-').replace(',', '').replace('&', 'and')}/" for topic in data.get('BLOG_TOPICS', []))
+
+    @derived
+    def contact_phone(data):
+        """CONTACT phone (PHONE or phone)"""
+        contact = data.get('CONTACT', {})
+        return contact.get('PHONE', contact.get('phone', ''))
+
+    @derived
+    def contact_email(data):
+        """CONTACT email (EMAIL or email)"""
+        contact = data.get('CONTACT', {})
+        return contact.get('EMAIL', contact.get('email', ''))
+
+    @derived
+    def social_urls(data):
+        """SOCIAL_MEDIA platform -> profile URL, for platforms with a URL"""
+        return MappingProxyType({
+            platform: entry['URL']
+            for platform, entry in data.get('SOCIAL_MEDIA', {}).items()
+            if isinstance(entry, dict) and entry.get('URL')
+        })
+
+    @derived
+    def social_profiles(data):
+        """Every social profile URL (dict entries' URL or plain strings)"""
+        return tuple(
+            entry['URL'] if isinstance(entry, dict) else entry
+            for entry in data.get('SOCIAL_MEDIA', {}).values()
+            if (isinstance(entry, dict) and entry.get('URL')) or (isinstance(entry, str) and entry)
+        )
+
+    @derived
+    def placeholders(data):
+        """Derived template placeholders (see create_missing_placeholders)"""
+        return MappingProxyType(create_missing_placeholders(data))
+
+def as_business_model(business_data):
+    """Wrap plain business data in a BusinessModel (models pass through)"""
+    if isinstance(business_data, BusinessModel):
+        return business_data
+    return BusinessModel(business_data)
+
+@hot_path("derive")
 def create_missing_placeholders(business_data):
     """Create missing placeholders from existing data"""
+    business_data = as_business_model(business_data)
     placeholders = {}
     
     # Map existing data to expected placeholders
@@ -123,7 +312,7 @@ def create_missing_placeholders(business_data):
     if 'LOCATIONS_MD' in business_data:
         placeholders['LOCATIONS_MD'] = render_value(business_data['LOCATIONS_MD'], 'LOCATIONS_MD')
     else:
-        placeholders['LOCATIONS_MD'] = render_value(business_data.get('LOCATIONS', []), 'LOCATIONS_MD')
+        placeholders['LOCATIONS_MD'] = render_value(business_data.location_labels, 'LOCATIONS_MD')
     
     # Handle services - use flattened lists if available
     # Check for CORE_SERVICES (new hierarchical structure)
@@ -133,17 +322,8 @@ def create_missing_placeholders(business_data):
     elif 'SERVICES_MD' in business_data:
         placeholders['SERVICES_MD'] = render_value(business_data['SERVICES_MD'], 'SERVICES_MD')
     else:
-        # Handle old format (list of strings) or new format (list of dicts)
-        services = business_data.get('SERVICES', [])
-        if services and isinstance(services[0], dict):
-            # New hierarchical format - extract service names
-            service_names = [s.get('NAME', '') for s in services]
-            placeholders['SERVICES_MD'] = render_value(service_names, 'SERVICES_MD')
-            placeholders['SERVICES'] = service_names
-        else:
-            # Old format - simple list
-            placeholders['SERVICES_MD'] = render_value(services, 'SERVICES_MD')
-            placeholders['SERVICES'] = services
+        placeholders['SERVICES_MD'] = render_value(business_data.service_names, 'SERVICES_MD')
+        placeholders['SERVICES'] = business_data.service_names
     
     placeholders['CTA_TEXT'] = business_data.get('CTA_TEXT', 'Na kontaktoni sot për një konsultim falas!')
     
@@ -160,37 +340,13 @@ def create_missing_placeholders(business_data):
     placeholders['PAGE_URL_SLUG'] = business_data.get('PAGE_URL_SLUG', '')
     placeholders['PAGE_CONTENT'] = business_data.get('PAGE_CONTENT', '')
     
-    # Create service URLs - use flattened URLs if available
-    if 'CORE_SERVICES_URLS' in business_data:
-        service_urls = business_data['CORE_SERVICES_URLS']
-        placeholders['SERVICES_URLS'] = service_urls
-        placeholders['SERVICES_URLS_MD'] = render_value(service_urls, 'SERVICES_URLS_MD')
-    elif 'SERVICES_URLS' in business_data:
-        service_urls = business_data['SERVICES_URLS']
-        placeholders['SERVICES_URLS'] = service_urls
-        placeholders['SERVICES_URLS_MD'] = render_value(service_urls, 'SERVICES_URLS_MD')
-    else:
-        # Generate from SERVICES
-        services = business_data.get('SERVICES', [])
-        if services and isinstance(services[0], dict):
-            # New hierarchical format - extract URLs
-            service_urls = [s.get('URL', '') for s in services]
-        else:
-            # Old format - generate from service names
-            service_urls = [f"/{service.lower().replace(' ', '-').replace('(', '').replace(')', '').replace('&', 'and')}/" for service in services]
-        placeholders['SERVICES_URLS'] = service_urls
-        placeholders['SERVICES_URLS_MD'] = render_value(service_urls, 'SERVICES_URLS_MD')
-    
-    # Create blog links
-    blog_topics = business_data.get('BLOG_TOPICS', [])
-    blog_links = [f"/our-blog/{topic.lower().replace(' ', '-').replace(',', '').replace('&', 'and')}/" for topic in blog_topics]
-    placeholders['BLOG_LINKS_MD'] = render_value(blog_links, 'BLOG_LINKS_MD')
+    # Service and blog URLs
+    placeholders['SERVICES_URLS'] = business_data.service_urls
+    placeholders['SERVICES_URLS_MD'] = render_value(business_data.service_urls, 'SERVICES_URLS_MD')
+    placeholders['BLOG_LINKS_MD'] = render_value(business_data.blog_links, 'BLOG_LINKS_MD')
     
     # Contact info - handle both uppercase and lowercase keys
-    contact = business_data.get('CONTACT', {})
-    phone = contact.get('PHONE', contact.get('phone', ''))
-    email = contact.get('EMAIL', contact.get('email', ''))
-    placeholders['CONTACT_MD'] = business_data.get('CONTACT_MD', f"Phone: {phone} | Email: {email}")
+    placeholders['CONTACT_MD'] = business_data.get('CONTACT_MD', f"Phone: {business_data.contact_phone} | Email: {business_data.contact_email}")
     
     # Arrays for schema
     placeholders['LOCATIONS_ARRAY'] = business_data.get('LOCATIONS_ARRAY', business_data.get('LOCATIONS', []))
@@ -201,59 +357,266 @@ def create_missing_placeholders(business_data):
     elif 'SERVICES_ARRAY' in business_data:
         placeholders['SERVICES_ARRAY'] = business_data['SERVICES_ARRAY']
     else:
-        services = business_data.get('SERVICES', [])
-        if services and isinstance(services[0], dict):
-            # Extract service names from hierarchical structure
-            service_names = [s.get('NAME', '') for s in services]
-            placeholders['SERVICES_ARRAY'] = service_names
-        else:
-            placeholders['SERVICES_ARRAY'] = services
+        placeholders['SERVICES_ARRAY'] = business_data.service_names
     
     # Social media profiles
-    social_media = business_data.get('SOCIAL_MEDIA', {})
-    social_profiles = []
-    for platform, data in social_media.items():
-        if isinstance(data, dict) and data.get('URL'):
-            social_profiles.append(data['URL'])
-        elif isinstance(data, str) and data:
-            social_profiles.append(data)
-    placeholders['SOCIAL_PROFILES_ARRAY'] = business_data.get('SOCIAL_PROFILES_ARRAY', social_profiles)
+    placeholders['SOCIAL_PROFILES_ARRAY'] = business_data.get('SOCIAL_PROFILES_ARRAY', business_data.social_profiles)
     
     # Area served and language
-    locations = business_data.get('LOCATIONS', [])
-    if locations and isinstance(locations[0], dict):
-        # Handle dictionary locations (CITY-STATE format)
-        area_served = []
-        for loc in locations:
-            city = loc.get('CITY', '')
-            state = loc.get('STATE', '')
-            if city and state:
-                area_served.append(f"{city}, {state}")
-            elif city:
-                area_served.append(city)
-            elif state:
-                area_served.append(state)
-        placeholders['AREA_SERVED'] = business_data.get('AREA_SERVED', ', '.join(area_served))
-    else:
-        placeholders['AREA_SERVED'] = business_data.get('AREA_SERVED', ', '.join(str(loc) for loc in locations))
-    
+    placeholders['AREA_SERVED'] = business_data.area_served
     placeholders['AVAILABLE_LANGUAGE'] = business_data.get('AVAILABLE_LANGUAGE', 'English')
     
     return placeholders
 
+# -----------------------------
+# Template engine
+# -----------------------------
+PLACEHOLDER_PATTERN = re.compile(r"{{(.*?)}}")
+EXAMPLE_PLACEHOLDER = re.compile(r"EXAMPLE_([1-4])")
+# HTML tags, JSX expressions and JSON-like structures keep their quotes
+PROTECTED_SPAN = re.compile(r"(<[^>]*>|{[^}]*}|\[[^\]]*\])")
+
+# template path -> ((mtime_ns, size), tokens)
+_compiled_templates = {}
+
+@hot_path("template")
+def compile_template(template_path):
+    """Split a template into literal text and placeholder names, cached by mtime.
+
+    The result alternates literal segments (even indices) and placeholder
+    names (odd indices), so rendering is a single join.
+    """
+    stat = os.stat(template_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _compiled_templates.get(template_path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    with open(template_path, "r", encoding="utf-8") as f:
+        tokens = PLACEHOLDER_PATTERN.split(f.read())
+    add_bytes(read=stat.st_size)
+    _compiled_templates[template_path] = (signature, tokens)
+    return tokens
+
+@hot_path("template")
+def resolve_placeholder(ph, business_data, missing_placeholders):
+    """Render one placeholder's value, or return None if there is no data for it"""
+    # Numbered examples are inserted as-is
+    example = EXAMPLE_PLACEHOLDER.fullmatch(ph)
+    if example:
+        ex_value = business_data.get("EXAMPLES", [])
+        i = int(example.group(1))
+        return ex_value[i-1] if len(ex_value) >= i else ""
+
+    # Handle nested dictionary access (e.g., CONTACT.PHONE)
+    if '.' in ph:
+        value = get_nested_value(business_data, ph)
+        # Try lowercase version if not found
+        if value is None:
+            keys = ph.split('.')
+            if len(keys) == 2:
+                parent_key = keys[0]
+                child_key = keys[1].lower()  # Try lowercase
+                if parent_key in business_data and isinstance(business_data[parent_key], dict):
+                    value = business_data[parent_key].get(child_key)
+    else:
+        value = business_data.get(ph) or missing_placeholders.get(ph)
+
+    if value is not None:
+        return render_value(value, ph)
+    if ph == "SUPPORTING_TOPICS_MD" and "SUPPORTING_TOPICS" in business_data:
+        return render_supporting_topics(business_data["SUPPORTING_TOPICS"])
+    return None
+
+def new_placeholder_table(business_data):
+    """Build the per-run placeholder table: derived placeholders plus a cache of rendered values"""
+    model = as_business_model(business_data)
+    view = model.tracked()
+    return {
+        'business': model,
+        # A model over the read-only placeholder mapping, so each lookup can
+        # take a tracked() view of it instead of a copy
+        'missing': BusinessModel(view.placeholders),
+        'missing_keys': view.keys_read,
+        'rendered': {},
+        'dependencies': {},
+    }
+
+def _resolve_tracked(ph, table):
+    """Resolve a placeholder and note which business.yaml keys it depends on"""
+    business_view = table['business'].tracked()
+    missing_view = table['missing'].tracked()
+    value = resolve_placeholder(ph, business_view, missing_view)
+    keys = set(business_view.keys_read)
+    if missing_view.keys_read:
+        keys |= table['missing_keys']
+    return value, keys
+
+@hot_path("template")
+def render_template(tokens, table):
+    """Fill a compiled template from a placeholder table in one pass"""
+    rendered = table['rendered']
+    parts = list(tokens)
+    warned = set()
+    for i in range(1, len(parts), 2):
+        ph = parts[i]
+        if ph not in rendered:
+            rendered[ph], table['dependencies'][ph] = _resolve_tracked(ph, table)
+        value = rendered[ph]
+        if value is None:
+            if ph not in warned:
+                print(f"⚠️  Warning: Placeholder '{ph}' not found in business data")
+                warned.add(ph)
+            value = ""
+        parts[i] = value
+    return "".join(parts)
+
+def template_dependencies(tokens, table):
+    """business.yaml keys read by a rendered template's placeholders"""
+    keys = set()
+    for ph in tokens[1::2]:
+        keys |= table['dependencies'].get(ph, set())
+    return keys
+
+@hot_path("template")
+def escape_apostrophes(text):
+    """Replace ' with &apos; in text outside protected spans, in one scan
+
+    Splitting on PROTECTED_SPAN alternates plain text (even indices) and
+    protected spans (odd indices), so only the text segments are touched and
+    the result is a single join - no placeholder markers to restore.
+    """
+    parts = PROTECTED_SPAN.split(text)
+    parts[::2] = [part.replace("'", "&apos;") for part in parts[::2]]
+    return "".join(parts)
+
+# -----------------------------
+# Incremental builds
+# -----------------------------
+# Every output records the business.yaml keys and template files it read,
+# with a fingerprint of each, plus a fingerprint of the output itself.
+# An output whose inputs and bytes are unchanged is skipped on the next run.
+build_state_file = os.path.join(script_dir, ".generate-state.json")
+BUILD_STATE_VERSION = 1
+
+def fingerprint(value):
+    """Stable hash of any YAML/JSON value"""
+    encoded = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def file_fingerprint(path):
+    """Hash of a file's bytes, or None if it does not exist"""
+    try:
+        with open(atomic_io.resolve(path), "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+def key_fingerprint(business_data, key):
+    """Fingerprint of one business.yaml key (None if absent, '*' = whole file)"""
+    if key == '*':
+        return fingerprint(dict(business_data))
+    if key not in business_data:
+        return None
+    return fingerprint(business_data[key])
+
+def _relative(path, root=None):
+    return os.path.relpath(path, root or script_dir).replace(os.sep, "/")
+
+def load_build_state(path=None):
+    """Load recorded build inputs; a missing or outdated state means rebuild everything"""
+    try:
+        with open(path or build_state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") == BUILD_STATE_VERSION and state.get("generator") == file_fingerprint(__file__):
+            return state
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    # Any change to this script can change every output
+    return {"version": BUILD_STATE_VERSION, "generator": file_fingerprint(__file__), "outputs": {}}
+
+def save_build_state(state, path=None):
+    atomic_io.write_text(path or build_state_file, json.dumps(state, indent=2, sort_keys=True))
+
+def is_up_to_date(state, step, business_data, outputs, root=None):
+    """True if the step's recorded keys, templates and outputs all still match
+
+    Outputs are recorded relative to root (default: this directory);
+    templates always live next to this script.
+    """
+    root = root or script_dir
+    record = state["outputs"].get(step)
+    if not record or sorted(record["outputs"]) != sorted(_relative(p, root) for p in outputs):
+        return False
+    if any(key_fingerprint(business_data, key) != fp for key, fp in record["keys"].items()):
+        return False
+    if any(file_fingerprint(os.path.join(script_dir, path)) != fp for path, fp in record["templates"].items()):
+        return False
+    return all(file_fingerprint(os.path.join(root, path)) == fp for path, fp in record["outputs"].items())
+
+def record_build(state, step, business_data, keys, outputs, templates=(), root=None):
+    """Remember what a freshly built step read and wrote"""
+    state["outputs"][step] = {
+        "keys": {key: key_fingerprint(business_data, key) for key in sorted(keys)},
+        "templates": {_relative(p): file_fingerprint(p) for p in templates},
+        "outputs": {_relative(p, root): file_fingerprint(p) for p in outputs},
+    }
+
+def run_build_step(state, step, business_data, build, outputs, dry_run=False, root=None):
+    """Run one data generator unless its inputs are unchanged
+
+    Returns:
+        True if the generator ran (or would run, for a dry run), False if its
+        outputs were up to date
+    """
+    if state is not None and is_up_to_date(state, step, business_data, outputs, root):
+        print(f"⏭️  Up to date: {', '.join(_relative(p, root) for p in outputs)}")
+        return False
+    if dry_run:
+        print(f"📝 Would regenerate: {', '.join(_relative(p, root) for p in outputs)}")
+        return True
+    recorder = as_business_model(business_data).tracked()
+    with stage(step, "generate"):
+        build(recorder)
+    if state is not None:
+        record_build(state, step, business_data, recorder.keys_read, outputs, root=root)
+    return True
+
+@hot_path("write")
+def write_if_changed(path, content):
+    """Write text to path only if it differs from what is there; returns True if written
+
+    Leaving identical files alone keeps their mtimes, so Next.js does not
+    rebuild or hot-reload for outputs that did not really change. The write
+    itself is atomic, and staged until commit inside a transaction.
+    """
+    try:
+        with open(atomic_io.resolve(path), "r", encoding="utf-8") as f:
+            add_bytes(read=os.fstat(f.fileno()).st_size)
+            if f.read() == content:
+                return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    encoded = content.encode("utf-8")
+    atomic_io.write_bytes(path, encoded)
+    add_bytes(written=len(encoded))
+    return True
+
 
 # -----------------------------
 # Data Generation Functions
 # -----------------------------
 
-def generate_blog_posts(business_data):
+@hot_path("generate")
+def generate_blog_posts(business_data, output_root=None):
     """Generate blog-posts.json stubs from business.yaml
     
     NOTE: Blog post categories now use CORE_SERVICES as categories.
     Each blog post is assigned to a service category.
     Blog posts are accessed directly via /{slug}/ not /{category}/{slug}/
     """
-    output_path = os.path.join(script_dir, "data/blog-posts.json")
+    output_path = os.path.join(output_root or script_dir, "data/blog-posts.json")
     
     blog_topics = business_data.get('BLOG_TOPICS', [])
     business_name = business_data.get('BUSINESS_NAME', 'Our Company')
@@ -333,16 +696,20 @@ def generate_blog_posts(business_data):
         "blogPosts": blog_posts
     }
     
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(output_data, f, indent=2)
-    
-    print(f"✅ Generated: {output_path} (categories based on CORE_SERVICES, posts at /{{slug}}/)")
+    if write_if_changed(output_path, json.dumps(output_data, indent=2)):
+        print(f"✅ Generated: {output_path} (categories based on CORE_SERVICES, posts at /{{slug}}/)")
+    else:
+        print(f"⏭️  Unchanged: {output_path}")
 
-def generate_faqs(business_data):
+@hot_path("generate")
+def generate_faqs(business_data, output_root=None):
     """Generate faq.json from business.yaml"""
-    output_path = os.path.join(script_dir, "data/faq.json")
+    output_path = os.path.join(output_root or script_dir, "data/faq.json")
+    business_data = as_business_model(business_data)
     
     business_name = business_data.get('BUSINESS_NAME', 'Our Company')
+    # Raw keys, not the derived contact_*/location_* values: this file has
+    # always used its own fallbacks (no LOCATIONS or lowercase CONTACT keys)
     locations = business_data.get('LOCATIONS_ARRAY', [])
     service_areas = ', '.join(locations[:4]) if len(locations) > 4 else ', '.join(locations)
     contact = business_data.get('CONTACT', {})
@@ -390,14 +757,15 @@ def generate_faqs(business_data):
     
     output_data = {"faqs": faqs}
     
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(output_data, f, indent=2)
-    
-    print(f"✅ Generated: {output_path}")
+    if write_if_changed(output_path, json.dumps(output_data, indent=2)):
+        print(f"✅ Generated: {output_path}")
+    else:
+        print(f"⏭️  Unchanged: {output_path}")
 
-def generate_portfolio(business_data):
+@hot_path("generate")
+def generate_portfolio(business_data, output_root=None):
     """Generate portfolio.json from business.yaml"""
-    output_path = os.path.join(script_dir, "data/portfolio.json")
+    output_path = os.path.join(output_root or script_dir, "data/portfolio.json")
     
     business_name = business_data.get('BUSINESS_NAME', 'Our Company')
     locations = business_data.get('LOCATIONS', [])
@@ -441,14 +809,15 @@ def generate_portfolio(business_data):
         "projects": projects
     }
     
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(output_data, f, indent=2)
-    
-    print(f"✅ Generated: {output_path}")
+    if write_if_changed(output_path, json.dumps(output_data, indent=2)):
+        print(f"✅ Generated: {output_path}")
+    else:
+        print(f"⏭️  Unchanged: {output_path}")
 
-def generate_services_json(business_data):
+@hot_path("generate")
+def generate_services_json(business_data, output_root=None):
     """Generate data/services.json from business.yaml"""
-    output_path = os.path.join(script_dir, "data/services.json")
+    output_path = os.path.join(output_root or script_dir, "data/services.json")
     
     business_name = business_data.get('BUSINESS_NAME', 'Example Company')
     primary_keyword = business_data.get('PRIMARY_KEYWORD', 'Professional Services')
@@ -568,14 +937,16 @@ def generate_services_json(business_data):
     
     output_data = {"services": services_array}
     
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(output_data, f, indent=2)
-    
-    print(f"✅ Generated: {output_path}")
+    if write_if_changed(output_path, json.dumps(output_data, indent=2)):
+        print(f"✅ Generated: {output_path}")
+    else:
+        print(f"⏭️  Unchanged: {output_path}")
 
-def generate_business_config(business_data):
+@hot_path("generate")
+def generate_business_config(business_data, output_root=None):
     """Generate lib/business-config.ts from business.yaml"""
-    config_path = os.path.join(script_dir, "lib/business-config.ts")
+    config_path = os.path.join(output_root or script_dir, "lib/business-config.ts")
+    business_data = as_business_model(business_data)
     
     business_name = business_data.get('BUSINESS_NAME', 'Our Company')
     website_url = business_data.get('WEBSITE_URL', 'https://example.com')
@@ -605,9 +976,6 @@ def generate_business_config(business_data):
     # Google Maps
     google_maps = business_data.get('GOOGLE_MAPS', {})
     
-    # Social Media
-    social_media = business_data.get('SOCIAL_MEDIA', {})
-    
     # Blog Topics
     blog_topics = business_data.get('BLOG_TOPICS', [])
     
@@ -647,11 +1015,7 @@ def generate_business_config(business_data):
     locations_ts = ",\n".join([format_location(loc) for loc in locations])
     
     # Format social media
-    social_media_entries = []
-    for platform, data in social_media.items():
-        if isinstance(data, dict) and data.get('URL'):
-            url = data['URL']
-            social_media_entries.append(f'  {platform.lower()}: "{url}"')
+    social_media_entries = [f'  {platform.lower()}: "{url}"' for platform, url in business_data.social_urls.items()]
     social_media_ts = ",\n".join(social_media_entries)
     
     # Format secondary categories
@@ -1001,14 +1365,16 @@ export const getDefaultMapLocation = () => ({{
 }});
 '''
     
-    with open(config_path, "w", encoding="utf-8") as f:
-        f.write(ts_content)
-    
-    print(f"✅ Generated: {config_path}")
+    if write_if_changed(config_path, ts_content):
+        print(f"✅ Generated: {config_path}")
+    else:
+        print(f"⏭️  Unchanged: {config_path}")
 
-def generate_manifest_json(business_data):
+@hot_path("generate")
+def generate_manifest_json(business_data, output_root=None):
     """Generate public/manifest.json from business.yaml"""
-    output_path = os.path.join(script_dir, "public/manifest.json")
+    output_path = os.path.join(output_root or script_dir, "public/manifest.json")
+    business_data = as_business_model(business_data)
     
     business_name = business_data.get('BUSINESS_NAME', 'Example Company')
     primary_keyword = business_data.get('PRIMARY_KEYWORD', 'Professional Services')
@@ -1108,12 +1474,13 @@ def generate_manifest_json(business_data):
         ]
     }
     
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(manifest, f, indent=2)
-    
-    print(f"✅ Generated: {output_path}")
+    if write_if_changed(output_path, json.dumps(manifest, indent=2)):
+        print(f"✅ Generated: {output_path}")
+    else:
+        print(f"⏭️  Unchanged: {output_path}")
 
-def generate_seo_config(business_data):
+@hot_path("generate")
+def generate_seo_config(business_data, output_root=None):
     """Update siteConfig in lib/seo-config.ts from business.yaml
     
     NOTE: This function ONLY updates siteConfig, NOT seoConfigs.
@@ -1121,11 +1488,16 @@ def generate_seo_config(business_data):
     imports from business-config.ts and complex logic that can't be
     safely generated via regex replacement.
     """
-    config_path = os.path.join(script_dir, "lib/seo-config.ts")
+    config_path = os.path.join(output_root or script_dir, "lib/seo-config.ts")
+    business_data = as_business_model(business_data)
     
-    # Read existing file
+    # Read existing file (a fresh tenant root starts from this site's copy)
+    source_path = config_path
+    if not os.path.exists(source_path):
+        source_path = os.path.join(script_dir, "lib/seo-config.ts")
     try:
-        with open(config_path, "r", encoding="utf-8") as f:
+        with open(atomic_io.resolve(source_path), "r", encoding="utf-8") as f:
+            add_bytes(read=os.fstat(f.fileno()).st_size)
             file_content = f.read()
     except FileNotFoundError:
         print(f"⚠️  Warning: {config_path} not found, skipping update")
@@ -1135,7 +1507,7 @@ def generate_seo_config(business_data):
     website_url = business_data.get('WEBSITE_URL', 'https://example.com')
     meta = business_data.get('META', {})
     contact = business_data.get('CONTACT', {})
-    social_media = business_data.get('SOCIAL_MEDIA', {})
+    social_urls = business_data.social_urls
     core_services = business_data.get('CORE_SERVICES', [])
     hours = business_data.get('HOURS', {})
     google_maps = business_data.get('GOOGLE_MAPS', {})
@@ -1144,14 +1516,14 @@ def generate_seo_config(business_data):
     monday_hours = hours.get('MONDAY', 'Monday - Friday: 9:00 AM - 6:00 PM')
     
     # Extract social media links
-    facebook = social_media.get('FACEBOOK', {}).get('URL', '')
-    twitter = social_media.get('TWITTER', {}).get('URL', '')
-    linkedin = social_media.get('LINKEDIN', {}).get('URL', '')
-    instagram = social_media.get('INSTAGRAM', {}).get('URL', '')
-    youtube = social_media.get('YOUTUBE', {}).get('URL', '')
-    pinterest = social_media.get('PINTEREST', {}).get('URL', '')
-    nextdoor = social_media.get('NEXTDOOR', {}).get('URL', '')
-    yelp = social_media.get('YELP', {}).get('URL', '')
+    facebook = social_urls.get('FACEBOOK', '')
+    twitter = social_urls.get('TWITTER', '')
+    linkedin = social_urls.get('LINKEDIN', '')
+    instagram = social_urls.get('INSTAGRAM', '')
+    youtube = social_urls.get('YOUTUBE', '')
+    pinterest = social_urls.get('PINTEREST', '')
+    nextdoor = social_urls.get('NEXTDOOR', '')
+    yelp = social_urls.get('YELP', '')
     
     # Extract twitter handle
     twitter_handle = twitter.split('/')[-1] if twitter else business_name.lower().replace(' ', '')
@@ -1250,434 +1622,225 @@ def generate_seo_config(business_data):
         file_content = file_content[:site_config_start] + new_site_config + file_content[site_config_end:]
         
         # Write updated content back
-        with open(config_path, "w", encoding="utf-8") as f:
-            f.write(file_content)
-        
-        print(f"✅ Updated: {config_path} (siteConfig only - seoConfigs are maintained manually)")
+        if write_if_changed(config_path, file_content):
+            print(f"✅ Updated: {config_path} (siteConfig only - seoConfigs are maintained manually)")
+        else:
+            print(f"⏭️  Unchanged: {config_path}")
     else:
         print("⚠️  Warning: Could not properly parse siteConfig structure")
 
 # ========================================================================
-# IMAGE PROCESSING FUNCTIONS
+# MAIN EXECUTION FUNCTIONS
 # ========================================================================
 
-def sanitize_filename(filename: str) -> str:
-    """
-    Sanitize filename by removing spaces and special characters.
-    Example: "My Image File!.jpg" -> "my-image-file.jpg"
+class GenerationError(Exception):
+    """Some outputs could not be generated; errors lists what went wrong"""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} output(s) failed")
+        self.errors = errors
+
+def generate_rules_and_data(force=False, build_state=None, summary=True, dry_run=False, business_path=None, output_root=None, strict=False):
+    """Generate all rules and data files from business.yaml
+
+    Outputs whose business.yaml keys, template and file contents are unchanged
+    since the last run are skipped (see .generate-state.json); pass
+    force=True to rebuild everything. Long-running callers (watch mode) can
+    pass their in-memory build_state and turn off the summary block.
+    With dry_run=True nothing is written; out-of-date outputs are listed.
+    business_path and output_root render another site's business file into
+    another tree (batch mode); templates always come from this directory.
+    Failed outputs are reported and skipped; with strict=True a
+    GenerationError listing them is raised once the rest are written.
     """
-    name, ext = os.path.splitext(filename)
-    name = name.lower()
-    name = name.replace(' ', '-').replace('_', '-')
-    name = re.sub(r'[^a-z0-9-]', '', name)
-    name = re.sub(r'-+', '-', name)
-    name = name.strip('-')
-    return f"{name}{ext.lower()}"
-
-def find_image_files(directories: List[str]) -> List[Path]:
-    """Find all image files (jpg, jpeg, png, gif) in specified directories."""
-    image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.JPG', '*.JPEG', '*.PNG', '*.GIF']
-    all_images = []
-    
-    for directory in directories:
-        dir_path = Path(directory)
-        if not dir_path.exists():
-            print(f"⚠️  Directory not found: {directory}")
-            continue
-            
-        for ext in image_extensions:
-            all_images.extend(dir_path.glob(ext))
-            all_images.extend(dir_path.rglob(ext))
-    
-    return list(set(all_images))
-
-def find_source_files(base_dir: str = '.', exclude_dirs: List[str] = None) -> List[Path]:
-    """Find all source code files that might contain image references."""
-    if exclude_dirs is None:
-        exclude_dirs = ['node_modules', '.next', '.git', 'dist', 'build', 'out', 'public/assets/config']
-    
-    source_extensions = ['*.tsx', '*.ts', '*.jsx', '*.js', '*.json', '*.css', '*.scss', '*.md']
-    source_files = []
-    base_path = Path(base_dir)
-    
-    for ext in source_extensions:
-        for file_path in base_path.rglob(ext):
-            if any(excluded in file_path.parts for excluded in exclude_dirs):
-                continue
-            source_files.append(file_path)
-    
-    return source_files
-
-def update_source_references(source_files: List[Path], filename_mapping: Dict[str, str]) -> Dict[str, int]:
-    """Update image references in source files."""
-    stats = {'files_modified': 0, 'total_replacements': 0}
-    
-    for source_file in source_files:
-        try:
-            with open(source_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            original_content = content
-            replacements_in_file = 0
-            
-            for old_name, new_name in filename_mapping.items():
-                patterns = [
-                    (old_name, new_name),
-                    (old_name.replace(' ', '%20'), new_name),
-                ]
-                
-                for old_pattern, new_pattern in patterns:
-                    if old_pattern in content:
-                        count = content.count(old_pattern)
-                        content = content.replace(old_pattern, new_pattern)
-                        replacements_in_file += count
-            
-            if content != original_content:
-                with open(source_file, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-                stats['files_modified'] += 1
-                stats['total_replacements'] += replacements_in_file
-                print(f"  ✓ Updated {replacements_in_file} reference(s) in: {source_file.relative_to('.')}")
-                
-        except Exception as e:
-            print(f"  ✗ Error processing {source_file}: {str(e)}")
-    
-    return stats
-
-def rename_and_convert_images(image_files: List[Path], quality: int = 85, convert_to_webp: bool = True, delete_original: bool = False) -> Tuple[Dict[str, str], Dict[str, int]]:
-    """Rename image files and optionally convert to WebP."""
-    if not PIL_AVAILABLE:
-        print("❌ PIL (Pillow) is not installed. Cannot convert images.")
-        print("   Install with: pip install Pillow")
-        return {}, {'renamed': 0, 'converted': 0, 'skipped': 0, 'failed': 0}
-    
-    filename_mapping = {}
-    stats = {'renamed': 0, 'converted': 0, 'skipped': 0, 'failed': 0}
-    
-    for idx, image_file in enumerate(image_files, 1):
-        old_filename = image_file.name
-        new_filename = sanitize_filename(old_filename)
-        
-        if old_filename == new_filename and not convert_to_webp:
-            print(f"[{idx}/{len(image_files)}] Skipped (already clean): {old_filename}")
-            stats['skipped'] += 1
-            continue
-        
-        try:
-            new_filepath = image_file.parent / new_filename
-            
-            # Step 1: Rename the file if needed
-            if old_filename != new_filename:
-                if new_filepath.exists() and new_filepath != image_file:
-                    print(f"[{idx}/{len(image_files)}] ⚠️  Target exists, skipping rename: {old_filename} -> {new_filename}")
-                    stats['skipped'] += 1
-                    continue
-                
-                os.rename(image_file, new_filepath)
-                filename_mapping[old_filename] = new_filename
-                print(f"[{idx}/{len(image_files)}] Renamed: {old_filename} -> {new_filename}")
-                stats['renamed'] += 1
-                image_file = new_filepath
-            
-            # Step 2: Convert to WebP if requested
-            if convert_to_webp:
-                webp_filename = f"{Path(new_filename).stem}.webp"
-                webp_filepath = image_file.parent / webp_filename
-                
-                if webp_filepath.exists():
-                    print(f"  → WebP already exists: {webp_filename}")
-                else:
-                    img = Image.open(image_file)
-                    
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    elif img.mode == 'LA':
-                        img = img.convert('RGBA')
-                    elif img.mode not in ('RGB', 'RGBA', 'L'):
-                        img = img.convert('RGB')
-                    
-                    if img.mode == 'RGBA':
-                        img.save(webp_filepath, 'WEBP', quality=quality, method=6, lossless=False)
-                    else:
-                        img.save(webp_filepath, 'WEBP', quality=quality, method=6)
-                    
-                    original_size = os.path.getsize(image_file) / 1024
-                    webp_size = os.path.getsize(webp_filepath) / 1024
-                    savings = ((original_size - webp_size) / original_size) * 100
-                    
-                    print(f"  → Converted to WebP: {webp_filename} ({original_size:.1f}KB -> {webp_size:.1f}KB, saved {savings:.1f}%)")
-                    stats['converted'] += 1
-                    
-                    if old_filename in filename_mapping:
-                        filename_mapping[old_filename] = webp_filename
-                    else:
-                        filename_mapping[old_filename] = webp_filename
-                    
-                    if delete_original:
-                        os.remove(image_file)
-                        print(f"  → Deleted original: {new_filename}")
-            
-        except Exception as e:
-            stats['failed'] += 1
-            print(f"[{idx}/{len(image_files)}] ✗ Failed to process {old_filename}: {str(e)}")
-    
-    return filename_mapping, stats
-
-def process_images(
-    image_directories: List[str],
-    source_base_dir: str = '.',
-    quality: int = 85,
-    convert_to_webp: bool = True,
-    delete_original: bool = False,
-    update_references: bool = True
-):
-    """Main function to process images: find, rename, update references, and convert."""
-    print("="*80)
-    print("IMAGE PROCESSING")
-    print("="*80)
-    print()
-    
-    # Step 1: Find all image files
-    print("📁 Step 1: Finding image files...")
-    image_files = find_image_files(image_directories)
-    print(f"   Found {len(image_files)} image files\n")
-    
-    if not image_files:
-        print("No image files found. Exiting.")
-        return
-    
-    # Step 2: Rename and convert images
-    print("🔄 Step 2: Renaming and converting images...")
-    filename_mapping, rename_stats = rename_and_convert_images(
-        image_files,
-        quality=quality,
-        convert_to_webp=convert_to_webp,
-        delete_original=delete_original
-    )
-    print()
-    
-    # Step 3: Update source code references
-    if update_references and filename_mapping:
-        print("📝 Step 3: Updating source code references...")
-        source_files = find_source_files(source_base_dir)
-        print(f"   Found {len(source_files)} source files to check")
-        update_stats = update_source_references(source_files, filename_mapping)
-        print()
-    else:
-        update_stats = {'files_modified': 0, 'total_replacements': 0}
-    
-    # Print final summary
-    print("\n" + "="*80)
-    print("IMAGE PROCESSING COMPLETE")
-    print("="*80)
-    print(f"Images renamed:          {rename_stats['renamed']}")
-    print(f"Images converted:        {rename_stats['converted']}")
-    print(f"Images skipped:          {rename_stats['skipped']}")
-    print(f"Images failed:           {rename_stats['failed']}")
-    print(f"Source files modified:   {update_stats['files_modified']}")
-    print(f"Total replacements:      {update_stats['total_replacements']}")
-    print("="*80)
-
-# ========================================================================
-# MAIN EXECUTION FUNCTIONS
-# ========================================================================
+    business_path = business_path or business_file
+    output_root = output_root or script_dir
+    output_rules_folder = os.path.join(output_root, ".cursor/rules/")
+    state_file = os.path.join(output_root, ".generate-state.json")
+    journal_file = os.path.join(output_root, ".generate-journal.jsonl")
 
-def generate_rules_and_data():
-    """Generate all rules and data files from business.yaml"""
     # -----------------------------
     # Process all templates
     # -----------------------------
     templates_processed = 0
+    outputs_up_to_date = 0
+    errors = []
+
+    def fail(message):
+        print(f"❌ {message}")
+        errors.append(message)
+
+    try:
+        business = load_business_model(business_path)
+        print(f"✅ Loaded business data from {business_path}")
+    except FileNotFoundError:
+        fail(f"Error: {business_path} not found!")
+    except Exception as e:
+        fail(f"Error loading {business_path}: {e}")
+    if errors:
+        if strict:
+            raise GenerationError(errors)
+        return None
+
+    if force:
+        build_state = {"version": BUILD_STATE_VERSION, "generator": file_fingerprint(__file__), "outputs": {}}
+    elif build_state is None:
+        build_state = load_build_state(state_file)
 
     # Check if templates folder exists
     if not os.path.exists(templates_folder):
-        print(f"❌ Templates folder not found: {templates_folder}")
+        fail(f"Templates folder not found: {templates_folder}")
         print("Please ensure templates are in the correct location.")
-        return templates_processed
+        if strict:
+            raise GenerationError(errors)
+        return build_state
 
     print(f"📁 Processing templates from: {templates_folder}")
 
-    for file_name in os.listdir(templates_folder):
-        if not file_name.endswith(".template"):
-            continue
+    # Derived placeholders are the same for every template: build them once
+    with stage("placeholders", "template"):
+        placeholder_table = new_placeholder_table(business)
 
-        template_path = os.path.join(templates_folder, file_name)
-        print(f"🔄 Processing: {file_name}")
-        
-        try:
-            with open(template_path, "r", encoding="utf-8") as f:
-                template = f.read()
-
-            output_content = template
-
-            # Handle numbered examples if present
-            for i in range(1, 5):
-                ph = f"EXAMPLE_{i}"
-                if ph in output_content:
-                    ex_value = business.get("EXAMPLES", [])
-                    if len(ex_value) >= i:
-                        output_content = output_content.replace(f"{{{{{ph}}}}}", ex_value[i-1])
-                    else:
-                        output_content = output_content.replace(f"{{{{{ph}}}}}", "")
-
-            # Create missing placeholders
-            missing_placeholders = create_missing_placeholders(business)
-            
-            # Replace all other placeholders dynamically
-            placeholders = re.findall(r"{{(.*?)}}", output_content)
-            for ph in placeholders:
-                # Handle nested dictionary access (e.g., CONTACT.PHONE)
-                if '.' in ph:
-                    value = get_nested_value(business, ph)
-                    # Try lowercase version if not found
-                    if value is None:
-                        keys = ph.split('.')
-                        if len(keys) == 2:
-                            parent_key = keys[0]
-                            child_key = keys[1].lower()  # Try lowercase
-                            if parent_key in business and isinstance(business[parent_key], dict):
-                                value = business[parent_key].get(child_key)
-                else:
-                    value = business.get(ph) or missing_placeholders.get(ph)
-                
-                if value is not None:
-                    rendered_value = render_value(value, ph)
-                    output_content = output_content.replace(f"{{{{{ph}}}}}", rendered_value)
-                elif ph == "SUPPORTING_TOPICS_MD" and "SUPPORTING_TOPICS" in business:
-                    rendered_value = render_supporting_topics(business["SUPPORTING_TOPICS"])
-                    output_content = output_content.replace(f"{{{{{ph}}}}}", rendered_value)
-                else:
-                    print(f"⚠️  Warning: Placeholder '{ph}' not found in business data")
-                    output_content = output_content.replace(f"{{{{{ph}}}}}", "")
-
-            # Rule 1: Convert <a> tags to <Link> components
-            output_content = re.sub(
-                r'<a\s+([^>]*?)href=["\']([^"\']*)["\']([^>]*?)>([^<]*)</a>',
-                r'<Link href="\2" \1\3>\4</Link>',
-                output_content,
-                flags=re.IGNORECASE | re.DOTALL
-            )
-
-            # Only apply &apos; replacement for .mdc.template files (Cursor rules/markdown)
-            # Skip for JSON files and TypeScript/JavaScript files
-            if file_name.endswith(".mdc.template"):
-                protected_content = []
-                def protect_and_replace(match):
-                    protected_content.append(match.group(0))
-                    return f'__PROTECTED_{len(protected_content)-1}__'
-                
-                # Protect HTML tags, JSX expressions, and JSON-like structures
-                output_content = re.sub(r'<[^>]*>|{[^}]*}|\[[^\]]*\]', protect_and_replace, output_content)
-                
-                # Replace quotes in remaining text (only for markdown/rules content)
-                output_content = output_content.replace("'", "&apos;")
-                
-                # Restore protected content
-                for i, content in enumerate(protected_content):
-                    output_content = output_content.replace(f'__PROTECTED_{i}__', content)
+    # Every output, and the build state describing them, is committed together:
+    # a crash or Ctrl+C never leaves half-written or mismatched files behind
+    with (nullcontext() if dry_run else atomic_io.transaction(journal_file)):
+        for file_name in os.listdir(templates_folder):
+            if not file_name.endswith(".template"):
+                continue
+
+            template_path = os.path.join(templates_folder, file_name)
 
             # Determine output file name and location
             if file_name.endswith(".mdc.template"):
                 output_name = file_name.replace(".mdc.template", ".mdc")
-                output_file = os.path.join(rules_folder, output_name)
+                output_file = os.path.join(output_rules_folder, output_name)
             elif file_name.endswith(".json.template"):
                 output_name = file_name.replace(".json.template", ".json")
-                output_file = os.path.join(script_dir, "public", output_name)
+                output_file = os.path.join(output_root, "public", output_name)
             else:
                 output_name = file_name.replace(".template", ".mdc")
-                output_file = os.path.join(rules_folder, output_name)
+                output_file = os.path.join(output_rules_folder, output_name)
 
-            # Write output
-            with open(output_file, "w", encoding="utf-8") as f:
-                f.write(output_content)
+            step = f"template:{file_name}"
+            if is_up_to_date(build_state, step, business, [output_file], output_root):
+                print(f"⏭️  Up to date: {file_name}")
+                outputs_up_to_date += 1
+                continue
+            if dry_run:
+                print(f"📝 Would regenerate: {_relative(output_file, output_root)}")
+                templates_processed += 1
+                continue
 
-            # Validate JSON if it's a JSON file
-            if output_file.endswith('.json'):
-                try:
-                    with open(output_file, "r", encoding="utf-8") as f:
-                        json.load(f)
-                    print(f"✅ Generated: {output_file} (valid JSON)")
-                except json.JSONDecodeError as e:
-                    print(f"❌ Generated: {output_file} (INVALID JSON: {e})")
-            else:
-                print(f"✅ Generated: {output_file}")
-            templates_processed += 1
+            print(f"🔄 Processing: {file_name}")
+        
+            try:
+                with stage(step, "template"):
+                    tokens = compile_template(template_path)
+                    output_content = render_template(tokens, placeholder_table)
+
+                    # Rule 1: Convert <a> tags to <Link> components
+                    output_content = re.sub(
+                        r'<a\s+([^>]*?)href=["\']([^"\']*)["\']([^>]*?)>([^<]*)</a>',
+                        r'<Link href="\2" \1\3>\4</Link>',
+                        output_content,
+                        flags=re.IGNORECASE | re.DOTALL
+                    )
+
+                    # Only apply &apos; replacement for .mdc.template files (Cursor rules/markdown)
+                    # Skip for JSON files and TypeScript/JavaScript files
+                    if file_name.endswith(".mdc.template"):
+                        output_content = escape_apostrophes(output_content)
+
+                    # Write output (only if the bytes changed)
+                    written = write_if_changed(output_file, output_content)
+                    record_build(build_state, step, business, template_dependencies(tokens, placeholder_table), [output_file], [template_path], output_root)
+
+                # Validate JSON if it's a JSON file
+                if not written:
+                    print(f"⏭️  Unchanged: {output_file}")
+                elif output_file.endswith('.json'):
+                    try:
+                        json.loads(output_content)
+                        print(f"✅ Generated: {output_file} (valid JSON)")
+                    except json.JSONDecodeError as e:
+                        fail(f"Generated: {output_file} (INVALID JSON: {e})")
+                else:
+                    print(f"✅ Generated: {output_file}")
+                templates_processed += 1
             
-        except Exception as e:
-            print(f"❌ Error processing {file_name}: {e}")
-
-    # -----------------------------
-    # Update Public Files
-    # -----------------------------
-    # NOTE: robots.txt is handled by app/robots.ts (dynamic Next.js route)
-    # which uses siteConfig that's generated from business.yaml
-    # No need for static public/robots.txt file
-
-    # -----------------------------
-    # Generate Data Files from business.yaml
-    # -----------------------------
-    print("\n📊 Generating data files from business.yaml...")
-    data_files_generated = 0
-
-    # SKIP: Blog posts are maintained manually
-    # try:
-    #     generate_blog_posts(business)
-    #     data_files_generated += 1
-    # except Exception as e:
-    #     print(f"❌ Error generating blog-posts.json: {e}")
-
-    try:
-        # generate_services_json(business)
-        # data_files_generated += 1
-        print("⚠️  Skipping services.json generation to preserve manual edits")
-    except Exception as e:
-        print(f"❌ Error generating services.json: {e}")
-
-    try:
-        generate_faqs(business)
-        data_files_generated += 1
-    except Exception as e:
-        print(f"❌ Error generating faq.json: {e}")
+            except Exception as e:
+                fail(f"Error processing {file_name}: {e}")
+
+        # -----------------------------
+        # Update Public Files
+        # -----------------------------
+        # NOTE: robots.txt is handled by app/robots.ts (dynamic Next.js route)
+        # which uses siteConfig that's generated from business.yaml
+        # No need for static public/robots.txt file
+
+        # -----------------------------
+        # Generate Data Files from business.yaml
+        # -----------------------------
+        print("\n📊 Generating data files from business.yaml...")
+        data_files_generated = 0
+
+        # SKIP: Blog posts are maintained manually
+        # try:
+        #     generate_blog_posts(business)
+        #     data_files_generated += 1
+        # except Exception as e:
+        #     print(f"❌ Error generating blog-posts.json: {e}")
 
-    try:
-        generate_portfolio(business)
-        data_files_generated += 1
-    except Exception as e:
-        print(f"❌ Error generating portfolio.json: {e}")
-
-    try:
-        generate_business_config(business)
-        data_files_generated += 1
-    except Exception as e:
-        print(f"❌ Error generating business-config.ts: {e}")
-
-    try:
-        generate_seo_config(business)
-        data_files_generated += 1
-    except Exception as e:
-        print(f"❌ Error generating seo-config.ts: {e}")
-
-    try:
-        generate_manifest_json(business)
-        data_files_generated += 1
-    except Exception as e:
-        print(f"❌ Error generating manifest.json: {e}")
+        try:
+            # generate_services_json(business)
+            # data_files_generated += 1
+            print("⚠️  Skipping services.json generation to preserve manual edits")
+        except Exception as e:
+            fail(f"Error generating services.json: {e}")
+
+        data_steps = [
+            (generate_faqs, "data/faq.json"),
+            (generate_portfolio, "data/portfolio.json"),
+            (generate_business_config, "lib/business-config.ts"),
+            (generate_seo_config, "lib/seo-config.ts"),
+            (generate_manifest_json, "public/manifest.json"),
+        ]
+        for generate, output_path in data_steps:
+            try:
+                build = lambda data: generate(data, output_root)
+                if run_build_step(build_state, generate.__name__, business, build, [os.path.join(output_root, output_path)], dry_run, output_root):
+                    data_files_generated += 1
+                else:
+                    outputs_up_to_date += 1
+            except Exception as e:
+                fail(f"Error generating {os.path.basename(output_path)}: {e}")
+
+        if dry_run:
+            print(f"\n🔎 Dry run: {templates_processed + data_files_generated} output(s) would be regenerated, {outputs_up_to_date} up to date")
+            return build_state
+        save_build_state(build_state, state_file)
+    if errors and strict:
+        raise GenerationError(errors)
+    if not summary:
+        return build_state
 
     # Summary
     print("\n" + "="*60)
     print("📊 GENERATION SUMMARY")
     print("="*60)
 
+    if outputs_up_to_date > 0:
+        print(f"\n⏭️  Up to date (skipped): {outputs_up_to_date}")
+
     if templates_processed > 0:
         print(f"\n✅ Templates Processed: {templates_processed}")
-        print(f"   📁 Rules location: {rules_folder}")
-        print(f"   📁 Public files location: {os.path.join(script_dir, 'public/')}")
+        print(f"   📁 Rules location: {output_rules_folder}")
+        print(f"   📁 Public files location: {os.path.join(output_root, 'public/')}")
 
     if data_files_generated > 0:
         print(f"\n✅ Data Files Generated: {data_files_generated}")
-        print(f"   📁 Data location: {os.path.join(script_dir, 'data/')}")
-        print(f"   📁 Public location: {os.path.join(script_dir, 'public/')}")
+        print(f"   📁 Data location: {os.path.join(output_root, 'data/')}")
+        print(f"   📁 Public location: {os.path.join(output_root, 'public/')}")
 
     print("\n💡 All files are now data-driven from business.yaml!")
     print("   - Update business.yaml to change content")
@@ -1696,12 +1859,235 @@ def generate_rules_and_data():
     print("   - app/robots.ts → /robots.txt (dynamic)")
     print("   - app/sitemap.ts → /sitemap.xml (dynamic)")
     print("\n" + "="*60)
+    return build_state
 
 # ========================================================================
-# MAIN MENU
+# WATCH MODE
 # ========================================================================
 
-if __name__ == "__main__":
+def _watched_inputs():
+    """(mtime_ns, size) of business.yaml and every template"""
+    inputs = {}
+    paths = [business_file]
+    if os.path.isdir(templates_folder):
+        paths += [entry.path for entry in os.scandir(templates_folder) if entry.name.endswith(".template")]
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            inputs[path] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+    return inputs
+
+def watch(interval=0.5, debounce=0.3):
+    """Regenerate outputs whenever business.yaml or a template changes
+
+    Polls file stats every `interval` seconds and waits until nothing has
+    changed for `debounce` seconds before rebuilding, so a burst of editor
+    saves causes one regeneration. Parsed data, compiled templates and the
+    build state stay in memory between runs, so only affected outputs are
+    rebuilt.
+    """
+    print(f"👀 Watching {business_file} and {templates_folder} (Ctrl+C to stop)\n")
+    build_state = generate_rules_and_data(summary=False)
+    snapshot = _watched_inputs()
+
+    try:
+        while True:
+            time.sleep(interval)
+            current = _watched_inputs()
+            if current == snapshot:
+                continue
+
+            # Debounce: wait for the burst of saves to settle
+            while True:
+                time.sleep(debounce)
+                settled = _watched_inputs()
+                if settled == current:
+                    break
+                current = settled
+
+            changed = sorted(path for path in set(current) | set(snapshot) if current.get(path) != snapshot.get(path))
+            snapshot = current
+            print(f"\n🔁 Changed: {', '.join(os.path.relpath(path, script_dir) for path in changed)}")
+
+            if business_file in changed:
+                try:
+                    load_business()
+                except Exception as e:
+                    print(f"❌ Error loading {business_file}: {e}")
+                    print("   Waiting for the file to be fixed")
+                    continue
+
+            start = time.perf_counter()
+            build_state = generate_rules_and_data(build_state=build_state, summary=False) or build_state
+            print(f"⚡ Regenerated in {(time.perf_counter() - start) * 1000:.0f} ms")
+    except KeyboardInterrupt:
+        print("\n👋 Stopped watching")
+
+# ========================================================================
+# BATCH MODE
+# ========================================================================
+
+def discover_tenants(source, output_base=None):
+    """List (name, business_path, output_root) for every tenant in source
+
+    source is either a directory of <tenant>.yaml files, each rendered into
+    <output_base>/<tenant>/ (default: next to the YAML files), or a
+    manifest file listing tenants; relative paths are relative to the
+    manifest:
+
+        tenants:
+          - name: acme
+            business: clients/acme.yaml
+            output: ../sites/acme     # default: <output_base>/<name>
+    """
+    from yaml_cache import load_yaml
+
+    if os.path.isdir(source):
+        output_base = output_base or source
+        return [
+            (os.path.splitext(entry.name)[0], entry.path, os.path.join(output_base, os.path.splitext(entry.name)[0]))
+            for entry in sorted(os.scandir(source), key=lambda entry: entry.name)
+            if entry.is_file() and entry.name.endswith((".yaml", ".yml"))
+        ]
+
+    manifest = load_yaml(source)
+    entries = manifest.get("tenants", []) if isinstance(manifest, dict) else manifest
+    manifest_dir = os.path.dirname(os.path.abspath(source))
+    output_base = output_base or manifest_dir
+    tenants = []
+    for entry in entries or []:
+        business_path = os.path.join(manifest_dir, entry["business"])
+        name = entry.get("name") or os.path.splitext(os.path.basename(business_path))[0]
+        output_root = os.path.join(manifest_dir, entry["output"]) if entry.get("output") else os.path.join(output_base, name)
+        tenants.append((name, business_path, output_root))
+    return tenants
+
+def _seed_templates(compiled):
+    """Worker initializer: start from the parent's compiled templates"""
+    _compiled_templates.update(compiled)
+
+def _generate_tenant(name, business_path, output_root, force):
+    """Render one tenant in a worker; returns (name, error messages, captured output)"""
+    import io
+    import contextlib
+
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        try:
+            generate_rules_and_data(force=force, summary=False, business_path=business_path, output_root=output_root, strict=True)
+            errors = []
+        except GenerationError as e:
+            errors = e.errors
+    return name, errors, log.getvalue()
+
+def generate_tenants(source, output_base=None, workers=None, force=False):
+    """Render every tenant's rules and data files, one process per tenant at a time
+
+    Templates are compiled once here and handed to the workers; each
+    tenant keeps its own .generate-state.json in its output root, so
+    unchanged tenants are cheap to re-run.
+
+    Returns:
+        Number of tenants that failed
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    try:
+        tenants = discover_tenants(source, output_base)
+    except Exception as e:
+        print(f"❌ Error reading tenants from {source}: {e}")
+        return 1
+    if not tenants:
+        print(f"⚠️  No tenant YAML files found in {source}")
+        return 0
+    roots = [os.path.abspath(root) for _, _, root in tenants]
+    if len(set(roots)) != len(roots):
+        print("❌ Two tenants share an output root; give them distinct names or outputs")
+        return 1
+
+    for file_name in os.listdir(templates_folder):
+        if file_name.endswith(".template"):
+            compile_template(os.path.join(templates_folder, file_name))
+
+    print(f"🏢 Generating {len(tenants)} tenant(s) from {source}\n")
+    start = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_seed_templates, initargs=(dict(_compiled_templates),)) as pool:
+        futures = {pool.submit(_generate_tenant, name, business_path, output_root, force): output_root
+                   for name, business_path, output_root in tenants}
+        for future in as_completed(futures):
+            try:
+                name, errors, output = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {futures[future]}: {e}")
+                continue
+            if not errors:
+                print(f"✅ {name} → {futures[future]}")
+            else:
+                failed += 1
+                print(f"❌ {name} → {futures[future]}")
+                for error in errors:
+                    print(f"   {error}")
+
+    print(f"\n🏁 {len(tenants) - failed}/{len(tenants)} tenant(s) generated in {time.perf_counter() - start:.1f}s")
+    return failed
+
+# ========================================================================
+# COMMAND LINE
+# ========================================================================
+
+def build_parser():
+    """Command line: `generate`, `batch`, `images` and `all` subcommands; no command opens the menu"""
+    from instrumentation import add_metrics_arguments
+
+    parser = argparse.ArgumentParser(
+        description="Generate rules and data files from business.yaml and process images.",
+        epilog="Run without a command for the interactive menu."
+    )
+    parser.add_argument("--watch", action="store_true", help="Same as `generate --watch`")
+    subcommands = parser.add_subparsers(dest="command", metavar="command")
+
+    generate = subcommands.add_parser("generate", help="Generate rules and data files from business.yaml")
+    generate.add_argument("--force", action="store_true", help="Rebuild every output, even if its inputs are unchanged")
+    generate.add_argument("--watch", action="store_true", help="Keep running and regenerate whenever inputs change")
+    generate.add_argument("-n", "--dry-run", action="store_true", help="List outputs that would be regenerated without writing them")
+    add_metrics_arguments(generate)
+
+    batch = subcommands.add_parser("batch", help="Generate rules and data files for many sites at once")
+    batch.add_argument("source", help="Directory of <tenant>.yaml files, or a manifest listing tenants")
+    batch.add_argument("-o", "--output", help="Parent directory for tenant output roots (default: next to the YAML files)")
+    batch.add_argument("-j", "--jobs", type=int, help="Worker processes (default: one per CPU)")
+    batch.add_argument("--force", action="store_true", help="Rebuild every output, even if its inputs are unchanged")
+
+    from extract_images import add_image_arguments
+
+    images = subcommands.add_parser("images", help="Rename, convert and re-reference images")
+    add_image_arguments(images)
+    add_metrics_arguments(images)
+
+    both = subcommands.add_parser("all", help="Generate rules and data files, then process images")
+    both.add_argument("--force", action="store_true", help="Rebuild every output, even if its inputs are unchanged")
+    add_image_arguments(both)
+    add_metrics_arguments(both)
+
+    return parser
+
+def run_images(settings, confirm=False):
+    """Print the image configuration and run process_images with it; returns its stats"""
+    from extract_images import print_image_settings, process_images
+
+    print_image_settings(settings)
+    print("\n" + "="*80)
+    if confirm:
+        input("\n⚠️  Press ENTER to start processing (or Ctrl+C to cancel)...")
+    print()
+    return process_images(**settings)
+
+def interactive_menu():
+    """The original 1-4 menu"""
     print("="*80)
     print("BUSINESS CONFIGURATION & IMAGE PROCESSING TOOL")
     print("="*80)
@@ -1712,53 +2098,24 @@ if __name__ == "__main__":
     print("4. Exit")
     print("\n" + "="*80)
     
+    from extract_images import DEFAULT_IMAGE_SETTINGS
+
     choice = input("\nEnter your choice (1-4): ").strip()
+    settings = dict(DEFAULT_IMAGE_SETTINGS)
     
     if choice == "1":
         print("\n" + "="*80)
         print("GENERATING RULES AND DATA FILES")
         print("="*80 + "\n")
-        generate_rules_and_data()
+        if generate_rules_and_data() is None:
+            return 1
         
     elif choice == "2":
         print("\n" + "="*80)
         print("IMAGE PROCESSING CONFIGURATION")
         print("="*80 + "\n")
-        
-        # Image processing configuration
-        IMAGE_DIRECTORIES = [
-            './public/assets/images',
-            './public/assets/images/brands',
-            './public/assets/images/portfolio',
-            './public/assets/images/services',
-        ]
-        
-        SOURCE_BASE_DIR = '.'
-        QUALITY = 85
-        CONVERT_TO_WEBP = True
-        DELETE_ORIGINAL = True
-        UPDATE_REFERENCES = True
-        
-        print("📋 Configuration:")
-        print(f"   Image directories: {IMAGE_DIRECTORIES}")
-        print(f"   Source base: {SOURCE_BASE_DIR}")
-        print(f"   WebP quality: {QUALITY}")
-        print(f"   Convert to WebP: {CONVERT_TO_WEBP}")
-        print(f"   Delete originals: {DELETE_ORIGINAL}")
-        print(f"   Update references: {UPDATE_REFERENCES}")
-        print("\n" + "="*80)
-        
-        confirm = input("\n⚠️  Press ENTER to start processing (or Ctrl+C to cancel)...")
-        print()
-        
-        process_images(
-            image_directories=IMAGE_DIRECTORIES,
-            source_base_dir=SOURCE_BASE_DIR,
-            quality=QUALITY,
-            convert_to_webp=CONVERT_TO_WEBP,
-            delete_original=DELETE_ORIGINAL,
-            update_references=UPDATE_REFERENCES
-        )
+        if run_images(settings, confirm=True)["failed"]:
+            return 1
         
     elif choice == "3":
         print("\n" + "="*80)
@@ -1768,53 +2125,86 @@ if __name__ == "__main__":
         # First: Generate rules and data
         print("STEP 1: GENERATING RULES AND DATA FILES")
         print("="*80 + "\n")
-        generate_rules_and_data()
+        if generate_rules_and_data() is None:
+            return 1
         
         # Second: Process images
         print("\n\n" + "="*80)
         print("STEP 2: IMAGE PROCESSING")
         print("="*80 + "\n")
-        
-        IMAGE_DIRECTORIES = [
-            './public/assets/images',
-            './public/assets/images/brands',
-            './public/assets/images/portfolio',
-            './public/assets/images/services',
-        ]
-        
-        SOURCE_BASE_DIR = '.'
-        QUALITY = 85
-        CONVERT_TO_WEBP = True
-        DELETE_ORIGINAL = True
-        UPDATE_REFERENCES = True
-        
-        print("📋 Image Processing Configuration:")
-        print(f"   Image directories: {IMAGE_DIRECTORIES}")
-        print(f"   WebP quality: {QUALITY}")
-        print(f"   Convert to WebP: {CONVERT_TO_WEBP}")
-        print(f"   Delete originals: {DELETE_ORIGINAL}")
-        print(f"   Update references: {UPDATE_REFERENCES}\n")
-        
-        confirm = input("⚠️  Press ENTER to start image processing (or Ctrl+C to cancel)...")
-        print()
-        
-        process_images(
-            image_directories=IMAGE_DIRECTORIES,
-            source_base_dir=SOURCE_BASE_DIR,
-            quality=QUALITY,
-            convert_to_webp=CONVERT_TO_WEBP,
-            delete_original=DELETE_ORIGINAL,
-            update_references=UPDATE_REFERENCES
-        )
+        if run_images(settings, confirm=True)["failed"]:
+            return 1
         
     elif choice == "4":
         print("\n✅ Exiting. No changes made.")
-        exit(0)
+        return 0
         
     else:
         print("\n❌ Invalid choice. Please run the script again and select 1-4.")
-        exit(1)
+        return 1
     
     print("\n" + "="*80)
     print("✅ ALL OPERATIONS COMPLETED SUCCESSFULLY")
-    print("="*80)
\ No newline at end of file
+    print("="*80)
+    return 0
+
+def main(argv=None):
+    """Entry point; returns the process exit code"""
+    import instrumentation
+
+    args = build_parser().parse_args(argv)
+    instrumentation.start_from_args(args)
+    try:
+        with instrumentation.profile_from_args(args, args.command or "generate"):
+            return run_command(args)
+    finally:
+        instrumentation.finish_from_args(args)
+
+def _generated(**kwargs):
+    """Run generate_rules_and_data strictly; True if every output was generated"""
+    try:
+        return generate_rules_and_data(strict=True, **kwargs) is not None
+    except GenerationError as e:
+        print(f"\n❌ {e}")
+        return False
+
+def run_command(args):
+    """Run the parsed command line; returns the process exit code"""
+    from extract_images import image_settings_from_args
+
+    if args.command is None:
+        if args.watch:
+            watch()
+            return 0
+        return interactive_menu()
+
+    if args.command == "generate":
+        if args.watch:
+            watch()
+        elif not _generated(force=args.force, dry_run=args.dry_run):
+            return 1
+
+    elif args.command == "batch":
+        if generate_tenants(args.source, args.output, args.jobs, args.force):
+            return 1
+
+    elif args.command == "images":
+        if run_images(image_settings_from_args(args))["failed"]:
+            return 1
+
+    elif args.command == "all":
+        settings = image_settings_from_args(args)
+        print("STEP 1: GENERATING RULES AND DATA FILES")
+        print("="*80 + "\n")
+        if not _generated(force=args.force, dry_run=settings["dry_run"]):
+            return 1
+        print("\n\n" + "="*80)
+        print("STEP 2: IMAGE PROCESSING")
+        print("="*80 + "\n")
+        if run_images(settings)["failed"]:
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
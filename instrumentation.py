@@ -0,0 +1,351 @@
+"""
+Per-stage timing and counters shared by generate_rules.py and extract_images.py:
+1. Wrap a stage in `with stage('name', 'category'):` - it records wall
+   time, CPU time, bytes read and written (reported by the code doing the
+   I/O via add_bytes) and, with memory tracking on, peak traced memory
+2. Stages nest (per thread); bytes are charged to every open stage of the
+   calling thread and memory peaks to every open stage
+3. At the end print_summary() prints a per-stage table, and write_json()
+   / write_chrome_trace() save the raw records (the trace opens in
+   chrome://tracing or https://ui.perfetto.dev)
+4. For a deeper look, profiled() wraps a whole operation in cProfile and
+   tracemalloc and writes a .prof file, a memory snapshot and a top-N
+   text report in which functions registered with @hot_path are tagged
+
+Everything is a no-op until enable() is called, so the hooks cost next to
+nothing in normal runs.
+"""
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+_state = {
+    'enabled': False,
+    'memory': False,
+    # Finished stages, in completion order
+    'records': [],
+    # Open stages of every thread: {'bytes_read', 'bytes_written', 'peak'}
+    'open': [],
+}
+
+# (filename, first line, name) of functions on a known hot path -> tag;
+# matches the keys cProfile/pstats use
+_hot_paths = {}
+
+# Each thread's open stages, innermost last
+_local = threading.local()
+
+def _stack() -> List[dict]:
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def enable(memory: bool = False) -> None:
+    """Start recording (discarding earlier records); memory=True also traces peak memory."""
+    _state.update(enabled=True, memory=memory, records=[], open=[])
+    # A forked worker inherits its parent's open stages; start clean
+    _local.stack = []
+    if memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+def disable() -> None:
+    _state['enabled'] = False
+    if _state['memory']:
+        import tracemalloc
+        tracemalloc.stop()
+        _state['memory'] = False
+
+def is_enabled() -> bool:
+    return _state['enabled']
+
+def memory_enabled() -> bool:
+    return _state['memory']
+
+def stage(name: str, category: str = 'stage'):
+    """Context manager recording one stage (a shared no-op when disabled)."""
+    if not _state['enabled']:
+        return nullcontext()
+    return _measure(name, category)
+
+def add_bytes(read: int = 0, written: int = 0) -> None:
+    """Charge I/O to every open stage of the calling thread."""
+    for frame in _stack():
+        frame['bytes_read'] += read
+        frame['bytes_written'] += written
+
+def _fold_peak() -> None:
+    """Fold the traced peak since the last reset into every open stage, then reset it."""
+    import tracemalloc
+    peak = tracemalloc.get_traced_memory()[1]
+    for frame in _state['open']:
+        frame['peak'] = max(frame['peak'], peak)
+    tracemalloc.reset_peak()
+
+@contextmanager
+def _measure(name: str, category: str):
+    memory = _state['memory']
+    if memory:
+        _fold_peak()
+    frame = {'bytes_read': 0, 'bytes_written': 0, 'peak': 0}
+    stack = _stack()
+    stack.append(frame)
+    _state['open'].append(frame)
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield frame
+    finally:
+        wall = time.perf_counter() - start_wall
+        cpu = time.process_time() - start_cpu
+        if memory:
+            _fold_peak()
+        stack.pop()
+        _state['open'] = [other for other in _state['open'] if other is not frame]
+        _state['records'].append({
+            'name': name,
+            'category': category,
+            'start_us': round(start_wall * 1e6),
+            'wall_ms': wall * 1000,
+            'cpu_ms': cpu * 1000,
+            'bytes_read': frame['bytes_read'],
+            'bytes_written': frame['bytes_written'],
+            'peak_bytes': frame['peak'] if memory else None,
+            'depth': len(stack),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        })
+
+def hot_path(tag: str):
+    """Decorator tagging a function as part of a hot path in profile reports (no runtime cost)."""
+    def register(func):
+        code = func.__code__
+        _hot_paths[(code.co_filename, code.co_firstlineno, code.co_name)] = tag
+        return func
+    return register
+
+def records() -> List[dict]:
+    return list(_state['records'])
+
+def drain() -> List[dict]:
+    """Return and forget the records so far (worker processes send them back)."""
+    finished, _state['records'] = _state['records'], []
+    return finished
+
+def merge(worker_records: List[dict]) -> None:
+    """Add records made in another process; their I/O also counts toward open stages."""
+    if not _state['enabled']:
+        return
+    for record in worker_records:
+        if record['depth'] == 0:
+            add_bytes(record['bytes_read'], record['bytes_written'])
+        record['depth'] += len(_stack())
+    _state['records'].extend(worker_records)
+
+def summarize(stage_records: Optional[List[dict]] = None) -> Dict[str, dict]:
+    """Totals per stage name: count, wall, CPU, bytes and the highest peak."""
+    totals = {}
+    for record in stage_records if stage_records is not None else _state['records']:
+        total = totals.setdefault(record['name'], {
+            'category': record['category'], 'count': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0,
+            'bytes_read': 0, 'bytes_written': 0, 'peak_bytes': None,
+        })
+        total['count'] += 1
+        for key in ('wall_ms', 'cpu_ms', 'bytes_read', 'bytes_written'):
+            total[key] += record[key]
+        if record['peak_bytes'] is not None:
+            total['peak_bytes'] = max(total['peak_bytes'] or 0, record['peak_bytes'])
+    return totals
+
+def _format_bytes(size: Optional[int]) -> str:
+    if size is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+def _max_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def print_summary() -> None:
+    """Print one line per stage name, in the order the stages first finished."""
+    totals = summarize()
+    if not totals:
+        return
+    print("\n" + "="*96)
+    print("⏱️  STAGE METRICS")
+    print("="*96)
+    print(f"{'stage':<40} {'count':>6} {'wall ms':>10} {'cpu ms':>10} {'read':>10} {'written':>10} {'peak mem':>10}")
+    for name, total in totals.items():
+        print(f"{name[:40]:<40} {total['count']:>6} {total['wall_ms']:>10.1f} {total['cpu_ms']:>10.1f} "
+              f"{_format_bytes(total['bytes_read']):>10} {_format_bytes(total['bytes_written']):>10} "
+              f"{_format_bytes(total['peak_bytes']):>10}")
+    max_rss = _max_rss()
+    if max_rss:
+        print(f"\nPeak RSS (this process): {_format_bytes(max_rss)}")
+    print("="*96)
+
+def write_json(path: str) -> None:
+    """Save per-stage totals and every record."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'summary': summarize(), 'records': _state['records'], 'max_rss_bytes': _max_rss()}, f, indent=2)
+    print(f"💾 Metrics written to {path}")
+
+def write_chrome_trace(path: str) -> None:
+    """Save the records as Chrome trace events (one complete event per stage)."""
+    events = [
+        {
+            'name': record['name'],
+            'cat': record['category'],
+            'ph': 'X',
+            'ts': record['start_us'],
+            'dur': round(record['wall_ms'] * 1000),
+            'pid': record['pid'],
+            'tid': record['tid'],
+            'args': {key: record[key] for key in ('cpu_ms', 'bytes_read', 'bytes_written', 'peak_bytes')},
+        }
+        for record in _state['records']
+    ]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    print(f"💾 Trace written to {path}")
+
+# ------------------------------------------------------------------------
+# Profiling
+# ------------------------------------------------------------------------
+
+PROFILE_DIR = '.profile'
+
+def _short_location(filename: str, lineno: int, name: str) -> str:
+    if filename == '~':
+        # Built-in functions
+        return name
+    return f"{os.path.basename(filename)}:{lineno}({name})"
+
+def write_profile_report(profiler, snapshot, path: str, top: int = 25, wall: Optional[float] = None) -> None:
+    """Write the top-N functions (by cumulative and own time), the tagged hot paths and the top allocations."""
+    import pstats
+    import tracemalloc
+
+    entries = pstats.Stats(profiler).stats
+    rows = [
+        (key, calls, own, cumulative)
+        for key, (_, calls, own, cumulative, _) in entries.items()
+    ]
+    lines = []
+    if wall is not None:
+        lines.append(f"Wall time: {wall:.3f} s\n")
+
+    def table(title, ordered):
+        lines.append(title)
+        lines.append(f"{'cum ms':>10} {'own ms':>10} {'calls':>9}  {'hot path':<10} function")
+        for key, calls, own, cumulative in ordered[:top]:
+            lines.append(f"{cumulative * 1000:>10.1f} {own * 1000:>10.1f} {calls:>9}  "
+                         f"{_hot_paths.get(key, ''):<10} {_short_location(*key)}")
+        lines.append("")
+
+    table(f"Top {top} functions by cumulative time", sorted(rows, key=lambda row: row[3], reverse=True))
+    table(f"Top {top} functions by own time", sorted(rows, key=lambda row: row[2], reverse=True))
+    table("Hot paths", sorted((row for row in rows if row[0] in _hot_paths), key=lambda row: row[3], reverse=True))
+
+    if snapshot is not None:
+        lines.append(f"Top {top} allocation sites (live at the end of the run)")
+        lines.append(f"{'size':>10} {'blocks':>9}  location")
+        for stat in snapshot.statistics('lineno')[:top]:
+            frame = stat.traceback[0]
+            lines.append(f"{_format_bytes(stat.size):>10} {stat.count:>9}  {os.path.basename(frame.filename)}:{frame.lineno}")
+        lines.append("")
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+        if peak is not None:
+            lines.append(f"Traced memory: {_format_bytes(current)} current, {_format_bytes(peak)} peak")
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+
+@contextmanager
+def profiled(operation: str, directory: str = PROFILE_DIR, top: int = 25):
+    """
+    Run the enclosed block under cProfile and tracemalloc.
+    
+    Writes <directory>/<operation>-<timestamp>.prof (open with pstats or
+    snakeviz), .snapshot (tracemalloc.Snapshot.load) and .txt (the top-N
+    report) - small enough to attach to a bug report. Only this process is
+    profiled, so work done in worker processes does not show up.
+    """
+    import cProfile
+    import tracemalloc
+
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{operation}-{time.strftime('%Y%m%d-%H%M%S')}")
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield stem
+    finally:
+        profiler.disable()
+        wall = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        profiler.dump_stats(f"{stem}.prof")
+        snapshot.dump(f"{stem}.snapshot")
+        write_profile_report(profiler, snapshot, f"{stem}.txt", top, wall)
+        if started_tracing:
+            tracemalloc.stop()
+        print(f"\n🔬 Profile written to {stem}.prof, {stem}.snapshot and {stem}.txt")
+
+def profile_from_args(args, operation: str):
+    """profiled() for the operation if --profile was given, else a no-op context."""
+    directory = getattr(args, 'profile', None)
+    if not directory:
+        return nullcontext()
+    return profiled(operation, directory, getattr(args, 'profile_top', 25))
+
+def add_metrics_arguments(parser) -> None:
+    """Add --metrics, --metrics-json, --trace and --profile to an argparse parser."""
+    group = parser.add_argument_group('metrics')
+    group.add_argument('--metrics', action='store_true',
+                       help='Print wall/CPU time, bytes and peak memory per stage at the end')
+    group.add_argument('--metrics-json', metavar='FILE', help='Also save the stage metrics as JSON')
+    group.add_argument('--trace', metavar='FILE', help='Also save a Chrome trace (chrome://tracing, Perfetto)')
+    group.add_argument('--profile', nargs='?', const=PROFILE_DIR, metavar='DIR',
+                       help=f'Profile the run with cProfile and tracemalloc; reports go to DIR (default: {PROFILE_DIR}). '
+                            'Image conversion runs in-process so it is included')
+    group.add_argument('--profile-top', type=int, default=25, metavar='N',
+                       help='Functions and allocation sites listed in the profile report (default: %(default)s)')
+
+def start_from_args(args) -> bool:
+    """Enable recording if any metrics flag was given; returns whether it was."""
+    wanted = bool(getattr(args, 'metrics', False) or getattr(args, 'metrics_json', None) or getattr(args, 'trace', None))
+    if wanted:
+        enable(memory=True)
+    return wanted
+
+def finish_from_args(args) -> None:
+    """Print and save what the metrics flags asked for."""
+    if not _state['enabled']:
+        return
+    print_summary()
+    if getattr(args, 'metrics_json', None):
+        write_json(args.metrics_json)
+    if getattr(args, 'trace', None):
+        write_chrome_trace(args.trace)
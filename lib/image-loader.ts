@@ -1,4 +1,17 @@
 import { seoConfigs } from '@/lib/seo-config'
+import imageVariants from '@/data/image-variants.json'
+
+type ImageVariants = Record<string, { width: number; height: number; variants: { width: number; height: number; src: string }[] }>;
+
+// Pre-built width variants written by extract_images.py (ascending by width)
+function findPrebuiltVariant(src: string, width: number): string | undefined {
+    const entry = (imageVariants as ImageVariants)[src];
+    if (!entry) {
+      return undefined;
+    }
+    const variant = entry.variants.find((candidate) => candidate.width >= width);
+    return variant ? variant.src : src;
+}
 
 export default function myImageLoader({
     src,
@@ -11,6 +24,12 @@ export default function myImageLoader({
   }) {
     const isLocal = !/^https?:\/\//i.test(src);
     const query = new URLSearchParams();
+
+    // Serve a pre-built variant as-is instead of resizing at request time
+    const prebuilt = isLocal ? findPrebuiltVariant(src, width || 3840) : undefined;
+    if (prebuilt) {
+      return process.env.NODE_ENV === 'development' ? `${prebuilt}?width=${width || 3840}` : prebuilt;
+    }
   
     const imageOptimizationApi = 'https://cdn.dblseo.com';
     // Your NextJS application URL
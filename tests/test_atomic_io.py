@@ -0,0 +1,131 @@
+import os
+
+import pytest
+
+import atomic_io
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def leftovers(directory):
+    return [name for name in os.listdir(directory) if name.endswith('.tmp')]
+
+
+def test_write_bytes_outside_transaction_replaces_file(tmp_path):
+    target = tmp_path / 'out.txt'
+    target.write_bytes(b'old')
+    atomic_io.write_bytes(target, b'new')
+    assert read(target) == b'new'
+    assert leftovers(tmp_path) == []
+
+
+def test_transaction_commits_writes_renames_and_deletes(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    (tmp_path / 'a.txt').write_bytes(b'a')
+    (tmp_path / 'gone.txt').write_bytes(b'x')
+    with atomic_io.transaction(str(journal)):
+        atomic_io.write_text(tmp_path / 'new.txt', 'staged')
+        # Staged writes are invisible on disk but readable through resolve()
+        assert not (tmp_path / 'new.txt').exists()
+        assert read(atomic_io.resolve(tmp_path / 'new.txt')) == b'staged'
+        atomic_io.rename(tmp_path / 'a.txt', tmp_path / 'b.txt')
+        atomic_io.remove(tmp_path / 'gone.txt')
+        assert not atomic_io.exists(tmp_path / 'gone.txt')
+    assert read(tmp_path / 'new.txt') == b'staged'
+    assert read(tmp_path / 'b.txt') == b'a'
+    assert not (tmp_path / 'gone.txt').exists()
+    assert not journal.exists()
+    assert leftovers(tmp_path) == []
+
+
+def test_transaction_rolls_back_on_interrupt(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    (tmp_path / 'a.txt').write_bytes(b'a')
+    (tmp_path / 'kept.txt').write_bytes(b'old')
+    with pytest.raises(KeyboardInterrupt):
+        with atomic_io.transaction(str(journal)):
+            atomic_io.write_text(tmp_path / 'kept.txt', 'new')
+            atomic_io.rename(tmp_path / 'a.txt', tmp_path / 'b.txt')
+            atomic_io.remove(tmp_path / 'kept.txt')
+            raise KeyboardInterrupt
+    assert read(tmp_path / 'kept.txt') == b'old'
+    assert read(tmp_path / 'a.txt') == b'a'
+    assert not (tmp_path / 'b.txt').exists()
+    assert not journal.exists()
+    assert leftovers(tmp_path) == []
+
+
+def test_recover_rolls_back_uncommitted_transaction(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    (tmp_path / 'a.txt').write_bytes(b'a')
+    (tmp_path / 'kept.txt').write_bytes(b'old')
+    txn = atomic_io.Transaction(str(journal))
+    txn.write_bytes(tmp_path / 'kept.txt', b'new')
+    txn.rename(tmp_path / 'a.txt', tmp_path / 'b.txt')
+    txn._journal.close()  # the process dies here
+
+    assert atomic_io.recover(str(journal)) == 'rolled back'
+    assert read(tmp_path / 'kept.txt') == b'old'
+    assert read(tmp_path / 'a.txt') == b'a'
+    assert not journal.exists()
+    assert leftovers(tmp_path) == []
+
+
+def test_recover_rolls_forward_committed_transaction(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    (tmp_path / 'kept.txt').write_bytes(b'old')
+    (tmp_path / 'gone.txt').write_bytes(b'x')
+    txn = atomic_io.Transaction(str(journal))
+    txn.write_bytes(tmp_path / 'kept.txt', b'new')
+    txn.remove(tmp_path / 'gone.txt')
+    txn._log('commit')
+    txn._journal.close()  # the process dies before renaming anything into place
+
+    assert atomic_io.recover(str(journal)) == 'committed'
+    assert read(tmp_path / 'kept.txt') == b'new'
+    assert not (tmp_path / 'gone.txt').exists()
+    assert leftovers(tmp_path) == []
+
+
+def test_transaction_creates_missing_journal_directory(tmp_path):
+    journal = tmp_path / 'fresh' / 'root' / 'journal.jsonl'
+    with atomic_io.transaction(str(journal)):
+        atomic_io.write_text(tmp_path / 'fresh' / 'root' / 'out.txt', 'x')
+    assert read(tmp_path / 'fresh' / 'root' / 'out.txt') == b'x'
+
+
+def test_reserved_temps_are_removed_on_rollback_and_recovery(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    placed, orphan = atomic_io.temp_path(tmp_path / 'a.webp'), atomic_io.temp_path(tmp_path / 'b.webp')
+    with pytest.raises(RuntimeError):
+        with atomic_io.transaction(str(journal)):
+            atomic_io.reserve([placed, orphan])
+            open(placed, 'wb').close()
+            open(orphan, 'wb').close()
+            atomic_io.place(placed, tmp_path / 'a.webp')
+            raise RuntimeError
+    assert leftovers(tmp_path) == []
+    assert not (tmp_path / 'a.webp').exists()
+
+    # Same again, but the process dies instead of raising
+    txn = atomic_io.Transaction(str(journal))
+    txn.reserve([orphan])
+    open(orphan, 'wb').close()
+    txn._journal.close()
+    assert atomic_io.recover(str(journal)) == 'rolled back'
+    assert leftovers(tmp_path) == []
+
+
+def test_reserved_temps_outside_transaction_are_discarded(tmp_path):
+    placed, orphan = atomic_io.temp_path(tmp_path / 'a.webp'), atomic_io.temp_path(tmp_path / 'b.webp')
+    atomic_io.reserve([placed, orphan])
+    for temp in (placed, orphan):
+        with open(temp, 'wb') as f:
+            f.write(b'x')
+    atomic_io.place(placed, tmp_path / 'a.webp')
+    atomic_io.discard_reserved()
+    assert read(tmp_path / 'a.webp') == b'x'
+    assert leftovers(tmp_path) == []
@@ -0,0 +1,22 @@
+import benchmark
+import generate_rules
+
+
+def test_tiny_run_times_every_stage_and_compares():
+    params = dict(benchmark.PRESETS['small'], services=2, locations=2, topics=2, templates=2, placeholders=5,
+                  images=2, image_size=32, sources=3, refs=1)
+    results = benchmark.run_benchmarks(params, repeat=1, images=False)
+
+    assert results['params'] == params
+    assert results['stages'] and all(stage['runs_ms'] for stage in results['stages'].values())
+
+    slower = {'params': params, 'stages': {name: dict(stage, median_ms=stage['median_ms'] * 2 + 1)
+                                           for name, stage in results['stages'].items()}}
+    assert benchmark.compare_results(results, slower) == len(results['stages'])
+    assert benchmark.compare_results(results, results) == 0
+
+
+def test_previous_escaping_matches_the_single_pass_one():
+    with open(benchmark.ESCAPE_TEMPLATE, encoding='utf-8') as f:
+        text = f.read()
+    assert benchmark._escape_with_markers(text) == generate_rules.escape_apostrophes(text)
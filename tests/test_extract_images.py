@@ -0,0 +1,401 @@
+import argparse
+import json
+import os
+import re
+
+import pytest
+
+import extract_images
+
+PIL = pytest.importorskip('PIL.Image')
+
+REFERENCE = re.compile(r'"(/assets/images/[^"]+)"')
+
+
+def make_image(path, color, size=(64, 48)):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    PIL.new('RGB', size, color).save(path)
+
+
+def referenced_paths(source_file):
+    return REFERENCE.findall(source_file.read_text(encoding='utf-8'))
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    """An empty site tree; the pipeline's state files land in it too."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'app').mkdir()
+    return tmp_path
+
+
+def run_images(**overrides):
+    settings = dict(image_directories=['public/assets/images'], delete_original=True, variant_file=None, workers=1)
+    settings.update(overrides)
+    return extract_images.process_images(**settings)
+
+
+def assert_references_resolve(site, source_file):
+    for url in referenced_paths(source_file):
+        assert (site / 'public' / url.lstrip('/')).exists(), url
+
+
+def test_duplicate_with_shared_basename_is_linked_not_merged(site):
+    images = site / 'public' / 'assets' / 'images'
+    make_image(images / 'portfolio' / 'aaa.png', 'red')
+    make_image(images / 'portfolio' / 'photo.png', 'red')
+    make_image(images / 'services' / 'photo.png', 'blue')
+    page = site / 'app' / 'page.tsx'
+    page.write_text(
+        'a = "/assets/images/portfolio/aaa.png"\n'
+        'b = "/assets/images/portfolio/photo.png"\n'
+        'c = "/assets/images/services/photo.png"\n',
+        encoding='utf-8'
+    )
+
+    run_images()
+
+    assert referenced_paths(page) == [
+        '/assets/images/portfolio/aaa.webp',
+        '/assets/images/portfolio/photo.webp',
+        '/assets/images/services/photo.webp',
+    ]
+    assert_references_resolve(site, page)
+    assert os.path.samefile(images / 'portfolio' / 'aaa.webp', images / 'portfolio' / 'photo.webp')
+    assert not list(images.rglob('*.png'))
+
+
+def test_duplicate_with_unique_basename_is_merged(site):
+    images = site / 'public' / 'assets' / 'images'
+    make_image(images / 'portfolio' / 'aaa.png', 'red')
+    make_image(images / 'portfolio' / 'b copy.png', 'red')
+    page = site / 'app' / 'page.tsx'
+    page.write_text(
+        'a = "/assets/images/portfolio/aaa.png"\n'
+        'b = "/assets/images/portfolio/b copy.png"\n',
+        encoding='utf-8'
+    )
+
+    run_images()
+
+    assert referenced_paths(page) == ['/assets/images/portfolio/aaa.webp'] * 2
+    assert sorted(p.name for p in (images / 'portfolio').iterdir()) == ['aaa.webp']
+
+
+def test_streaming_resume_composes_recovered_renames(site):
+    images = site / 'public' / 'assets' / 'images' / 'portfolio'
+    # An interrupted run renamed the file but never rewrote its references
+    make_image(images / 'job-1-final.jpg', 'green')
+    page = site / 'app' / 'page.tsx'
+    page.write_text('a = "/assets/images/portfolio/Job_1 (final).jpg"\n', encoding='utf-8')
+    (site / '.image-journal.jsonl').write_text(
+        '{"op": "rename", "old": "Job_1 (final).jpg", "new": "job-1-final.jpg", '
+        '"path": "public/assets/images/portfolio/job-1-final.jpg"}\n',
+        encoding='utf-8'
+    )
+
+    run_images(streaming=True)
+
+    assert referenced_paths(page) == ['/assets/images/portfolio/job-1-final.webp']
+    assert_references_resolve(site, page)
+    assert not (site / '.image-journal.jsonl').exists()
+
+
+def test_streaming_without_reference_updates_keeps_a_pending_journal(site):
+    images = site / 'public' / 'assets' / 'images' / 'portfolio'
+    make_image(images / 'job-1-final.jpg', 'green')
+    journal = site / '.image-journal.jsonl'
+    record = (
+        '{"op": "rename", "old": "Job_1 (final).jpg", "new": "job-1-final.jpg", '
+        '"path": "public/assets/images/portfolio/job-1-final.jpg"}\n'
+    )
+    journal.write_text(record, encoding='utf-8')
+
+    run_images(streaming=True, update_references=False)
+
+    assert journal.read_text(encoding='utf-8') == record
+    assert [p.name for p in images.iterdir()] == ['job-1-final.jpg']
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_interrupted_encodes_leave_no_temp_files(site, monkeypatch, streaming, workers):
+    images = site / 'public' / 'assets' / 'images' / 'portfolio'
+    for i in range(6):
+        make_image(images / f'Big Photo {i}.jpg', (40 * i, 0, 0), size=(400, 300))
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(extract_images, '_finish_conversion', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        run_images(streaming=streaming, workers=workers, variant_widths=[100, 200])
+
+    assert [p.name for p in site.rglob('*.tmp')] == []
+    if not streaming:
+        # The batch run is one transaction: the renames were undone too
+        assert sorted(p.name for p in images.iterdir()) == [f'Big Photo {i}.jpg' for i in range(6)]
+
+
+def test_resizing_and_variants_are_opt_in():
+    parser = argparse.ArgumentParser()
+    extract_images.add_image_arguments(parser)
+
+    defaults = extract_images.image_settings_from_args(parser.parse_args([]))
+    assert defaults['max_dimension'] is None
+    assert defaults['variant_widths'] is None
+
+    chosen = extract_images.image_settings_from_args(parser.parse_args(['--max-dimension', '2560', '--widths', '320', '640']))
+    assert chosen['max_dimension'] == 2560
+    assert chosen['variant_widths'] == [320, 640]
+
+
+def test_plan_counts_hashed_sources_and_duplicate_deletions(site, capsys):
+    images = site / 'public' / 'assets' / 'images' / 'portfolio'
+    make_image(images / 'aaa.png', 'red')
+    make_image(images / 'bbb.png', 'red')
+    make_image(images / 'ccc.png', 'blue', size=(32, 32))
+
+    plan = extract_images.plan_images(['public/assets/images'], delete_original=True, update_references=False)
+    extract_images.print_image_plan(plan, details=False)
+
+    assert [c['original'].name for c in plan['conversions']] == ['aaa.png', 'ccc.png']
+    assert plan['hashed'] == 2
+    printed = capsys.readouterr().out
+    assert 'Hashed:          2 same-size sources' in printed
+    assert 'Deletions:       3 originals' in printed
+    # Planning never touches the tree
+    assert sorted(p.name for p in images.iterdir()) == ['aaa.png', 'bbb.png', 'ccc.png']
+
+
+def test_streaming_warns_that_dedupe_is_off(site, capsys):
+    images = site / 'public' / 'assets' / 'images' / 'portfolio'
+    make_image(images / 'aaa.png', 'red')
+    make_image(images / 'bbb.png', 'red')
+
+    run_images(streaming=True)
+    assert 'Deduplication needs the whole image set' in capsys.readouterr().out
+    # Both copies were encoded on their own
+    assert sorted(p.name for p in images.iterdir()) == ['aaa.webp', 'bbb.webp']
+
+    make_image(images / 'ccc.png', 'red')
+    run_images(streaming=True, dedupe=False)
+    assert 'Deduplication' not in capsys.readouterr().out
+
+
+def test_reference_update_composes_chained_renames(tmp_path):
+    page = tmp_path / 'page.tsx'
+    page.write_text('"/a b.png" "/b.png" "/x.png" "/y.png"', encoding='utf-8')
+    mapping = {'a b.png': 'b.png', 'b.png': 'c.webp', 'x.png': 'y.png', 'y.png': 'x.png'}
+
+    stats = extract_images.update_source_references([page], mapping)
+
+    # Chains end at their last name; a swap is applied once, not looped
+    assert page.read_text(encoding='utf-8') == '"/c.webp" "/c.webp" "/y.png" "/x.png"'
+    assert stats['total_replacements'] == 4
+
+
+def test_reference_index_matches_names_with_spaces_and_brackets(tmp_path):
+    wanted = tmp_path / 'wanted.tsx'
+    wanted.write_text('<img src="/assets/Job_1 (final).jpg" />\n![job](images/Job_1 (final).jpg)\n', encoding='utf-8')
+    other = tmp_path / 'other.tsx'
+    other.write_text('<img src="/assets/logo.jpg" />\nconst x = "a.png" + "b (1).png"\n', encoding='utf-8')
+    minified = tmp_path / 'minified.js'
+    minified.write_text('x=1;' * 200000, encoding='utf-8')
+
+    index = {}
+    extract_images.refresh_reference_index(index, [wanted, other, minified])
+
+    assert extract_images.find_referencing_files(index, {'Job_1 (final).jpg': 'job-1-final.jpg'}) == [wanted]
+    assert extract_images.find_referencing_files(index, {'b (1).png': 'b-1.png'}) == [other]
+    assert index[extract_images._cache_key(minified)]['refs'] == {}
+
+
+def test_conversion_cache_skips_unchanged_images_and_notices_changes(site):
+    images = site / 'public' / 'assets' / 'images' / 'portfolio'
+    make_image(images / 'aaa.png', 'red')
+    run_images(delete_original=False)
+    output = images / 'aaa.webp'
+    first = output.stat().st_mtime_ns
+
+    def planned(**params):
+        cache = extract_images.load_conversion_cache('.image-cache.json')
+        plan = extract_images.plan_images(['public/assets/images'], params=extract_images._encode_params(**params), cache=cache, update_references=False)
+        return [c['source'].name for c in plan['conversions']]
+
+    assert planned(quality=85) == []
+    # Different encode parameters invalidate the entry
+    assert planned(quality=60) == ['aaa.png']
+
+    run_images(delete_original=False)
+    assert output.stat().st_mtime_ns == first
+
+    # So does new content under the same name
+    make_image(images / 'aaa.png', 'blue')
+    assert planned(quality=85) == ['aaa.png']
+    run_images(delete_original=False)
+    with PIL.open(output) as img:
+        assert img.convert('RGB').getpixel((0, 0))[2] > 200
+
+    # And a missing output
+    output.unlink()
+    assert planned(quality=85) == ['aaa.png']
+
+
+def test_image_scan_walks_overlapping_roots_once(site):
+    images = site / 'public' / 'assets' / 'images'
+    make_image(images / 'a.png', 'red')
+    make_image(images / 'portfolio' / 'b.JPG', 'red')
+    make_image(images / 'portfolio' / 'deep' / 'c.gif', 'red')
+    (images / 'portfolio' / 'notes.txt').write_text('x', encoding='utf-8')
+
+    found = extract_images.find_image_files([str(images), str(images / 'portfolio'), 'missing'])
+
+    assert [p.relative_to(images).as_posix() for p in found] == ['a.png', 'portfolio/b.JPG', 'portfolio/deep/c.gif']
+
+
+def test_parallel_conversion_matches_serial(tmp_path, monkeypatch):
+    def convert(site, workers):
+        images = site / 'public' / 'assets' / 'images' / 'portfolio'
+        for i in range(5):
+            make_image(images / f'Photo {i}.png', (50 * i, 100, 0))
+        make_image(images / 'Photo copy.png', (0, 100, 0))
+        page = site / 'app' / 'page.tsx'
+        page.parent.mkdir(parents=True)
+        page.write_text(''.join(f'p{i} = "/assets/images/portfolio/Photo {i}.png"\n' for i in range(5)), encoding='utf-8')
+        monkeypatch.chdir(site)
+        stats = run_images(workers=workers)
+        outputs = {p.relative_to(site).as_posix(): p.read_bytes() for p in sorted((site / 'public').rglob('*')) if p.is_file()}
+        return referenced_paths(page), stats, outputs
+
+    serial = convert(tmp_path / 'serial', workers=1)
+    parallel = convert(tmp_path / 'parallel', workers=2)
+
+    assert parallel == serial
+    references, stats, outputs = parallel
+    assert references == [f'/assets/images/portfolio/photo-{i}.webp' for i in range(5)]
+    assert stats['converted'] == 5 and stats['deduplicated'] == 1 and stats['failed'] == 0
+    assert sorted(outputs) == [f'public/assets/images/portfolio/photo-{i}.webp' for i in range(5)]
+
+
+def test_width_variants_are_written_and_listed_in_the_manifest(site):
+    images = site / 'public' / 'assets' / 'images' / 'portfolio'
+    make_image(images / 'wide.png', 'red', size=(64, 32))
+
+    run_images(variant_widths=[16, 32, 128], variant_file='data/image-variants.json')
+
+    manifest = json.loads((site / 'data' / 'image-variants.json').read_text(encoding='utf-8'))
+    # Never upscaled: 128 is wider than the source
+    assert manifest == {'/assets/images/portfolio/wide.webp': {
+        'width': 64,
+        'height': 32,
+        'variants': [
+            {'width': 16, 'height': 8, 'src': '/assets/images/portfolio/wide-16w.webp'},
+            {'width': 32, 'height': 16, 'src': '/assets/images/portfolio/wide-32w.webp'},
+        ],
+    }}
+    for entry in manifest['/assets/images/portfolio/wide.webp']['variants']:
+        with PIL.open(site / 'public' / entry['src'].lstrip('/')) as img:
+            assert img.size == (entry['width'], entry['height'])
+
+
+def test_format_selection_keeps_the_smallest_acceptable_output(tmp_path):
+    source = tmp_path / 'gradient.png'
+    img = PIL.new('RGB', (96, 64))
+    img.putdata([(x * 2, y * 3, (x + y) % 256) for y in range(64) for x in range(96)])
+    img.save(source)
+    formats = ['webp', 'avif', 'webp-lossless']
+
+    params = extract_images._encode_params(85, formats=formats, min_psnr=30.0)
+    result = extract_images._encode_image(source, tmp_path / 'gradient.webp', params)
+    with PIL.open(source) as decoded:
+        decoded.load()
+        candidates = [extract_images._encode_candidate(decoded, name, params) for name in formats]
+    passing = [(len(data), name) for name, data, score, _ in candidates if score >= 30.0]
+    assert result['format'] == min(passing)[1]
+    assert result['output_size'] == min(passing)[0]
+    assert result['path'].suffix == extract_images.ENCODERS[result['format']][0]
+
+    # Nothing lossy reaches an impossible threshold: lossless wins
+    strict = extract_images._encode_params(85, formats=formats, min_psnr=200.0)
+    result = extract_images._encode_image(source, tmp_path / 'strict.webp', strict)
+    assert (result['format'], result['quality']) == ('webp-lossless', None)
+
+
+def test_quality_search_meets_the_ssim_target_with_the_lowest_quality(site):
+    images = site / 'public' / 'assets' / 'images' / 'portfolio'
+    source = images / 'gradient.png'
+    source.parent.mkdir(parents=True)
+    img = PIL.new('RGB', (96, 64))
+    img.putdata([(x * 2, y * 3, (x * y) % 256) for y in range(64) for x in range(96)])
+    img.save(source)
+
+    loose = extract_images._encode_image(source, site / 'loose.webp', extract_images._encode_params(85, target_ssim=0.8))
+    tight = extract_images._encode_image(source, site / 'tight.webp', extract_images._encode_params(85, target_ssim=0.99))
+    assert 30 <= loose['quality'] <= tight['quality'] <= 85
+    assert loose['output_size'] <= tight['output_size']
+
+    # The chosen quality is kept in the conversion manifest
+    run_images(delete_original=False, target_ssim=0.8)
+    cache = extract_images.load_conversion_cache('.image-cache.json')
+    assert cache['public/assets/images/portfolio/gradient.png']['quality'] == loose['quality']
+
+
+@pytest.mark.parametrize('name', ['photo.jpg', 'graphic.png'])
+def test_oversized_sources_are_decoded_at_reduced_scale(tmp_path, name):
+    source = tmp_path / name
+    make_image(source, 'red', size=(800, 600))
+
+    assert extract_images._open_scaled(source, 100).size == (100, 75)
+    assert extract_images._open_scaled(source, 1000).size == (800, 600)
+    assert extract_images._open_scaled(source).size == (800, 600)
+
+    result = extract_images._encode_image(source, tmp_path / 'out.webp', extract_images._encode_params(85, max_dimension=200))
+    assert (result['width'], result['height']) == (200, 150)
+
+
+def test_streaming_run_renames_converts_and_rewrites_in_batches(site):
+    images = site / 'public' / 'assets' / 'images' / 'portfolio'
+    for i in range(4):
+        make_image(images / f'Job {i}.png', (60 * i, 0, 0))
+    page = site / 'app' / 'page.tsx'
+    page.write_text(''.join(f'j{i} = "/assets/images/portfolio/Job%20{i}.png"\n' for i in range(4)), encoding='utf-8')
+
+    run_images(streaming=True, batch_size=1, workers=2, dedupe=False)
+
+    assert referenced_paths(page) == [f'/assets/images/portfolio/job-{i}.webp' for i in range(4)]
+    assert_references_resolve(site, page)
+    assert not (site / '.image-journal.jsonl').exists()
+    assert (site / '.image-refs.json').exists()
+
+
+def test_dry_run_prints_the_plan_and_changes_nothing(site, capsys):
+    images = site / 'public' / 'assets' / 'images' / 'portfolio'
+    make_image(images / 'My Photo.png', 'red')
+    page = site / 'app' / 'page.tsx'
+    page.write_text('a = "/assets/images/portfolio/My Photo.png"\n', encoding='utf-8')
+    before = sorted(str(p.relative_to(site)) for p in site.rglob('*'))
+
+    run_images(dry_run=True)
+
+    out = capsys.readouterr().out
+    assert 'rename   ' in out and 'my-photo.png' in out
+    assert 'Deletions:       1 originals' in out
+    assert sorted(str(p.relative_to(site)) for p in site.rglob('*')) == before
+    assert referenced_paths(page) == ['/assets/images/portfolio/My Photo.png']
+
+
+def test_copies_of_a_failed_image_are_reported_as_failed(site, capsys):
+    images = site / 'public' / 'assets' / 'images' / 'portfolio'
+    (images / 'sub').mkdir(parents=True)
+    for path in (images / 'bad.jpg', images / 'sub' / 'bad-copy.jpg'):
+        path.write_bytes(b'not really a jpeg')
+
+    run_images()
+    out = capsys.readouterr().out
+    assert 'Images failed:           2' in out
+    assert 'Failed to process duplicate bad-copy.jpg' in out
+
+    _mapping, stats = extract_images.rename_and_convert_images(sorted(images.rglob('*.jpg')))
+    assert stats['failed'] == 2
+    assert (images / 'bad.jpg').exists() and (images / 'sub' / 'bad-copy.jpg').exists()
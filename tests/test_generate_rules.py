@@ -0,0 +1,241 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import generate_rules
+
+
+def test_batch_renders_into_fresh_output_directory(tmp_path):
+    source = tmp_path / 'tenants'
+    source.mkdir()
+    shutil.copy(generate_rules.business_file, source / 'acme.yaml')
+    output = tmp_path / 'out'
+
+    failed = generate_rules.generate_tenants(str(source), str(output), workers=1)
+
+    assert failed == 0
+    root = output / 'acme'
+    assert (root / 'lib' / 'seo-config.ts').exists()
+    assert (root / 'data' / 'faq.json').exists()
+    assert (root / '.generate-state.json').exists()
+    assert not (root / '.generate-journal.jsonl').exists()
+
+
+def test_placeholder_dependencies_are_tracked_without_copying():
+    table = generate_rules.new_placeholder_table({
+        'BUSINESS_NAME': 'Acme',
+        'LOCATIONS': [{'CITY': 'Tirana', 'STATE': 'AL'}],
+    })
+    assert table['missing'].source is table['business'].placeholders
+
+    tokens = ['', 'BUSINESS_NAME', ' serves ', 'AREA_SERVED', '']
+    assert generate_rules.render_template(tokens, table) == 'Acme serves Tirana, AL'
+    assert table['dependencies']['BUSINESS_NAME'] == {'BUSINESS_NAME'}
+    # A derived placeholder depends on the keys it was derived from
+    assert {'AREA_SERVED', 'LOCATIONS'} <= table['dependencies']['AREA_SERVED']
+
+
+def test_failed_outputs_are_reported_as_a_status(tmp_path, monkeypatch):
+    business = tmp_path / 'acme.yaml'
+    shutil.copy(generate_rules.business_file, business)
+
+    def broken(business_data, output_root):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(generate_rules, 'generate_faqs', broken)
+    with pytest.raises(generate_rules.GenerationError) as failure:
+        generate_rules.generate_rules_and_data(summary=False, business_path=str(business), output_root=str(tmp_path / 'out'), strict=True)
+    assert failure.value.errors == ['Error generating faq.json: boom']
+    # The other outputs were still committed
+    assert (tmp_path / 'out' / 'lib' / 'seo-config.ts').exists()
+
+    name, errors, _ = generate_rules._generate_tenant('acme', str(business), str(tmp_path / 'out'), False)
+    assert (name, errors) == ('acme', ['Error generating faq.json: boom'])
+
+    monkeypatch.undo()
+    name, errors, _ = generate_rules._generate_tenant('acme', str(business), str(tmp_path / 'out'), False)
+    assert errors == []
+
+
+def test_incremental_build_regenerates_only_outputs_whose_inputs_changed(tmp_path, capsys):
+    business = tmp_path / 'acme.yaml'
+    shutil.copy(generate_rules.business_file, business)
+    output = tmp_path / 'out'
+
+    def build(**kwargs):
+        generate_rules.generate_rules_and_data(summary=False, business_path=str(business), output_root=str(output), **kwargs)
+        lines = capsys.readouterr().out.splitlines()
+        return sorted(line.split(': ', 1)[1] for line in lines if line.startswith('⏭️  Up to date: '))
+
+    build()
+    everything = build()
+    assert 'lib/business-config.ts' in everything and 'data/faq.json' in everything
+
+    # TONE only feeds the business config
+    business.write_text(business.read_text(encoding='utf-8').replace('TONE: "Professional"', 'TONE: "Friendly"'), encoding='utf-8')
+    assert build() == [name for name in everything if name != 'lib/business-config.ts']
+    assert build() == everything
+
+    # A hand-edited output is rebuilt even though its inputs did not change
+    faq = output / 'data' / 'faq.json'
+    faq.write_text('[]', encoding='utf-8')
+    assert build() == [name for name in everything if name != 'data/faq.json']
+    assert faq.read_text(encoding='utf-8') != '[]'
+
+    assert build(force=True) == []
+
+
+def test_compiled_templates_are_reused_until_the_file_changes(tmp_path):
+    template = tmp_path / 'page.mdc.template'
+    template.write_text('Hi {{BUSINESS_NAME}}!', encoding='utf-8')
+
+    tokens = generate_rules.compile_template(str(template))
+    assert tokens == ['Hi ', 'BUSINESS_NAME', '!']
+    assert generate_rules.compile_template(str(template)) is tokens
+
+    template.write_text('{{CTA_TEXT}} - {{BUSINESS_NAME}}', encoding='utf-8')
+    assert generate_rules.compile_template(str(template)) == ['', 'CTA_TEXT', ' - ', 'BUSINESS_NAME', '']
+
+
+def test_watch_regenerates_once_per_burst_of_changes(tmp_path, monkeypatch, capsys):
+    business = tmp_path / 'business.yaml'
+    business.write_text('BUSINESS_NAME: "Acme"\n', encoding='utf-8')
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    (templates / 'page.mdc.template').write_text('{{BUSINESS_NAME}}', encoding='utf-8')
+    monkeypatch.setattr(generate_rules, 'business_file', str(business))
+    monkeypatch.setattr(generate_rules, 'templates_folder', str(templates))
+
+    builds = []
+
+    def fake_generate(build_state=None, summary=True):
+        builds.append(build_state)
+        return {'run': len(builds)}
+
+    # Each sleep advances the script: idle, save, save again mid-debounce, settle, stop
+    steps = iter([
+        lambda: None,
+        lambda: business.write_text('BUSINESS_NAME: "Acme Electric"\n', encoding='utf-8'),
+        lambda: (templates / 'page.mdc.template').write_text('# {{BUSINESS_NAME}}', encoding='utf-8'),
+        lambda: None,
+    ])
+
+    def fake_sleep(seconds):
+        step = next(steps, None)
+        if step is None:
+            raise KeyboardInterrupt
+        step()
+
+    monkeypatch.setattr(generate_rules, 'generate_rules_and_data', fake_generate)
+    monkeypatch.setattr(generate_rules.time, 'sleep', fake_sleep)
+    generate_rules.watch()
+
+    # The initial build, then one rebuild reusing its in-memory state
+    assert builds == [None, {'run': 1}]
+    assert generate_rules.load_business(str(business)) == {'BUSINESS_NAME': 'Acme Electric'}
+    out = capsys.readouterr().out
+    assert out.count('🔁 Changed:') == 1
+    assert 'Stopped watching' in out
+
+
+def test_cli_exit_codes(tmp_path, monkeypatch):
+    source = tmp_path / 'tenants'
+    source.mkdir()
+    shutil.copy(generate_rules.business_file, source / 'acme.yaml')
+
+    assert generate_rules.main(['batch', str(source), '-o', str(tmp_path / 'out'), '-j', '1']) == 0
+    assert (tmp_path / 'out' / 'acme' / 'lib' / 'seo-config.ts').exists()
+    assert generate_rules.main(['batch', str(tmp_path / 'missing')]) == 1
+
+    with pytest.raises(SystemExit) as usage:
+        generate_rules.main(['no-such-command'])
+    assert usage.value.code == 2
+
+    # A dry run of a copy of the site only reports
+    site = tmp_path / 'site'
+    site.mkdir()
+    shutil.copy(generate_rules.business_file, site / 'business.yaml')
+    monkeypatch.setattr(generate_rules, 'business_file', str(site / 'business.yaml'))
+    monkeypatch.setattr(generate_rules, 'script_dir', str(site))
+    assert generate_rules.main(['generate', '--dry-run']) == 0
+    # Only the parsed-YAML cache appears; no outputs, state or journal
+    assert sorted(p.name for p in site.iterdir()) == ['.yaml-cache', 'business.yaml']
+
+
+def test_import_has_no_side_effects():
+    code = (
+        "import sys, generate_rules; "
+        "print(sorted(m for m in ('yaml', 'PIL', 'extract_images') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(generate_rules.__file__),
+                            capture_output=True, text=True, check=True)
+    # Nothing printed, parsed or imported beyond the module itself
+    assert result.stdout == '[]\n'
+    assert result.stderr == ''
+
+
+def test_derived_placeholders_are_computed_once_per_model(tmp_path):
+    model = generate_rules.BusinessModel({'BUSINESS_NAME': 'Acme'})
+    assert model.placeholders is model.placeholders
+    assert model.tracked().placeholders is model.placeholders
+    business = tmp_path / 'business.yaml'
+    shutil.copy(generate_rules.business_file, business)
+    assert generate_rules.load_business_model(str(business)) is generate_rules.load_business_model(str(business))
+
+
+def test_apostrophes_are_escaped_outside_protected_spans():
+    text = "Don't <a title='x'>it's</a> {'k': 'v'} ['a'] ends'"
+    assert generate_rules.escape_apostrophes(text) == "Don&apos;t <a title='x'>it&apos;s</a> {'k': 'v'} ['a'] ends&apos;"
+    assert generate_rules.escape_apostrophes("no quotes") == "no quotes"
+
+
+def test_data_files_keep_their_own_fallbacks(tmp_path):
+    # No LOCATIONS_ARRAY and lowercase contact keys: the FAQ and manifest
+    # never fell back to LOCATIONS or phone/email, unlike the placeholders
+    business = {
+        'BUSINESS_NAME': 'Acme',
+        'LOCATIONS': [{'CITY': 'Tirana', 'STATE': 'AL'}],
+        'CONTACT': {'phone': '555-0100', 'email': 'hi@acme.test'},
+    }
+    generate_rules.generate_faqs(business, str(tmp_path))
+    generate_rules.generate_manifest_json(business, str(tmp_path))
+
+    with open(tmp_path / 'data' / 'faq.json', encoding='utf-8') as f:
+        answers = [faq['answer'] for faq in json.load(f)['faqs']]
+    assert answers[0].startswith('Ne me krenari u shërbejmë , së bashku')
+    assert answers[1].startswith('Ju mund të na kontaktoni në  ose të na dërgoni email në .')
+    with open(tmp_path / 'public' / 'manifest.json', encoding='utf-8') as f:
+        assert 'Example City, ST' in json.load(f)['description']
+
+    placeholders = generate_rules.create_missing_placeholders(business)
+    assert placeholders['CONTACT_MD'] == 'Phone: 555-0100 | Email: hi@acme.test'
+
+
+def test_cli_exits_non_zero_when_outputs_or_images_fail(tmp_path, monkeypatch):
+    pytest.importorskip('PIL')
+    business = tmp_path / 'business.yaml'
+    shutil.copy(generate_rules.business_file, business)
+    monkeypatch.setattr(generate_rules, 'business_file', str(business))
+    monkeypatch.setattr(generate_rules, 'script_dir', str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    generate_faqs = generate_rules.generate_faqs
+
+    def broken(business_data, output_root):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(generate_rules, 'generate_faqs', broken)
+    assert generate_rules.main(['generate']) == 1
+    monkeypatch.setattr(generate_rules, 'generate_faqs', generate_faqs)
+    assert generate_rules.main(['generate']) == 0
+
+    images = tmp_path / 'public' / 'assets' / 'images'
+    images.mkdir(parents=True)
+    (images / 'broken.jpg').write_bytes(b'not really a jpeg')
+    assert generate_rules.main(['images', '--dir', str(images), '-j', '1']) == 1
+    assert generate_rules.main(['all', '--dir', str(images), '-j', '1']) == 1
+    (images / 'broken.jpg').unlink()
+    assert generate_rules.main(['all', '--dir', str(images), '-j', '1']) == 0
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture
+def recording():
+    instrumentation.enable(memory=True)
+    yield
+    instrumentation.disable()
+
+
+def test_stages_are_noops_until_enabled():
+    instrumentation.disable()
+    with instrumentation.stage('ignored'):
+        instrumentation.add_bytes(read=10)
+    assert not any(record['name'] == 'ignored' for record in instrumentation.records())
+
+
+def test_nested_stages_record_time_bytes_and_memory(recording, tmp_path):
+    with instrumentation.stage('outer', 'test'):
+        instrumentation.add_bytes(read=100)
+        with instrumentation.stage('inner', 'test'):
+            instrumentation.add_bytes(written=7)
+            buffer = bytearray(1024 * 1024)
+        del buffer
+
+    inner, outer = instrumentation.records()
+    assert (inner['name'], inner['depth'], outer['name'], outer['depth']) == ('inner', 1, 'outer', 0)
+    # Bytes are charged to every open stage
+    assert (inner['bytes_read'], inner['bytes_written']) == (0, 7)
+    assert (outer['bytes_read'], outer['bytes_written']) == (100, 7)
+    assert inner['peak_bytes'] >= 1024 * 1024 and outer['peak_bytes'] >= inner['peak_bytes']
+
+    # Records from a worker process count toward the stages open here
+    with instrumentation.stage('pool', 'test'):
+        instrumentation.merge([dict(inner, name='worker', depth=0, bytes_read=5)])
+    totals = instrumentation.summarize()
+    assert totals['pool']['bytes_read'] == 5 and totals['worker']['count'] == 1
+
+    trace = tmp_path / 'trace.json'
+    instrumentation.write_chrome_trace(str(trace))
+    events = json.loads(trace.read_text(encoding='utf-8'))['traceEvents']
+    assert [event['name'] for event in events] == ['inner', 'outer', 'worker', 'pool']
+
+
+@instrumentation.hot_path('demo')
+def _busy():
+    return sum(i * i for i in range(20000))
+
+
+def test_profiled_writes_reports_that_tag_hot_paths(tmp_path):
+    with instrumentation.profiled('demo', str(tmp_path), top=5) as stem:
+        _busy()
+
+    for suffix in ('.prof', '.snapshot', '.txt'):
+        assert os.path.exists(stem + suffix)
+    with open(stem + '.txt', encoding='utf-8') as f:
+        report = f.read()
+    assert 'Hot paths' in report
+    assert any('demo' in line and '_busy' in line for line in report.splitlines())
+
+
+def test_profiling_the_image_command_converts_in_process():
+    import extract_images
+
+    parser = argparse.ArgumentParser()
+    extract_images.add_image_arguments(parser)
+    instrumentation.add_metrics_arguments(parser)
+    assert extract_images.image_settings_from_args(parser.parse_args(['-j', '4', '--profile']))['workers'] == 1
+    assert extract_images.image_settings_from_args(parser.parse_args(['-j', '4']))['workers'] == 4
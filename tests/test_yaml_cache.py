@@ -0,0 +1,36 @@
+import pytest
+
+import yaml_cache
+
+
+def test_unchanged_files_come_from_the_cache(tmp_path, monkeypatch):
+    source = tmp_path / 'business.yaml'
+    source.write_text('NAME: Acme\nLIST: [1, 2]\n', encoding='utf-8')
+
+    assert yaml_cache.load_yaml(str(source)) == {'NAME': 'Acme', 'LIST': [1, 2]}
+    pickle_file = tmp_path / '.yaml-cache' / 'business.yaml.pickle'
+    assert pickle_file.exists()
+
+    parse = yaml_cache.parse_yaml
+
+    def unexpected(text):
+        raise AssertionError('parsed an unchanged file')
+
+    monkeypatch.setattr(yaml_cache, 'parse_yaml', unexpected)
+    assert yaml_cache.load_yaml(str(source)) == {'NAME': 'Acme', 'LIST': [1, 2]}
+
+    # New bytes (even with the same size) and a corrupt cache are parsed again
+    monkeypatch.setattr(yaml_cache, 'parse_yaml', parse)
+    source.write_text('NAME: Acmf\nLIST: [1, 2]\n', encoding='utf-8')
+    assert yaml_cache.load_yaml(str(source))['NAME'] == 'Acmf'
+    pickle_file.write_bytes(b'not a pickle')
+    assert yaml_cache.load_yaml(str(source))['NAME'] == 'Acmf'
+    assert yaml_cache.load_yaml(str(source), use_cache=False)['NAME'] == 'Acmf'
+
+
+def test_invalid_yaml_raises(tmp_path):
+    yaml = pytest.importorskip('yaml')
+    source = tmp_path / 'broken.yaml'
+    source.write_text('NAME: [unclosed\n', encoding='utf-8')
+    with pytest.raises(yaml.YAMLError):
+        yaml_cache.load_yaml(str(source))
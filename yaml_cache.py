@@ -0,0 +1,91 @@
+"""
+Cached YAML loading shared by generate_rules.py and other tools:
+1. Parse with libyaml's CSafeLoader when PyYAML was built with it
+   (falls back to the pure-Python SafeLoader)
+2. Keep a pickle of the parsed data next to the file, keyed by the file's
+   SHA-256, so an unchanged file is never parsed again - not in a watch
+   loop, not in the next CI step
+"""
+import os
+import pickle
+import hashlib
+from typing import Any, Optional
+
+from instrumentation import add_bytes
+
+# Bump whenever the layout of the pickle files changes
+YAML_CACHE_VERSION = 1
+
+# Cache directory created next to each YAML file
+YAML_CACHE_DIR = '.yaml-cache'
+
+def safe_loader():
+    """Return the fastest available safe YAML loader class."""
+    import yaml
+    return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+def parse_yaml(text) -> Any:
+    """
+    Parse YAML text (str or bytes) with the fastest safe loader.
+
+    Args:
+        text: YAML document
+
+    Returns:
+        Parsed data
+    """
+    import yaml
+    return yaml.load(text, Loader=safe_loader())
+
+def yaml_cache_path(path: str, cache_dir: Optional[str] = None) -> str:
+    """Return the pickle file used to cache the parsed contents of path."""
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), YAML_CACHE_DIR)
+    return os.path.join(cache_dir, f"{os.path.basename(path)}.pickle")
+
+def load_yaml(path: str, cache_dir: Optional[str] = None, use_cache: bool = True) -> Any:
+    """
+    Load a YAML file, reusing the parsed data if the file's bytes are unchanged.
+
+    The cache is a local build artifact and is trusted like any other
+    file in the working tree; unreadable or stale entries are ignored and
+    rewritten.
+
+    Args:
+        path: YAML file to load
+        cache_dir: Where to keep the pickle (default: .yaml-cache next to path)
+        use_cache: Set to False to always parse
+
+    Returns:
+        Parsed data
+
+    Raises:
+        FileNotFoundError: If path does not exist
+        yaml.YAMLError: If the file is not valid YAML
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    add_bytes(read=len(raw))
+    if not use_cache:
+        return parse_yaml(raw)
+
+    digest = hashlib.sha256(raw).hexdigest()
+    cache_file = yaml_cache_path(path, cache_dir)
+    try:
+        with open(cache_file, 'rb') as f:
+            version, cached_digest, data = pickle.load(f)
+        if version == YAML_CACHE_VERSION and cached_digest == digest:
+            return data
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError):
+        pass
+
+    data = parse_yaml(raw)
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump((YAML_CACHE_VERSION, digest, data), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        # A read-only checkout still loads fine, just without the cache
+        pass
+    return data